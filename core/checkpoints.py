@@ -0,0 +1,66 @@
+import gzip
+import json
+import os
+import re
+import shutil
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import json_default, json_object_hook
+from core.utils import get_state_dir
+
+load_dotenv()
+
+# Папка с результатами этапов незавершённых задач
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR") or os.path.join(get_state_dir(), "checkpoints")
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name)
+
+
+class StageCheckpoint:
+    """
+    Результаты этапов одной задачи на диске: по файлу <stage>.json.gz на этап.
+
+    Сжатый JSON без лишних пробелов занимает в разы меньше места, чем исходные списки словарей
+    (сегменты диаризации, слова ASR, фразы, VTT, итоговое резюме). Файл пишется атомарно,
+    поэтому после аварийного завершения этап либо сохранён целиком, либо не сохранён вовсе.
+    Папка живёт отдельно от временной папки задачи и удаляется только после успешного завершения.
+    """
+
+    def __init__(self, job_id: str, root: str = None, on_save=None):
+        self.path = os.path.join(root or CHECKPOINT_DIR, _safe_name(job_id))
+        self.on_save = on_save
+        os.makedirs(self.path, exist_ok=True)
+        stages = self.stages()
+        if stages:
+            logger.info(f"[Checkpoint] {job_id}: найдены результаты этапов {stages}")
+
+    def _file(self, stage: str) -> str:
+        return os.path.join(self.path, f"{_safe_name(stage)}.json.gz")
+
+    def stages(self) -> list:
+        return sorted(name[:-len(".json.gz")] for name in os.listdir(self.path) if name.endswith(".json.gz"))
+
+    def load(self, stage: str):
+        path = self._file(stage)
+        if not os.path.exists(path):
+            return False, None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                return True, json.load(f, object_hook=json_object_hook)
+        except Exception as e:
+            logger.warning(f"[Checkpoint] Повреждён результат этапа {stage}, этап будет выполнен заново: {e}")
+            return False, None
+
+    def save(self, stage: str, result):
+        path = self._file(stage)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(result, f, ensure_ascii=False, separators=(",", ":"), default=json_default)
+        os.replace(tmp_path, path)
+        if self.on_save is not None:
+            self.on_save(stage)
+
+    def clear(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from core.utils import get_state_dir
+
+STATUS_PENDING = "pending"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class JobStore:
+    """
+    Долговременное хранилище задач обработки (SQLite).
+
+    Для каждого файла хранит: метаданные Drive, record_id в Airtable, статус,
+    последний завершённый этап, ошибку и число попыток. Результаты этапов лежат
+    рядом на диске (core.checkpoints). После перезапуска воркер возобновляет
+    незавершённые задачи с места остановки.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(get_state_dir(), "jobs.sqlite3")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    file_id TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    file_json TEXT NOT NULL,
+                    record_id TEXT,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    error TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                """
+            )
+
+    def _execute(self, sql: str, params=()):
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def _row(row) -> dict:
+        job = dict(row)
+        job["file"] = json.loads(job.pop("file_json"))
+        return job
+
+    def get(self, file_id: str):
+        rows = self._execute("SELECT * FROM jobs WHERE file_id = ?", (file_id,))
+        return self._row(rows[0]) if rows else None
+
+    def create(self, file: dict) -> bool:
+        """Регистрирует новый файл. Возвращает False, если он уже известен."""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (file_id, name, file_json, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (file["id"], file["name"], json.dumps(file), STATUS_PENDING, now, now)
+            )
+            return cursor.rowcount == 1
+
+    def update(self, file_id: str, **fields):
+        if not fields:
+            return
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns} WHERE file_id = ?", (*fields.values(), file_id))
+
+    def start_attempt(self, file_id: str):
+        self._execute(
+            "UPDATE jobs SET attempts = attempts + 1, status = ?, error = NULL, updated_at = ? WHERE file_id = ?",
+            (STATUS_PENDING, time.time(), file_id)
+        )
+
+    def unfinished(self, max_attempts: int) -> list:
+        """Прерванные задачи и упавшие задачи, у которых ещё остались попытки."""
+        rows = self._execute(
+            "SELECT * FROM jobs WHERE status = ? OR (status = ? AND attempts < ?) ORDER BY created_at",
+            (STATUS_PENDING, STATUS_FAILED, max_attempts)
+        )
+        return [self._row(row) for row in rows]
+
+    def mark_stage(self, file_id: str, stage: str):
+        """Отмечает этап как последний завершённый."""
+        self.update(file_id, stage=stage)
+
+    def finish(self, file_id: str):
+        """Задача завершена; запись остаётся для дедупликации."""
+        self.update(file_id, status=STATUS_DONE, error=None)
+
+    def fail(self, file_id: str, error: str):
+        self.update(file_id, status=STATUS_FAILED, error=str(error)[:2000])
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from contextlib import nullcontext
+from core.logger import logger
+
+
+class StageSkipped(Exception):
+    """Этап не выполнялся, потому что упал один из этапов, от которых он зависит."""
+
+
+class PipelineError(Exception):
+    """Один или несколько этапов графа завершились с ошибкой."""
+
+    def __init__(self, failed: dict):
+        self.failed = failed
+        details = "; ".join(f"{name}: {err}" for name, err in failed.items())
+        super().__init__(f"Ошибки этапов: {details}")
+
+
+class PipelineGraph:
+    """
+    Граф этапов обработки одной встречи.
+
+    Каждый этап — асинхронная функция, которая получает результаты своих зависимостей
+    (в порядке deps) и запускается, как только они готовы. Независимые ветки графа
+    выполняются параллельно, ошибка этапа отменяет только зависящие от него этапы.
+
+    stage_context(name, heavy) — необязательная фабрика асинхронного контекстного менеджера,
+    в котором выполняется этап (например, JobScheduler.stage для очередей и статуса).
+
+    checkpoint — необязательный объект с методами load(stage) -> (found, result) и save(stage, result).
+    Результаты сохраняемых этапов (persist=True) записываются после успешного выполнения;
+    при повторном запуске этап с сохранённым результатом не выполняется. Несохраняемые этапы
+    (например, локальные пути к временным файлам) запускаются, только если их результат
+    нужен этапу, который действительно выполняется.
+    """
+
+    def __init__(self, name: str, stage_context=None, checkpoint=None):
+        self.name = name
+        self.stage_context = stage_context
+        self.checkpoint = checkpoint
+        self._stages = {}
+
+    def add(self, name: str, func, deps=(), heavy: bool = False, persist: bool = True):
+        if name in self._stages:
+            raise ValueError(f"Этап '{name}' уже добавлен")
+        for dep in deps:
+            if dep not in self._stages:
+                raise ValueError(f"Этап '{name}' зависит от неизвестного этапа '{dep}'")
+        self._stages[name] = {"func": func, "deps": tuple(deps), "heavy": heavy, "persist": persist}
+        return self
+
+    def _plan(self):
+        """Определяет, какие этапы взять из checkpoint, а какие выполнить."""
+        restored = {}
+        if self.checkpoint is not None:
+            for name, stage in self._stages.items():
+                if stage["persist"]:
+                    found, result = self.checkpoint.load(name)
+                    if found:
+                        restored[name] = result
+
+        dependents = {name: [] for name in self._stages}
+        for name, stage in self._stages.items():
+            for dep in stage["deps"]:
+                dependents[dep].append(name)
+
+        needed = set()
+        # Обратный топологический порядок: зависимые этапы уже решены
+        for name in reversed(list(self._stages)):
+            if name in restored:
+                continue
+            if self._stages[name]["persist"] or any(d in needed for d in dependents[name]):
+                needed.add(name)
+        return restored, needed
+
+    async def _restored(self, result):
+        return result
+
+    async def _run_stage(self, name: str, tasks: dict, failed: dict):
+        stage = self._stages[name]
+        try:
+            args = [await tasks[dep] for dep in stage["deps"]]
+        except Exception:
+            raise StageSkipped(name)
+
+        context = self.stage_context(name, stage["heavy"]) if self.stage_context else nullcontext()
+        async with context:
+            started = time.monotonic()
+            try:
+                result = await stage["func"](*args)
+            except Exception as e:
+                failed[name] = e
+                logger.error(f"[Pipeline] {self.name}: ошибка этапа {name}: {e}")
+                raise
+        if self.checkpoint is not None and stage["persist"]:
+            self.checkpoint.save(name, result)
+        logger.info(f"[Pipeline] {self.name}: этап {name} завершён за {time.monotonic() - started:.1f}s")
+        return result
+
+    async def run(self) -> dict:
+        """
+        Выполняет граф и возвращает {stage: result}.
+        Если хотя бы один этап упал — после завершения остальных веток бросает PipelineError.
+        """
+        tasks = {}
+        failed = {}
+        restored, needed = self._plan()
+        if restored:
+            logger.info(f"[Pipeline] {self.name}: восстановлены этапы {sorted(restored)}")
+        # Этапы добавляются только после своих зависимостей, так что порядок уже топологический
+        for name in self._stages:
+            if name in restored:
+                tasks[name] = asyncio.create_task(self._restored(restored[name]))
+            elif name in needed:
+                tasks[name] = asyncio.create_task(self._run_stage(name, tasks, failed))
+
+        try:
+            outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+        if failed:
+            raise PipelineError(failed)
+
+        return {
+            name: outcome
+            for name, outcome in zip(tasks, outcomes)
+            if not isinstance(outcome, BaseException)
+        }
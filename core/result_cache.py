@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import json_default, json_object_hook
+from core.utils import get_state_dir
+
+load_dotenv()
+
+# Папка кэша результатов диаризации и ASR
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or os.path.join(get_state_dir(), "cache")
+# Максимальный размер кэша, МБ (0 — кэш отключён)
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "2048"))
+
+
+def file_sha256(path: str, block_size: int = 4 * 1024 * 1024) -> str:
+    """SHA-256 содержимого файла (читается блоками, целиком в память не загружается)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(kind: str, content_hash: str, **config) -> str:
+    """Ключ кэша: вид результата + хэш подготовленного аудио + параметры модели/языка."""
+    payload = json.dumps({"kind": kind, "content": content_hash, "config": config}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Кэш дорогих результатов (слова ASR, сегменты диаризации) с адресацией по содержимому.
+
+    Записи хранятся сжатым JSON; при чтении время изменения файла обновляется,
+    а при превышении max_mb удаляются записи, к которым дольше всего не обращались (LRU).
+    """
+
+    def __init__(self, root: str = RESULT_CACHE_DIR, max_mb: int = RESULT_CACHE_MAX_MB):
+        self.root = root
+        self.max_bytes = max_mb * 1024 * 1024
+        self._lock = threading.Lock()
+        if self.enabled:
+            os.makedirs(self.root, exist_ok=True)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.json.gz")
+
+    def get(self, key: str):
+        """Возвращает (found, value)."""
+        if not self.enabled:
+            return False, None
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                value = json.load(f, object_hook=json_object_hook)
+            os.utime(path)
+            return True, value
+        except FileNotFoundError:
+            return False, None
+        except Exception as e:
+            logger.warning(f"[Cache] Повреждённая запись {key}, удаляем: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return False, None
+
+    def put(self, key: str, value):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(value, f, ensure_ascii=False, separators=(",", ":"), default=json_default)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total = 0
+            for dirpath, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    if not filename.endswith(".json.gz"):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                    total -= size
+                    logger.info(f"[Cache] Удалена старая запись: {os.path.basename(path)}")
+                except OSError:
+                    pass
+                if total <= self.max_bytes:
+                    break
+
+
+_cache = None
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        _cache = ResultCache()
+    return _cache
@@ -0,0 +1,185 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager, nullcontext
+from dotenv import load_dotenv
+from core.logger import logger
+
+load_dotenv()
+
+# Сколько встреч одновременно проходят обработку (скачивание, диаризация, ASR...)
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+# Лимиты по этапам в формате "download=2,diarize=1,transcribe=4"
+STAGE_CONCURRENCY = os.getenv("STAGE_CONCURRENCY", "")
+
+
+def parse_stage_limits(spec: str) -> dict:
+    """
+    Разбирает строку вида "download=2,diarize=1" в словарь {stage: limit}.
+    Некорректные элементы пропускаются с предупреждением.
+    """
+    limits = {}
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            stage, value = item.split("=", 1)
+            limits[stage.strip()] = max(1, int(value))
+        except ValueError:
+            logger.warning(f"[Scheduler] Некорректный лимит этапа: '{item}'")
+    return limits
+
+
+class JobScheduler:
+    """
+    Планировщик задач обработки встреч.
+
+    Каждый новый файл получает собственную отслеживаемую asyncio-задачу.
+    Общее число одновременно обрабатываемых встреч ограничено max_concurrency,
+    а отдельные этапы — собственными очередями (семафорами) из stage_limits.
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENT_JOBS, stage_limits: dict = None):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.stage_limits = dict(stage_limits if stage_limits is not None else parse_stage_limits(STAGE_CONCURRENCY))
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._stage_semaphores = {
+            stage: asyncio.Semaphore(limit) for stage, limit in self.stage_limits.items()
+        }
+        self._jobs = {}
+        self._tasks = {}
+
+    def submit(self, job_id: str, name: str, coro_factory, *args, **kwargs):
+        """
+        Запускает обработку файла отдельной задачей.
+        coro_factory(*args, **kwargs) должна вернуть корутину.
+        Повторная постановка уже выполняющегося job_id игнорируется.
+        """
+        if job_id in self._tasks:
+            logger.info(f"[Scheduler] Задача {name} уже выполняется — пропускаем")
+            return self._tasks[job_id]
+
+        self._jobs[job_id] = {
+            "job_id": job_id,
+            "name": name,
+            "submitted_at": time.monotonic(),
+            "stages": {},
+            "slot_users": 0,
+            "slot_lock": asyncio.Lock(),
+        }
+        task = asyncio.create_task(self._run(job_id, coro_factory(*args, **kwargs)))
+        self._tasks[job_id] = task
+        logger.info(f"[Scheduler] Задача {name} поставлена в работу")
+        return task
+
+    async def _run(self, job_id: str, coro):
+        name = self._jobs[job_id]["name"]
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            logger.warning(f"[Scheduler] Задача {name} отменена")
+            raise
+        except Exception as e:
+            logger.error(f"[Scheduler] Задача {name} завершилась с ошибкой: {e}")
+        finally:
+            self._jobs.pop(job_id, None)
+            self._tasks.pop(job_id, None)
+
+    def _set(self, job_id: str, stage: str, state: str):
+        job = self._jobs.get(job_id)
+        if job is None:
+            return
+        job["stages"][stage] = {"state": state, "started_at": time.monotonic()}
+
+    def _clear(self, job_id: str, stage: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["stages"].pop(stage, None)
+
+    @asynccontextmanager
+    async def slot(self, job_id: str):
+        """
+        Занимает один из max_concurrency слотов обработки на время блока.
+        Вложенные и параллельные блоки одной задачи делят один слот:
+        он занимается первым блоком и освобождается последним.
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            async with self._slots:
+                yield
+            return
+
+        async with job["slot_lock"]:
+            if job["slot_users"] == 0:
+                self._set(job_id, "slot", "queued")
+                try:
+                    await self._slots.acquire()
+                finally:
+                    self._clear(job_id, "slot")
+            job["slot_users"] += 1
+        try:
+            yield
+        finally:
+            job["slot_users"] -= 1
+            if job["slot_users"] == 0:
+                self._slots.release()
+
+    @asynccontextmanager
+    async def stage(self, job_id: str, stage: str, heavy: bool = False):
+        """
+        Помечает этап задачи. Если для этапа задан лимит — ждёт своей очереди.
+        heavy=True — этап тратит ресурсы машины и выполняется только в слоте обработки;
+        лёгкие этапы (ожидание VTT, запросы к API) слот не занимают.
+        """
+        semaphore = self._stage_semaphores.get(stage)
+        try:
+            self._set(job_id, stage, "queued")
+            async with (self.slot(job_id) if heavy else nullcontext()):
+                async with (semaphore if semaphore is not None else nullcontext()):
+                    self._set(job_id, stage, "running")
+                    yield
+        finally:
+            self._clear(job_id, stage)
+
+    def is_active(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    def status(self) -> list:
+        """Снимок задач в работе: имя, активные этапы с состоянием и временем на этапе/в целом."""
+        now = time.monotonic()
+        return [
+            {
+                "job_id": job["job_id"],
+                "name": job["name"],
+                "stages": [
+                    {
+                        "stage": stage,
+                        "state": info["state"],
+                        "seconds": round(now - info["started_at"], 1),
+                    }
+                    for stage, info in job["stages"].items()
+                ],
+                "total_seconds": round(now - job["submitted_at"], 1),
+            }
+            for job in self._jobs.values()
+        ]
+
+    def format_status(self) -> str:
+        jobs = self.status()
+        if not jobs:
+            return "[Scheduler] Нет задач в работе"
+        lines = [f"[Scheduler] Задач в работе: {len(jobs)} (лимит {self.max_concurrency})"]
+        for job in jobs:
+            stages = ", ".join(
+                f"{st['stage']} ({st['state']}, {st['seconds']}s)" for st in job["stages"]
+            ) or "—"
+            lines.append(f"  {job['name']} [{job['total_seconds']}s]: {stages}")
+        return "\n".join(lines)
+
+    async def shutdown(self):
+        """Отменяет все задачи и дожидается их завершения."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,133 @@
+import os
+import re
+import shutil
+import tempfile
+from dotenv import load_dotenv
+from core.logger import logger
+
+load_dotenv()
+
+# Корень для временных папок задач (по умолчанию temp/ в корне проекта)
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "temp")
+)
+# Папка на tmpfs/RAM-диске (например /dev/shm) — используется, если в ней хватает места
+SCRATCH_TMPFS = os.getenv("SCRATCH_TMPFS", "")
+# Сколько места в tmpfs оставлять свободным, МБ
+SCRATCH_TMPFS_RESERVE_MB = int(os.getenv("SCRATCH_TMPFS_RESERVE_MB", "512"))
+# Ограничение размера временной папки одной задачи, МБ (0 — без ограничения)
+SCRATCH_QUOTA_MB = int(os.getenv("SCRATCH_QUOTA_MB", "0"))
+
+SCRATCH_PREFIX = "job_"
+
+
+class ScratchQuotaExceeded(Exception):
+    """Временные файлы задачи превысили квоту."""
+
+
+def _safe_name(name: str) -> str:
+    return re.sub(r"[^\w.-]+", "_", name)[:60] or "job"
+
+
+def _pick_root(root: str, expected_bytes: int) -> str:
+    """Выбирает tmpfs, если он задан и в нём хватает места, иначе обычный корень."""
+    if SCRATCH_TMPFS and os.path.isdir(SCRATCH_TMPFS):
+        free = shutil.disk_usage(SCRATCH_TMPFS).free
+        if free - expected_bytes > SCRATCH_TMPFS_RESERVE_MB * 1024 * 1024:
+            return SCRATCH_TMPFS
+        logger.info(f"[Scratch] В {SCRATCH_TMPFS} недостаточно места — используем {root}")
+    return root
+
+
+class JobScratch:
+    """
+    Отдельная временная папка для одной задачи обработки.
+
+    Все промежуточные файлы задачи (видео, аудио, VTT) создаются внутри неё,
+    поэтому параллельные задачи не пересекаются. Папка удаляется целиком при выходе
+    из контекста. quota_mb ограничивает суммарный размер файлов задачи.
+    Крупные медиафайлы, отмеченные add_media, можно удалить раньше — release_media.
+    """
+
+    def __init__(self, job_name: str, root: str = None, quota_mb: int = None, expected_bytes: int = 0):
+        self.quota_bytes = (SCRATCH_QUOTA_MB if quota_mb is None else quota_mb) * 1024 * 1024
+        base = _pick_root(root or SCRATCH_ROOT, expected_bytes)
+        os.makedirs(base, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f"{SCRATCH_PREFIX}{_safe_name(job_name)}_", dir=base)
+        self._media = set()
+        try:
+            self.check_quota(expected_bytes)
+        except ScratchQuotaExceeded:
+            self.cleanup()
+            raise
+
+    def file(self, name: str) -> str:
+        """Путь к файлу внутри папки задачи."""
+        return os.path.join(self.path, os.path.basename(name))
+
+    def add_media(self, *paths):
+        """Отмечает файлы задачи (видео, аудио и их копии), которые удалит release_media."""
+        self._media.update(paths)
+
+    def release_media(self):
+        """Удаляет отмеченные медиафайлы, остальные файлы задачи остаются до cleanup."""
+        freed = 0
+        for path in self._media:
+            try:
+                freed += os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"[Scratch] Не удалось удалить {path}: {e}")
+        self._media.clear()
+        if freed:
+            logger.info(f"[Scratch] Медиафайлы удалены: {self.path}, освобождено {freed // (1024 * 1024)} МБ")
+
+    def usage(self) -> int:
+        total = 0
+        for dirpath, _, filenames in os.walk(self.path):
+            for filename in filenames:
+                try:
+                    total += os.path.getsize(os.path.join(dirpath, filename))
+                except OSError:
+                    pass
+        return total
+
+    def check_quota(self, extra_bytes: int = 0):
+        """Бросает ScratchQuotaExceeded, если текущий размер плюс extra_bytes больше квоты."""
+        if not self.quota_bytes:
+            return
+        used = self.usage() + extra_bytes
+        if used > self.quota_bytes:
+            raise ScratchQuotaExceeded(
+                f"{self.path}: {used // (1024 * 1024)} МБ при квоте {self.quota_bytes // (1024 * 1024)} МБ"
+            )
+
+    def cleanup(self):
+        try:
+            shutil.rmtree(self.path)
+            logger.info(f"[Scratch] Временная папка удалена: {self.path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"[Scratch] Не удалось удалить {self.path}: {e}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.cleanup()
+        return False
+
+
+def cleanup_stale_scratch(root: str = None):
+    """Удаляет временные папки задач, оставшиеся после аварийного завершения воркера."""
+    for base in filter(None, {root or SCRATCH_ROOT, SCRATCH_TMPFS}):
+        if not os.path.isdir(base):
+            continue
+        for name in os.listdir(base):
+            path = os.path.join(base, name)
+            if name.startswith(SCRATCH_PREFIX) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+                logger.info(f"[Scratch] Удалена оставшаяся временная папка: {path}")
@@ -0,0 +1,279 @@
+import sys
+import numpy as np
+
+# Маркер колоночной таблицы в JSON чекпоинтов и кэша
+JSON_MARKER = "__segments__"
+
+
+class SegmentRow:
+    """
+    Представление одной строки SegmentTable в виде «словаря» только для чтения:
+    row['start'], row.get('speaker'), dict(row) работают как с прежними словарями сегментов.
+    """
+
+    __slots__ = ("_table", "_index")
+
+    KEYS = ("start", "end", "speaker", "text", "confidence")
+
+    def __init__(self, table, index: int):
+        self._table = table
+        self._index = index
+
+    @property
+    def start(self) -> float:
+        return float(self._table.starts[self._index])
+
+    @property
+    def end(self) -> float:
+        return float(self._table.ends[self._index])
+
+    @property
+    def speaker(self):
+        return self._table.speaker_at(self._index)
+
+    @property
+    def text(self) -> str:
+        return self._table.text_at(self._index)
+
+    @property
+    def confidence(self):
+        value = float(self._table.confidence[self._index])
+        return None if value != value else value
+
+    def __getitem__(self, key):
+        if key not in self.KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.KEYS:
+            return default
+        value = getattr(self, key)
+        return default if value is None else value
+
+    def keys(self):
+        return self.KEYS
+
+    def to_dict(self) -> dict:
+        return {key: getattr(self, key) for key in self.KEYS}
+
+    def __repr__(self):
+        return f"SegmentRow({self.to_dict()})"
+
+
+class SegmentTable:
+    """
+    Колоночное хранилище слов и сегментов вместо списков словарей.
+
+    starts/ends — float64, confidence — float32 (NaN, если нет), speaker_ids — int32 индексы
+    в списке speakers (-1 — спикер не назначен). Тексты лежат в одной строке text_buffer через пробел,
+    offsets[i]..offsets[i + 1] - 1 — текст строки i; поэтому текст подряд идущих строк, склеенный
+    пробелами (фраза из слов), — это один срез буфера.
+
+    Переименование спикеров меняет только список speakers, массивы при этом общие (без копирования).
+    """
+
+    __slots__ = ("starts", "ends", "confidence", "speaker_ids", "speakers", "text_buffer", "offsets")
+
+    def __init__(self, starts, ends, speaker_ids=None, speakers=None, text_buffer: str = "", offsets=None, confidence=None):
+        self.starts = np.asarray(starts, dtype=np.float64)
+        self.ends = np.asarray(ends, dtype=np.float64)
+        count = len(self.starts)
+        self.speaker_ids = (
+            np.full(count, -1, dtype=np.int32) if speaker_ids is None else np.asarray(speaker_ids, dtype=np.int32)
+        )
+        self.speakers = list(speakers or [])
+        self.confidence = (
+            np.full(count, np.nan, dtype=np.float32) if confidence is None else np.asarray(confidence, dtype=np.float32)
+        )
+        self.text_buffer = text_buffer
+        self.offsets = (
+            np.zeros(count + 1, dtype=np.int64) if offsets is None else np.asarray(offsets, dtype=np.int64)
+        )
+
+    # --- создание ---
+
+    @classmethod
+    def from_columns(cls, starts, ends, texts, speakers=None, confidence=None) -> "SegmentTable":
+        """
+        texts — список строк; speakers — список имён (или None) той же длины, имена интернируются.
+        """
+        texts = [text or "" for text in texts]
+        lengths = np.fromiter((len(text) + 1 for text in texts), dtype=np.int64, count=len(texts))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        speaker_ids = None
+        names = []
+        if speakers is not None:
+            index = {}
+            speaker_ids = np.empty(len(texts), dtype=np.int32)
+            for i, name in enumerate(speakers):
+                if name is None:
+                    speaker_ids[i] = -1
+                    continue
+                speaker_id = index.get(name)
+                if speaker_id is None:
+                    speaker_id = index[name] = len(names)
+                    names.append(sys.intern(str(name)))
+                speaker_ids[i] = speaker_id
+
+        if confidence is not None and not isinstance(confidence, np.ndarray):
+            confidence = np.array([np.nan if c is None else c for c in confidence], dtype=np.float32)
+        return cls(starts, ends, speaker_ids, names, " ".join(texts) + (" " if texts else ""), offsets, confidence)
+
+    @classmethod
+    def from_dicts(cls, items) -> "SegmentTable":
+        items = list(items)
+        return cls.from_columns(
+            [item["start"] for item in items],
+            [item["end"] for item in items],
+            [item.get("text", "") for item in items],
+            [item.get("speaker") for item in items],
+            [item.get("confidence") for item in items],
+        )
+
+    @classmethod
+    def empty(cls) -> "SegmentTable":
+        return cls(np.empty(0), np.empty(0))
+
+    @classmethod
+    def coerce(cls, value) -> "SegmentTable":
+        """Таблица как есть; список словарей (старые чекпоинты и кэш) — конвертируется."""
+        if isinstance(value, SegmentTable):
+            return value
+        if isinstance(value, dict) and value.get(JSON_MARKER):
+            return cls.from_json(value)
+        return cls.from_dicts(value or [])
+
+    # --- доступ ---
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> SegmentRow:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return SegmentRow(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield SegmentRow(self, index)
+
+    def speaker_at(self, index: int):
+        speaker_id = self.speaker_ids[index]
+        return self.speakers[speaker_id] if speaker_id >= 0 else None
+
+    def text_at(self, index: int) -> str:
+        return self.text_buffer[self.offsets[index]:self.offsets[index + 1] - 1]
+
+    def text_range(self, first: int, last: int) -> str:
+        """Тексты строк first..last-1 через пробел — один срез буфера."""
+        if last <= first:
+            return ""
+        return self.text_buffer[self.offsets[first]:self.offsets[last] - 1]
+
+    def texts(self) -> list:
+        offsets = self.offsets.tolist()
+        buffer = self.text_buffer
+        return [buffer[offsets[i]:offsets[i + 1] - 1] for i in range(len(self))]
+
+    def speaker_names(self) -> list:
+        """Имя спикера для каждой строки (None — не назначен)."""
+        names = self.speakers + [None]
+        return [names[i] for i in self.speaker_ids.tolist()]
+
+    def to_dicts(self) -> list:
+        starts, ends = self.starts.tolist(), self.ends.tolist()
+        confidence = [None if c != c else c for c in self.confidence.tolist()]
+        return [
+            {"start": s, "end": e, "speaker": sp, "text": t, "confidence": c}
+            for s, e, sp, t, c in zip(starts, ends, self.speaker_names(), self.texts(), confidence)
+        ]
+
+    # --- преобразования ---
+
+    def with_speakers(self, speakers: list, speaker_ids=None) -> "SegmentTable":
+        """Та же таблица с другими именами (и, при необходимости, индексами) спикеров; массивы общие."""
+        return SegmentTable(
+            self.starts, self.ends,
+            self.speaker_ids if speaker_ids is None else speaker_ids,
+            speakers, self.text_buffer, self.offsets, self.confidence
+        )
+
+    def with_times(self, starts, ends) -> "SegmentTable":
+        """Та же таблица с другими временами; тексты и спикеры общие."""
+        return SegmentTable(starts, ends, self.speaker_ids, self.speakers, self.text_buffer, self.offsets, self.confidence)
+
+    def take(self, indices) -> "SegmentTable":
+        """Подмножество строк (индексы или булева маска)."""
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        texts = self.texts()
+        names = self.speaker_names()
+        rows = indices.tolist()
+        return SegmentTable.from_columns(
+            self.starts[indices], self.ends[indices],
+            [texts[i] for i in rows], [names[i] for i in rows], self.confidence[indices]
+        )
+
+    @classmethod
+    def concat(cls, tables: list) -> "SegmentTable":
+        tables = [table for table in tables if len(table)]
+        if not tables:
+            return cls.empty()
+        texts, names = [], []
+        for table in tables:
+            texts.extend(table.texts())
+            names.extend(table.speaker_names())
+        return cls.from_columns(
+            np.concatenate([t.starts for t in tables]),
+            np.concatenate([t.ends for t in tables]),
+            texts, names,
+            np.concatenate([t.confidence for t in tables]),
+        )
+
+    # --- сериализация (чекпоинты, кэш) ---
+
+    def to_json(self) -> dict:
+        return {
+            JSON_MARKER: 1,
+            "start": np.round(self.starts, 3).tolist(),
+            "end": np.round(self.ends, 3).tolist(),
+            "confidence": [None if c != c else round(c, 4) for c in self.confidence.tolist()],
+            "speaker_ids": self.speaker_ids.tolist(),
+            "speakers": self.speakers,
+            "text": self.text_buffer,
+            "offsets": self.offsets.tolist(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "SegmentTable":
+        confidence = np.array([np.nan if c is None else c for c in data["confidence"]], dtype=np.float32)
+        return cls(
+            data["start"], data["end"], data["speaker_ids"],
+            [sys.intern(name) for name in data["speakers"]],
+            data["text"], data["offsets"], confidence
+        )
+
+    def __repr__(self):
+        return f"SegmentTable({len(self)} строк, спикеров: {len(self.speakers)})"
+
+
+def json_default(value):
+    """default= для json.dump: SegmentTable и numpy-скаляры."""
+    if isinstance(value, SegmentTable):
+        return value.to_json()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def json_object_hook(data: dict):
+    """object_hook= для json.load: восстанавливает SegmentTable."""
+    if data.get(JSON_MARKER):
+        return SegmentTable.from_json(data)
+    return data
@@ -38,3 +38,14 @@ def get_env_file_path(env_var_name: str) -> str:
         raise FileNotFoundError(f"Файл не найден: {full_path}")
 
     return full_path
+
+
+def get_state_dir() -> str:
+    """
+    Папка для долговременного состояния воркера (токены Drive, база задач и т.п.).
+    Берётся из STATE_DIR, по умолчанию state/ в корне проекта.
+    """
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))  # корень проекта
+    state_dir = os.getenv("STATE_DIR") or os.path.join(base_dir, "state")
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
@@ -1,12 +1,20 @@
 
 from services.airtable_service import AirtableClient
-from services.drive_service import list_files_in_folder, get_drive_service, find_matching_transcription, get_file_link, get_drive_service_oauth2
+from services.drive_service import get_drive_service, get_file_link, get_drive_service_oauth2
 from core.utils import safe_execute
 import os
 from dotenv import load_dotenv
 import asyncio
 from core.logger import logger
+from core.scheduler import JobScheduler
+from core.job_store import JobStore
+from core.checkpoints import StageCheckpoint
+from core.scratch import SCRATCH_ROOT, cleanup_stale_scratch
 from services.whisper_service import process_file
+from services.diarization_engine import get_diarization_engine
+from services.asr_engine import warm_up_asr_engines, shutdown_asr_engines
+from services.drive_watcher import DriveChangeWatcher
+from services.transcription_index import TranscriptionIndex
 
 load_dotenv()
 
@@ -19,9 +27,18 @@ MEETINGS_FOLDER_ID = os.getenv("MEETINGS_FOLDER_ID")
 MEETINGS_TEAMS_TRANSCRIPTION = os.getenv("MEETINGS_TEAMS_TRANSCRIPTION")
 
 
-# Очередь новых файлов (просто логируем на этом этапе)
-file_queue = []
-tasks = set()  # глобальное множество задач
+# Каждые сколько секунд выводить статус задач в работе
+SCHEDULER_STATUS_INTERVAL = int(os.getenv("SCHEDULER_STATUS_INTERVAL", "60"))
+# Сколько раз пытаться обработать встречу и базовая пауза между попытками (секунды, растёт с номером попытки)
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "60"))
+
+# Общий индекс VTT-файлов Teams для всех ожидающих встреч
+transcription_index = TranscriptionIndex(MEETINGS_TEAMS_TRANSCRIPTION, POLL_INTERVAL_TRANSCRIPTION)
+# Долговременное состояние задач (SQLite)
+job_store = JobStore()
+# Планировщик: по задаче на каждый новый файл, ограничение параллелизма и очереди этапов
+scheduler = JobScheduler()
 # --- Инициализация объекта Airtable ---
 airtable = AirtableClient(
     api_key=os.getenv("AIRTABLE_API_KEY"),
@@ -32,15 +49,86 @@ airtable = AirtableClient(
 async def wait_for_transcription(service, base_filename: str):
     """
     Асинхронно ждёт, пока в папке с транскрипциями появится файл с тем же именем (без расширения).
+    Все ожидающие встречи обслуживаются одним общим индексом папки.
     """
     logger.info(f"Ожидание транскрипции для файла: {base_filename}")
+    transcription_file = await transcription_index.wait_for(base_filename)
+    logger.info(f"Найдена транскрипция для {base_filename}: {transcription_file['name']}")
+    return transcription_file
+
+async def handle_new_file(service, f):
+    """
+    Полный цикл обработки одного нового видео. Выполняется отдельной задачей:
+    запись в Airtable создаётся сразу, медиа-этапы стартуют не дожидаясь VTT,
+    а транскрипция Teams ожидается параллельно внутри графа process_file.
+    Состояние задачи хранится в job_store, результаты этапов — в checkpoint, поэтому
+    и повторная попытка, и перезапуск воркера продолжают с первого незавершённого этапа.
+    """
+    job_id = f['id']
+    base_filename = os.path.splitext(f['name'])[0]
+    job = job_store.get(job_id)
+
+    record_id = job.get("record_id") if job else None
+
+    async def wait_vtt():
+        transcription_file = await wait_for_transcription(service, base_filename)
+        logger.info(
+            f"Пара файлов готова: видео = {f['name']}, транскрипт = {transcription_file['name']}"
+        )
+        return transcription_file
+
+    # Результаты этапов на диске: повторная попытка начинается с упавшего этапа
+    checkpoint = StageCheckpoint(job_id, on_save=lambda stage: job_store.mark_stage(job_id, stage))
 
     while True:
-        transcription_file = find_matching_transcription(service, MEETINGS_TEAMS_TRANSCRIPTION, base_filename)
-        if transcription_file:
-            logger.info(f"Найдена транскрипция для {base_filename}: {transcription_file['name']}")
-            return transcription_file
-        await asyncio.sleep(POLL_INTERVAL_TRANSCRIPTION)
+        job_store.start_attempt(job_id)
+        attempts = job_store.get(job_id)["attempts"]
+        try:
+            if not record_id:
+                fields = {
+                    "Name": base_filename,
+                    "Link to video meeting": get_file_link(f['id']),
+                }
+                async with scheduler.stage(job_id, "airtable"):
+                    record_id = await airtable.create_record(fields)
+                # create_record возвращает None при ошибке — без записи все обновления этапов потерялись бы
+                if not record_id:
+                    raise RuntimeError(f"Не удалось создать запись Airtable для {f['name']}")
+                job_store.update(job_id, record_id=record_id)
+            ok = await process_file(
+                f, service, SCRATCH_ROOT, base_filename, record_id, wait_vtt,
+                stage_context=lambda stage, heavy: scheduler.stage(job_id, stage, heavy=heavy),
+                checkpoint=checkpoint
+            )
+            error = "Ошибка обработки, подробности в логе"
+        except Exception as e:
+            ok = False
+            error = e
+
+        if ok:
+            job_store.finish(job_id)
+            checkpoint.clear()
+            return
+
+        job_store.fail(job_id, error)
+        if attempts >= JOB_MAX_ATTEMPTS:
+            logger.error(f"[Worker] {f['name']}: попытки исчерпаны ({attempts}), результаты этапов сохранены")
+            return
+
+        delay = JOB_RETRY_DELAY * attempts
+        logger.warning(f"[Worker] {f['name']}: попытка {attempts} не удалась, повтор через {delay}s")
+        async with scheduler.stage(job_id, "retry_wait"):
+            await asyncio.sleep(delay)
+
+
+def resume_unfinished_jobs(service):
+    """Ставит в работу задачи, прерванные перезапуском воркера."""
+    jobs = job_store.unfinished(JOB_MAX_ATTEMPTS)
+    for job in jobs:
+        logger.info(f"Возобновляем обработку {job['name']} (последний этап: {job['stage'] or '—'})")
+        scheduler.submit(job['file_id'], job['name'], handle_new_file, service, job['file'])
+    return len(jobs)
+
 
 async def poll_files(service):
 
@@ -50,46 +138,33 @@ async def poll_files(service):
         logger.error("Не удалось создать сервис. Выход...")
         return
 
-    seen = set(f['id'] for f in safe_execute(list_files_in_folder, service, MEETINGS_FOLDER_ID))
-    logger.info(f"Initial snapshot: {len(seen)} файлов уже в папке — игнорируем их")
+    await transcription_index.start()
 
+    # Лента изменений Drive: при первом запуске фиксируется начальная точка и уже лежащие файлы
+    # игнорируются, после перезапуска опрос продолжается с сохранённого токена
+    watcher = DriveChangeWatcher([MEETINGS_FOLDER_ID], name="meetings")
 
-    while True:
-        files = safe_execute(list_files_in_folder, service, MEETINGS_FOLDER_ID)
-        if files:
-            for f in files:
-                if f['id'] not in seen:
-                    mime = f.get("mimeType", "")
-                    name = f.get("name", "").lower()
-
-                    if mime != "video/mp4" and not name.endswith(".mp4"):
-                        continue
-
-                    seen.add(f['id'])
-                    file_queue.append(f)
-                    logger.info(f"Новый файл: {f['name']} добавлен в очередь")
-                    link_to_video = get_file_link(f['id'])
-                    base_filename = os.path.splitext(f['name'])[0]
-                    transcription_file = await wait_for_transcription(service, base_filename)
-                    link_to_trancription_teams = get_file_link(transcription_file['id'])
-                    fields = {
-                        "Name": base_filename,
-                        "Link to video meeting": link_to_video,
-                        "Link to teams transcription": link_to_trancription_teams
-                    }
-                    logger.info(
-                        f"Пара файлов готова: видео = {f['name']}, транскрипт = {transcription_file['name']}"
-                    )
-                    record_id = await airtable.create_record(fields)
+    resume_unfinished_jobs(service)
 
-                    # logger.info("Новая запись в Airtable создана")
+    last_status_at = 0.0
+    loop = asyncio.get_running_loop()
 
-                    #Добавляем файлы в очередь для обработки
-                    while file_queue:
-                        f = file_queue.pop(0)
-                        task = asyncio.create_task(process_file(f, service, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "temp")),base_filename, record_id,transcription_file))
-                        tasks.add(task)
-                        task.add_done_callback(tasks.discard)
+    while True:
+        changes = await asyncio.to_thread(safe_execute, watcher.poll) or {}
+        for f in changes.get(MEETINGS_FOLDER_ID, []):
+            mime = f.get("mimeType", "")
+            name = f.get("name", "").lower()
+
+            if mime != "video/mp4" and not name.endswith(".mp4"):
+                continue
+
+            # Файл уже известен (обработан или в работе) — изменения метаданных не интересны
+            if job_store.create(f):
+                logger.info(f"Новый файл: {f['name']} добавлен в очередь")
+                scheduler.submit(f['id'], f['name'], handle_new_file, service, f)
+        if scheduler.status() and loop.time() - last_status_at >= SCHEDULER_STATUS_INTERVAL:
+            logger.info(scheduler.format_status())
+            last_status_at = loop.time()
 
         await asyncio.sleep(POLL_INTERVAL)
 
@@ -98,7 +173,15 @@ async def main():
     if not service:
         logger.error("Не удалось создать сервис. Выход...")
         return
-    await poll_files(service)
+    cleanup_stale_scratch()
+    engine = get_diarization_engine()
+    await engine.warm_up()
+    await warm_up_asr_engines()
+    try:
+        await poll_files(service)
+    finally:
+        engine.shutdown()
+        shutdown_asr_engines()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
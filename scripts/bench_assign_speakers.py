@@ -0,0 +1,95 @@
+"""
+Бенчмарк распределения слов по спикерам (assign_speakers_to_text) на синтетической встрече.
+
+Сравнивает прежний алгоритм (перебор всех сегментов для каждого слова) с проходом
+по отсортированным сегментам и проверяет, что для слов внутри одной реплики результат совпадает.
+
+Запуск из корня проекта:
+    python scripts/bench_assign_speakers.py --hours 3
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.speaker_assignment import assign_speakers_to_text, word_speakers  # noqa: E402
+
+
+def synthetic_meeting(hours: float, speakers: int = 6, seed: int = 0):
+    """Реплики 1–20 с (иногда с наложением) и слова по ~0.35 с с паузами."""
+    rng = random.Random(seed)
+    duration = hours * 3600
+    segments = []
+    t = 0.0
+    while t < duration:
+        length = rng.uniform(1.0, 20.0)
+        start = max(0.0, t - (rng.uniform(0.0, 1.0) if rng.random() < 0.1 else 0.0))
+        segments.append({"start": round(start, 3), "end": round(t + length, 3), "speaker": f"SPEAKER_{rng.randrange(speakers):02d}"})
+        t += length + (rng.uniform(0.2, 3.0) if rng.random() < 0.3 else 0.0)
+
+    words = []
+    t = 0.0
+    while t < duration:
+        length = rng.uniform(0.15, 0.6)
+        words.append({"start": round(t, 3), "end": round(t + length, 3), "text": f"w{len(words)}"})
+        t += length + rng.uniform(0.02, 0.3)
+    return segments, words
+
+
+def naive_word_speakers(diarization_segments: list, words: list) -> list:
+    """Прежний алгоритм: первый сегмент, целиком содержащий слово, иначе сегмент с ближайшим началом."""
+    speakers = []
+    for word in words:
+        speaker = None
+        for d in diarization_segments:
+            if word['start'] >= d['start'] and word['end'] <= d['end']:
+                speaker = d['speaker']
+                break
+        if speaker is None and diarization_segments:
+            closest = min(diarization_segments, key=lambda d: abs(d['start'] - word['start']))
+            speaker = closest['speaker']
+        speakers.append(speaker)
+    return speakers
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк assign_speakers_to_text")
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--naive-words", type=int, default=5000, help="сколько слов прогнать старым алгоритмом (он квадратичный)")
+    args = parser.parse_args()
+
+    segments, words = synthetic_meeting(args.hours)
+    print(f"Сегментов: {len(segments)}, слов: {len(words)}")
+
+    started = time.perf_counter()
+    phrases = assign_speakers_to_text(segments, words)
+    fast_seconds = time.perf_counter() - started
+    print(f"Проход по отсортированным сегментам: {fast_seconds:.3f}s, фраз: {len(phrases)}")
+
+    # Равномерная выборка по всей встрече: у первых слов подходящий сегмент находится сразу
+    step = max(1, len(words) // args.naive_words)
+    sample = words[::step]
+    started = time.perf_counter()
+    naive = naive_word_speakers(segments, sample)
+    naive_seconds = time.perf_counter() - started
+    estimate = naive_seconds * len(words) / max(len(sample), 1)
+    print(f"Прежний перебор: {naive_seconds:.3f}s на {len(sample)} слов (~{estimate:.1f}s на все слова)")
+    print(f"Ускорение: ~x{estimate / max(fast_seconds, 1e-9):.0f}")
+
+    # Сравнение только для слов внутри единственной реплики: на стыках и наложениях новый алгоритм
+    # намеренно выбирает спикера по наибольшему пересечению
+    fast = word_speakers(segments, sample)
+    inside_one = [
+        i for i, w in enumerate(sample)
+        if sum(1 for d in segments if d['start'] <= w['start'] and w['end'] <= d['end']) == 1
+        and sum(1 for d in segments if d['start'] < w['end'] and w['start'] < d['end']) == 1
+    ]
+    mismatches = sum(1 for i in inside_one if fast[i] != naive[i])
+    print(f"Слов внутри одной реплики: {len(inside_one)}, расхождений: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Сравнение задержки транскрипции одной задачей и параллельными фрагментами.
+
+Генерирует синтетическую «речь» (всплески шума с паузами), поднимает локальный
+имитатор AssemblyAI (scripts/fake_asr_server.py), у которого время обработки растёт
+с длительностью аудио, и транскрибирует запись обоими способами.
+
+Запуск из корня проекта:
+    python scripts/bench_chunked_transcription.py --minutes 90 --latency-factor 0.005
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import wave
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("ASSEMBLYAI_POLL_INTERVAL", "0.2")
+
+from fake_asr_server import start_server  # noqa: E402
+from services.assemblyai_client import AsyncAssemblyAIClient  # noqa: E402
+from services.chunked_transcription import transcribe_chunked  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+def synthetic_speech(path: str, minutes: float, seed: int = 0):
+    """Пишет WAV: «слова» по 0.2–0.5 с, короткие паузы между словами и длинные между фразами."""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * SAMPLE_RATE)
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        written = 0
+        while written < total:
+            parts = []
+            for _ in range(rng.integers(5, 20)):
+                word = rng.normal(0, 3000, int(rng.uniform(0.2, 0.5) * SAMPLE_RATE))
+                parts.append(word)
+                parts.append(rng.normal(0, 30, int(rng.uniform(0.05, 0.15) * SAMPLE_RATE)))
+            parts.append(rng.normal(0, 30, int(rng.uniform(0.5, 2.0) * SAMPLE_RATE)))
+            block = np.clip(np.concatenate(parts), -32768, 32767).astype("<i2")[:total - written]
+            f.writeframes(block.tobytes())
+            written += len(block)
+
+
+def check_words(words) -> dict:
+    starts, ends = words.starts, words.ends
+    return {
+        "words": len(words),
+        "unsorted": int(np.sum(np.diff(starts) < 0)),
+        "overlapping": int(np.sum(starts[1:] < ends[:-1])),
+        "last_end": float(ends[-1]) if len(words) else 0.0,
+    }
+
+
+async def bench(args):
+    work_dir = tempfile.mkdtemp(prefix="bench_asr_")
+    audio_path = os.path.join(work_dir, "audio_bench.wav")
+    synthetic_speech(audio_path, args.minutes)
+    print(f"Аудио: {args.minutes} мин, {os.path.getsize(audio_path) / 1024 / 1024:.0f} МБ")
+
+    runner, base_url = await start_server(latency=args.latency, latency_factor=args.latency_factor)
+    client = AsyncAssemblyAIClient("bench", base_url)
+    try:
+        started = time.monotonic()
+        _, single_words = await client.transcribe(audio_path, "uk")
+        single_seconds = time.monotonic() - started
+
+        started = time.monotonic()
+        _, chunked_words = await transcribe_chunked(
+            audio_path, lambda path: client.transcribe(path, "uk"), upload_format="wav",
+            chunk_seconds=args.chunk_seconds, concurrency=args.concurrency
+        )
+        chunked_seconds = time.monotonic() - started
+    finally:
+        await client.aclose()
+        await runner.cleanup()
+        os.remove(audio_path)
+        os.rmdir(work_dir)
+
+    print(f"Одной задачей:  {single_seconds:7.2f}s  {check_words(single_words)}")
+    print(f"Фрагментами:    {chunked_seconds:7.2f}s  {check_words(chunked_words)}")
+    print(f"Ускорение: x{single_seconds / max(chunked_seconds, 1e-6):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк параллельной транскрипции фрагментами")
+    parser.add_argument("--minutes", type=float, default=60)
+    parser.add_argument("--chunk-seconds", type=float, default=600)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.2, help="базовая задержка имитатора, с")
+    parser.add_argument("--latency-factor", type=float, default=0.005, help="задержка имитатора на секунду аудио")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
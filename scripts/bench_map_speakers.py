@@ -0,0 +1,86 @@
+"""
+Масштабирование сопоставления спикеров диаризации с именами из VTT (map_whisper_speakers_by_iter).
+
+Для нескольких размеров встречи строит синтетические фразы whisper и реплики Teams VTT
+с известным соответствием спикеров, сравнивает время прежнего перебора
+(спикеры × сегменты × реплики) и прохода по отсортированным интервалам, проверяет соответствие.
+
+Запуск из корня проекта:
+    python scripts/bench_map_speakers.py --cues 1000 5000 20000
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.synchronizw_teams_service import map_whisper_speakers_by_iter, _overlap  # noqa: E402
+
+
+def synthetic(cues: int, speakers: int = 8, seed: int = 0):
+    """Реплики VTT подряд; фразы whisper — те же реплики со сдвигом границ и анонимными метками."""
+    rng = random.Random(seed)
+    names = [f"Участник {i}" for i in range(speakers)]
+    labels = {name: f"SPEAKER_{i:02d}" for i, name in enumerate(rng.sample(names, speakers))}
+    vtt = []
+    whisper = []
+    t = 0.0
+    for _ in range(cues):
+        length = rng.uniform(1.0, 12.0)
+        name = rng.choice(names)
+        vtt.append({"start": t, "end": t + length, "speaker": name, "text": ""})
+        jitter = rng.uniform(-0.4, 0.4)
+        whisper.append({"start": max(0.0, t + jitter), "end": t + length + jitter, "speaker": labels[name], "text": ""})
+        t += length + rng.uniform(0.0, 1.0)
+    expected = {label: name for name, label in labels.items()}
+    return whisper, vtt, expected
+
+
+def naive_mapping(whisper_segments, vtt_segments, min_overlap_for_match=0.02):
+    """Прежний алгоритм: для каждого спикера — перебор его сегментов и всех реплик VTT."""
+    speaker_order = []
+    for seg in whisper_segments:
+        if seg["speaker"] not in speaker_order:
+            speaker_order.append(seg["speaker"])
+    mapping = {}
+    for sp in speaker_order:
+        scores = {}
+        for s in [s for s in whisper_segments if s["speaker"] == sp]:
+            for vs in vtt_segments:
+                overlap = _overlap(s["start"], s["end"], vs["start"], vs["end"])
+                if overlap >= min_overlap_for_match:
+                    scores[vs["speaker"]] = scores.get(vs["speaker"], 0.0) + overlap
+        mapping[sp] = max(scores.items(), key=lambda x: x[1])[0] if scores else None
+    return mapping
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк map_whisper_speakers_by_iter")
+    parser.add_argument("--cues", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--naive-limit", type=int, default=5000, help="не запускать прежний перебор на больших входах")
+    args = parser.parse_args()
+
+    print(f"{'реплик':>8} {'перебор, s':>12} {'индекс, s':>10} {'верно':>6}")
+    for cues in args.cues:
+        whisper, vtt, expected = synthetic(cues)
+
+        started = time.perf_counter()
+        _, stats = map_whisper_speakers_by_iter(copy.deepcopy(whisper), vtt)
+        fast_seconds = time.perf_counter() - started
+        correct = stats["mapping"] == expected
+
+        naive_seconds = None
+        if cues <= args.naive_limit:
+            started = time.perf_counter()
+            naive_mapping(whisper, vtt)
+            naive_seconds = time.perf_counter() - started
+
+        naive_text = f"{naive_seconds:12.3f}" if naive_seconds is not None else f"{'—':>12}"
+        print(f"{cues:>8} {naive_text} {fast_seconds:10.3f} {str(correct):>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Память и время этапов сопоставления на синтетической встрече: списки словарей против SegmentTable.
+
+Строит слова и сегменты диаризации как прежде (по словарю на слово) и в колоночном виде,
+сравнивает занимаемую память (tracemalloc), размер JSON чекпоинта и время
+распределения слов по спикерам + переименования спикеров по VTT.
+
+Запуск из корня проекта:
+    python scripts/bench_segment_store.py --hours 3
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from core.segments import SegmentTable, json_default  # noqa: E402
+from services.speaker_assignment import assign_speakers_to_text  # noqa: E402
+from services.synchronizw_teams_service import map_whisper_speakers_by_iter  # noqa: E402
+from bench_assign_speakers import synthetic_meeting  # noqa: E402
+
+
+def resident_mb(func):
+    """Сколько памяти занимает результат после построения (временные списки уже освобождены)."""
+    tracemalloc.start()
+    result = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current / 1024 / 1024
+
+
+def timed(func):
+    started = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк колоночного хранилища сегментов")
+    parser.add_argument("--hours", type=float, default=3)
+    args = parser.parse_args()
+
+    segments, words = synthetic_meeting(args.hours)
+    for word in words:
+        word["confidence"] = 0.9
+    vtt = [{**seg, "speaker": f"Учасник {seg['speaker'][-2:]}", "text": ""} for seg in segments]
+    print(f"Сегментов: {len(segments)}, слов: {len(words)}")
+
+    dict_words, dict_mb = resident_mb(lambda: [dict(word) for word in words])
+    table_words, table_mb = resident_mb(lambda: SegmentTable.from_dicts(words))
+    print(f"Слова в памяти: словари {dict_mb:.1f} МБ, SegmentTable {table_mb:.1f} МБ")
+
+    dict_json = len(json.dumps(dict_words, ensure_ascii=False, separators=(",", ":")))
+    table_json = len(json.dumps(table_words, ensure_ascii=False, separators=(",", ":"), default=json_default))
+    print(f"JSON чекпоинта: словари {dict_json / 1024 / 1024:.1f} МБ, SegmentTable {table_json / 1024 / 1024:.1f} МБ")
+
+    diarization = SegmentTable.from_dicts(segments)
+    phrases, assign_seconds = timed(lambda: assign_speakers_to_text(diarization, table_words))
+    (_, stats), map_seconds = timed(lambda: map_whisper_speakers_by_iter(phrases, vtt))
+    print(f"SegmentTable: распределение {assign_seconds:.3f}s, переименование {map_seconds:.3f}s, фраз {len(phrases)}")
+
+    legacy, legacy_assign = timed(lambda: assign_speakers_to_text(segments, dict_words).to_dicts())
+    (_, legacy_stats), legacy_map = timed(lambda: map_whisper_speakers_by_iter(legacy, vtt))
+    print(f"Списки словарей: распределение {legacy_assign:.3f}s, переименование {legacy_map:.3f}s")
+    print(f"Сопоставление совпадает: {stats['mapping'] == legacy_stats['mapping']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Суммирование длинной встречи через локальный имитатор OpenAI (scripts/fake_openai_server.py).
+
+Строит синтетические расшифровки, одновременно запускает openai_request (map-reduce) для нескольких
+встреч против имитатора с ограниченным контекстом и показывает: сколько запросов ушло, сколько
+отклонено (429/503), сколько шло одновременно, самый длинный запрос в токенах и какая доля реплик
+дошла до модели — по сравнению с прежней обрезкой расшифровки до 12 000 символов.
+Затем те же встречи суммируются повторно — ответы должны взяться из кэша без запросов.
+
+Запуск из корня проекта (кэш ответов — во временной папке):
+    python scripts/bench_summary.py --hours 3 --context-tokens 16000
+    OPENAI_TPM=60000 python scripts/bench_summary.py --hours 0.5 --meetings 3 --tpm 60000 --server-error-rate 0.1
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+os.environ.setdefault("RESULT_CACHE_DIR", tempfile.mkdtemp(prefix="bench_summary_cache_"))
+
+from core.segments import SegmentTable  # noqa: E402
+from services.openai_promt_generation_service import openai_request  # noqa: E402
+from services.token_budget import count_tokens, dialogue_turns  # noqa: E402
+from fake_openai_server import FAKE, start_server  # noqa: E402
+
+WORDS = "так добре давайте подивимось на цифри наступного кварталу я думаю що варто обговорити бюджет".split()
+LEGACY_MAX_CHARS = 12000
+
+
+def synthetic_transcript(hours: float, speakers: int = 6, seed: int = 0) -> SegmentTable:
+    """Фразы по 3–40 слов (~2.5 слова в секунду), спикер меняется на каждой фразе."""
+    rng = random.Random(seed)
+    names = [f"Учасник {i}" for i in range(speakers)]
+    starts, ends, texts, speaker_names = [], [], [], []
+    t = 0.0
+    previous = None
+    while t < hours * 3600:
+        count = rng.randint(3, 40)
+        speaker = rng.choice([name for name in names if name != previous])
+        starts.append(t)
+        ends.append(t + count / 2.5)
+        texts.append(f"репліка{len(texts)} " + " ".join(rng.choice(WORDS) for _ in range(count)))
+        speaker_names.append(speaker)
+        previous = speaker
+        t += count / 2.5 + rng.uniform(0.2, 1.5)
+    return SegmentTable.from_columns(starts, ends, texts, speaker_names)
+
+
+async def bench(args):
+    runner, base_url = await start_server(
+        latency=args.latency, context_tokens=args.context_tokens, tpm=args.tpm,
+        fail_rate=args.fail_rate, server_error_rate=args.server_error_rate
+    )
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "test")
+    fake = runner.app[FAKE]
+    try:
+        meetings = [synthetic_transcript(args.hours, seed=seed) for seed in range(args.meetings)]
+        turns = [turn for segments in meetings for turn in dialogue_turns(segments)]
+        legacy_turns = sum(
+            len("\n".join(dialogue_turns(segments))[:LEGACY_MAX_CHARS].splitlines()) for segments in meetings
+        )
+        print(f"Встреч: {len(meetings)}, реплик: {len(turns)}, токенов расшифровки: {count_tokens(chr(10).join(turns))}")
+
+        for attempt in ("первый запуск", "повторный запуск"):
+            requests_before = fake.requests
+            started = time.perf_counter()
+            summaries = await asyncio.gather(*(
+                openai_request(segments, f"bench_meeting_{i}") for i, segments in enumerate(meetings)
+            ))
+            seconds = time.perf_counter() - started
+            print(
+                f"{attempt}: подсумков {sum(s is not None for s in summaries)}/{len(meetings)} за {seconds:.1f}s, "
+                f"запросов к API {fake.requests - requests_before}"
+            )
+
+        seen = sum(1 for turn in turns if turn in fake.seen_lines)
+        print(
+            f"Отклонено (429/503): {fake.rejected}, одновременно до {fake.peak_active}, "
+            f"самый длинный запрос {fake.max_prompt_tokens} токенов (контекст {args.context_tokens})"
+        )
+        print(f"Реплик дошло до модели: {seen}/{len(turns)} (прежняя обрезка до {LEGACY_MAX_CHARS} символов: {legacy_turns})")
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк map-reduce суммирования")
+    parser.add_argument("--hours", type=float, default=3)
+    parser.add_argument("--context-tokens", type=int, default=16000)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--meetings", type=int, default=1, help="сколько встреч суммируется одновременно")
+    parser.add_argument("--tpm", type=int, default=0, help="лимит токенов в минуту у имитатора (0 — без лимита)")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля ответов 429 у имитатора")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="доля ответов 503 у имитатора")
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
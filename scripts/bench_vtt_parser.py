@@ -0,0 +1,121 @@
+"""
+Пропускная способность разбора Teams VTT на синтетическом файле (~10 МБ).
+
+Сравнивает прежний разбор (f.read() + splitlines() + regex по строке, только однострочные <v>)
+с потоковым iter_vtt_file и сборкой CueArrays для этапа сопоставления спикеров.
+Часть реплик многострочная — прежний разбор оставляет от них только первую строку.
+
+Запуск из корня проекта:
+    python scripts/bench_vtt_parser.py --mb 10
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.synchronizw_teams_service import CueArrays, iter_vtt_file, parse_vtt_file, time_to_seconds  # noqa: E402
+
+WORDS = "так добре давайте подивимось на цифри наступного кварталу я думаю що варто обговорити".split()
+
+
+def _timestamp(seconds: float) -> str:
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    return f"{int(h):02d}:{int(m):02d}:{s:06.3f}"
+
+
+def write_synthetic_vtt(path: str, megabytes: float, multiline_ratio: float = 0.2, seed: int = 0) -> int:
+    """Пишет VTT в формате Teams; возвращает число реплик."""
+    rng = random.Random(seed)
+    names = [f"Учасник {i} (Компанія)" for i in range(12)]
+    target = int(megabytes * 1024 * 1024)
+    cues = 0
+    t = 0.0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("WEBVTT\n\n")
+        while f.tell() < target:
+            length = rng.uniform(1.0, 8.0)
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 20)))
+            name = rng.choice(names)
+            f.write(f"{rng.getrandbits(64):016x}/{cues}-0\n{_timestamp(t)} --> {_timestamp(t + length)}\n")
+            if rng.random() < multiline_ratio:
+                middle = len(text) // 2
+                f.write(f"<v {name}>{text[:middle]}\n{text[middle:]}</v>\n\n")
+            else:
+                f.write(f"<v {name}>{text}</v>\n\n")
+            cues += 1
+            t += length
+    return cues
+
+
+def legacy_parse(vtt_text: str) -> list:
+    """Прежний parse_vtt_text (без логирования)."""
+    segments = []
+    curr_start = curr_end = None
+    for raw in vtt_text.splitlines():
+        line = raw.strip()
+        if "-->" in line:
+            start_s, end_s = line.split("-->")
+            curr_start = time_to_seconds(start_s.strip())
+            curr_end = time_to_seconds(end_s.strip())
+        elif line.startswith("<v "):
+            m = re.match(r"<v\s+([^>]+)>(.*)</v>?$", line, re.DOTALL)
+            if m:
+                speaker, text = m.group(1).strip(), m.group(2).strip()
+            else:
+                sp, rest = line[3:].split(">", 1)
+                speaker, text = sp.strip(), rest.replace("</v>", "").strip()
+            if curr_start is not None and curr_end is not None:
+                segments.append({"start": float(curr_start), "end": float(curr_end), "speaker": speaker, "text": text})
+                curr_start = curr_end = None
+    return segments
+
+
+def measure(label: str, size_mb: float, func):
+    started = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - started
+    # Память — отдельным прогоном: tracemalloc сильно замедляет сам разбор
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    chars = sum(len(cue["text"]) for cue in result) if isinstance(result, list) else None
+    print(
+        f"{label:<28} {seconds:7.3f}s  {size_mb / seconds:7.1f} МБ/с  пик {peak / 1024 / 1024:7.1f} МБ  "
+        f"реплик {len(result)}" + (f"  символов текста {chars}" if chars is not None else "")
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора VTT")
+    parser.add_argument("--mb", type=float, default=10)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix=".vtt")
+    os.close(fd)
+    try:
+        cues = write_synthetic_vtt(path, args.mb)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        print(f"VTT: {size_mb:.1f} МБ, реплик: {cues}")
+
+        def legacy():
+            with open(path, "r", encoding="utf-8") as f:
+                return legacy_parse(f.read())
+
+        measure("прежний (read+splitlines)", size_mb, legacy)
+        measure("потоковый, список", size_mb, lambda: parse_vtt_file(path))
+        measure("потоковый -> CueArrays", size_mb, lambda: CueArrays.from_cues(iter_vtt_file(path)))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Локальный имитатор AssemblyAI API для отладки без сети и без оплаты.
+
+Поддерживает /v2/upload, /v2/transcript и /v2/transcript/{id}. Транскрипция
+«готовится» за latency + duration * latency_factor секунд (и не раньше, чем после polls
+запросов статуса) и возвращает синтетические слова по всей длительности аудио —
+или статус error с текстом error. Первые upload_failures загрузок получают 503,
+часть запросов статуса (fail_rate) — 429. Статистика — в app[FAKE].
+
+Запуск:
+    python scripts/fake_asr_server.py --port 8765 --latency-factor 0.01
+    ASSEMBLYAI_BASE_URL=http://127.0.0.1:8765 python -m core.worker
+"""
+import argparse
+import socket
+import struct
+import time
+import uuid
+from aiohttp import web
+
+
+def audio_duration(data: bytes) -> float:
+    """Длительность PCM16 WAV по заголовку; для остальных форматов — оценка по размеру (24 кбит/с)."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        byte_rate = struct.unpack("<I", data[28:32])[0]
+        return max(0.0, (len(data) - 44) / max(byte_rate, 1))
+    return len(data) * 8 / 24000
+
+
+def synthetic_words(duration: float, offset: float = 0.0, word_seconds: float = 0.5) -> list:
+    words = []
+    t = 0.0
+    index = 0
+    while t + word_seconds <= duration:
+        words.append({
+            "text": f"слово{index}",
+            "start": int((offset + t) * 1000),
+            "end": int((offset + t + word_seconds * 0.8) * 1000),
+            "confidence": 0.9,
+        })
+        t += word_seconds
+        index += 1
+    return words
+
+
+class FakeAssemblyAI:
+    def __init__(self, latency: float, latency_factor: float, fail_rate: float,
+                 upload_failures: int = 0, polls: int = 0, error: str = None):
+        self.latency = latency
+        self.latency_factor = latency_factor
+        self.fail_rate = fail_rate
+        self.upload_failures = upload_failures
+        self.polls = polls
+        self.error = error
+        self.uploads = {}
+        self.transcripts = {}
+        self.requests = 0
+        self.rejected = 0
+        # (байт получено, передано ли тело кусками — Transfer-Encoding: chunked) для каждой загрузки
+        self.upload_bodies = []
+
+    async def upload(self, request: web.Request):
+        self.requests += 1
+        data = await request.read()
+        self.upload_bodies.append((len(data), request.headers.get("Transfer-Encoding") == "chunked"))
+        if len(self.upload_bodies) <= self.upload_failures:
+            self.rejected += 1
+            return web.json_response({"error": "service unavailable"}, status=503)
+        upload_id = uuid.uuid4().hex
+        self.uploads[upload_id] = audio_duration(data)
+        return web.json_response({"upload_url": f"{request.scheme}://{request.host}/files/{upload_id}"})
+
+    async def submit(self, request: web.Request):
+        self.requests += 1
+        payload = await request.json()
+        upload_id = payload["audio_url"].rsplit("/", 1)[-1]
+        duration = self.uploads.get(upload_id)
+        if duration is None:
+            return web.json_response({"error": "unknown audio_url"}, status=400)
+        transcript_id = uuid.uuid4().hex
+        self.transcripts[transcript_id] = {
+            "duration": duration,
+            "ready_at": time.monotonic() + self.latency + duration * self.latency_factor,
+            "polls": 0,
+        }
+        return web.json_response({"id": transcript_id, "status": "queued"})
+
+    async def get(self, request: web.Request):
+        self.requests += 1
+        # Имитация перегрузки: часть запросов статуса получает 429
+        if self.fail_rate and (self.requests % max(int(1 / self.fail_rate), 1) == 0):
+            self.rejected += 1
+            return web.json_response({"error": "rate limited"}, status=429)
+        transcript_id = request.match_info["transcript_id"]
+        transcript = self.transcripts.get(transcript_id)
+        if transcript is None:
+            return web.json_response({"error": "not found"}, status=404)
+        transcript["polls"] += 1
+        if time.monotonic() < transcript["ready_at"] or transcript["polls"] <= self.polls:
+            return web.json_response({"id": transcript_id, "status": "processing"})
+        if self.error:
+            return web.json_response({"id": transcript_id, "status": "error", "error": self.error})
+        words = synthetic_words(transcript["duration"])
+        return web.json_response({
+            "id": transcript_id,
+            "status": "completed",
+            "text": " ".join(w["text"] for w in words),
+            "words": words,
+        })
+
+
+FAKE = web.AppKey("fake", FakeAssemblyAI)
+
+
+def make_app(latency: float = 0.5, latency_factor: float = 0.0, fail_rate: float = 0.0,
+             upload_failures: int = 0, polls: int = 0, error: str = None) -> web.Application:
+    fake = FakeAssemblyAI(latency, latency_factor, fail_rate, upload_failures, polls, error)
+    app = web.Application(client_max_size=4 * 1024 ** 3)
+    app[FAKE] = fake
+    app.router.add_post("/v2/upload", fake.upload)
+    app.router.add_post("/v2/transcript", fake.submit)
+    app.router.add_get("/v2/transcript/{transcript_id}", fake.get)
+    return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """Запускает сервер в текущем event loop. Возвращает (runner, base_url)."""
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    # Сокет открываем сами — при port=0 так известен порт, который выдала система
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, port))
+    await web.SockSite(runner, sock).start()
+    return runner, f"http://{host}:{sock.getsockname()[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный имитатор AssemblyAI")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="базовая задержка транскрипции, с")
+    parser.add_argument("--latency-factor", type=float, default=0.0, help="доп. задержка на секунду аудио")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля запросов статуса с ответом 429")
+    parser.add_argument("--upload-failures", type=int, default=0, help="сколько первых загрузок получают 503")
+    parser.add_argument("--polls", type=int, default=0, help="сколько запросов статуса отвечать processing")
+    parser.add_argument("--error", default=None, help="завершать транскрипции статусом error с этим текстом")
+    args = parser.parse_args()
+    web.run_app(
+        make_app(args.latency, args.latency_factor, args.fail_rate, args.upload_failures, args.polls, args.error),
+        host=args.host, port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
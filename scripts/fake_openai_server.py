@@ -0,0 +1,149 @@
+"""
+Локальный имитатор OpenAI Chat Completions для отладки суммирования без сети и без оплаты.
+
+Поддерживает POST /v1/chat/completions. Запрос длиннее context_tokens отклоняется, как настоящий API
+(400, context_length_exceeded), превышение tpm (запрос + max_tokens; лимит, как у OpenAI,
+восстанавливается непрерывно) — 429;
+дополнительно часть запросов может получать 429 или 503. Ответ — синтетический текст
+длиной не больше max_tokens. Статистика (число запросов, пик одновременных, самый длинный запрос
+и все строки «[спикер]: ...», дошедшие до модели) доступна в app[FAKE].
+
+Запуск:
+    python scripts/fake_openai_server.py --port 8766
+    OPENAI_BASE_URL=http://127.0.0.1:8766/v1 OPENAI_API_KEY=test python -m core.worker
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+import uuid
+from aiohttp import web
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from services.token_budget import count_tokens  # noqa: E402
+
+
+class FakeOpenAI:
+    def __init__(self, latency: float, context_tokens: int, fail_rate: float, server_error_rate: float, tpm: int):
+        self.latency = latency
+        self.context_tokens = context_tokens
+        self.tpm = tpm
+        self.tpm_left = float(tpm)
+        self.tpm_updated = time.monotonic()
+        self.fail_rate = fail_rate
+        self.server_error_rate = server_error_rate
+        self.requests = 0
+        self.rejected = 0
+        self.active = 0
+        self.peak_active = 0
+        self.max_prompt_tokens = 0
+        self.prompt_tokens = 0
+        self.seen_lines = set()
+
+    async def chat(self, request: web.Request):
+        self.requests += 1
+        if self.server_error_rate and (self.requests % max(int(1 / self.server_error_rate), 1) == 1):
+            self.rejected += 1
+            return web.json_response({"error": {"message": "The server is overloaded", "type": "server_error"}}, status=503)
+        if self.fail_rate and (self.requests % max(int(1 / self.fail_rate), 1) == 0):
+            self.rejected += 1
+            return web.json_response(
+                {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                status=429, headers={"retry-after": "0.2"}
+            )
+        payload = await request.json()
+        prompt = "\n".join(m.get("content") or "" for m in payload.get("messages", []))
+        max_tokens = int(payload.get("max_tokens") or 256)
+        prompt_tokens = count_tokens(prompt)
+        if prompt_tokens + max_tokens > self.context_tokens:
+            return web.json_response({"error": {
+                "message": f"This model's maximum context length is {self.context_tokens} tokens. "
+                           f"However, you requested {prompt_tokens + max_tokens} tokens.",
+                "type": "invalid_request_error", "code": "context_length_exceeded",
+            }}, status=400)
+        if self.tpm:
+            now = time.monotonic()
+            self.tpm_left = min(self.tpm, self.tpm_left + (now - self.tpm_updated) * self.tpm / 60)
+            self.tpm_updated = now
+            if prompt_tokens + max_tokens > self.tpm_left:
+                self.rejected += 1
+                return web.json_response(
+                    {"error": {"message": f"Rate limit reached: {self.tpm} TPM", "type": "tokens",
+                               "code": "rate_limit_exceeded"}},
+                    status=429, headers={"retry-after": "1"}
+                )
+            self.tpm_left -= prompt_tokens + max_tokens
+
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+        self.max_prompt_tokens = max(self.max_prompt_tokens, prompt_tokens)
+        self.prompt_tokens += prompt_tokens
+        self.seen_lines.update(line for line in prompt.splitlines() if line.startswith("["))
+
+        words = []
+        while count_tokens(" ".join(words + ["підсумок"])) <= min(max_tokens, 150):
+            words.append("підсумок")
+        content = f"Підсумок ({prompt_tokens} токенів): " + " ".join(words)
+        completion_tokens = count_tokens(content)
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+FAKE = web.AppKey("fake", FakeOpenAI)
+
+
+def make_app(latency: float = 0.5, context_tokens: int = 128000, fail_rate: float = 0.0,
+             server_error_rate: float = 0.0, tpm: int = 0) -> web.Application:
+    fake = FakeOpenAI(latency, context_tokens, fail_rate, server_error_rate, tpm)
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app[FAKE] = fake
+    app.router.add_post("/v1/chat/completions", fake.chat)
+    return app
+
+
+async def start_server(host: str = "127.0.0.1", port: int = 0, **kwargs):
+    """Запускает сервер в текущем event loop. Возвращает (runner, base_url) — base_url уже с /v1."""
+    runner = web.AppRunner(make_app(**kwargs))
+    await runner.setup()
+    # Сокет открываем сами — при port=0 так известен порт, который выдала система
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((host, port))
+    await web.SockSite(runner, sock).start()
+    return runner, f"http://{host}:{sock.getsockname()[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный имитатор OpenAI Chat Completions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.5, help="задержка ответа, с")
+    parser.add_argument("--context-tokens", type=int, default=128000, help="контекст модели, токенов")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="доля запросов с ответом 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="доля запросов с ответом 503")
+    parser.add_argument("--tpm", type=int, default=0, help="лимит токенов в минуту (0 — без лимита)")
+    args = parser.parse_args()
+    web.run_app(
+        make_app(args.latency, args.context_tokens, args.fail_rate, args.server_error_rate, args.tpm),
+        host=args.host, port=args.port
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+from services.audio_service import load_waveform, upload_audio_path, ASR_UPLOAD_FORMAT, ASR_OPUS_BITRATE
+from services.assemblyai_client import get_assemblyai_client
+from services.chunked_transcription import transcribe_chunked, chunking_config, ASR_CHUNKING
+
+load_dotenv()
+
+# Движок распознавания: assemblyai, local (faster-whisper на CPU) или auto (короткие встречи — локально)
+ASR_ENGINE = os.getenv("ASR_ENGINE", "assemblyai").lower()
+# Для auto: записи не длиннее этого (секунды) распознаются локально, остальные — в AssemblyAI
+ASR_LOCAL_MAX_SECONDS = float(os.getenv("ASR_LOCAL_MAX_SECONDS", "1200"))
+# Модель faster-whisper (tiny/base/small/medium/large-v3 или путь к сконвертированной модели CTranslate2)
+ASR_LOCAL_MODEL = os.getenv("ASR_LOCAL_MODEL", "small")
+# Квантизация весов: int8 — быстрее и в ~4 раза меньше памяти на CPU
+ASR_LOCAL_COMPUTE_TYPE = os.getenv("ASR_LOCAL_COMPUTE_TYPE", "int8")
+# Потоков CTranslate2 на одно распознавание (0 — по числу ядер)
+ASR_LOCAL_THREADS = int(os.getenv("ASR_LOCAL_THREADS", "0"))
+# Сколько записей модель распознаёт одновременно
+ASR_LOCAL_WORKERS = int(os.getenv("ASR_LOCAL_WORKERS", "1"))
+# Размер батча фрагментов речи при декодировании (1 — без батчинга)
+ASR_LOCAL_BATCH_SIZE = int(os.getenv("ASR_LOCAL_BATCH_SIZE", "8"))
+ASR_LOCAL_BEAM_SIZE = int(os.getenv("ASR_LOCAL_BEAM_SIZE", "1"))
+# Загружать модель только из локального кэша
+ASR_LOCAL_OFFLINE = os.getenv("ASR_LOCAL_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+
+class TranscriptionEngine(ABC):
+    """
+    Движок распознавания речи.
+
+    transcribe(audio_path, language) возвращает (full_text, words), где words —
+    SegmentTable (start, end, text, confidence) со временем в секундах от начала записи.
+    config() — параметры, от которых зависит результат (входят в ключ кэша транскрипции).
+    """
+
+    name = ""
+
+    def config(self) -> dict:
+        return {"engine": self.name}
+
+    async def warm_up(self):
+        pass
+
+    @abstractmethod
+    async def transcribe(self, audio_path: str, language: str):
+        ...
+
+    def shutdown(self):
+        pass
+
+
+class AssemblyAIEngine(TranscriptionEngine):
+    """Облачное распознавание: загрузка сжатой копии (или фрагментов при ASR_CHUNKING) и опрос статуса."""
+
+    name = "assemblyai"
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key or os.getenv("ASSEMBLY_AI_KEY")
+
+    def config(self) -> dict:
+        return {
+            "engine": self.name,
+            "upload_format": ASR_UPLOAD_FORMAT,
+            "opus_bitrate": ASR_OPUS_BITRATE if ASR_UPLOAD_FORMAT == "opus" else None,
+            **chunking_config(),
+        }
+
+    async def transcribe(self, audio_path: str, language: str):
+        client = get_assemblyai_client(self.api_key)
+        if ASR_CHUNKING:
+            result = await transcribe_chunked(audio_path, lambda path: client.transcribe(path, language))
+            if result is not None:
+                return result
+
+        upload_path = upload_audio_path(audio_path)
+        if not os.path.exists(upload_path):
+            upload_path = audio_path
+        return await client.transcribe(upload_path, language)
+
+
+class LocalWhisperEngine(TranscriptionEngine):
+    """
+    Локальное распознавание faster-whisper (CTranslate2) на CPU.
+
+    Модель загружается один раз и остаётся в памяти между задачами. CTranslate2 отпускает GIL,
+    поэтому распознавание идёт в пуле потоков, не блокируя event loop; num_workers модели
+    совпадает с размером пула, чтобы параллельные записи не ждали друг друга.
+    Фрагменты речи декодируются батчами (BatchedInferencePipeline).
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model: str = ASR_LOCAL_MODEL,
+        compute_type: str = ASR_LOCAL_COMPUTE_TYPE,
+        threads: int = ASR_LOCAL_THREADS,
+        workers: int = ASR_LOCAL_WORKERS,
+        batch_size: int = ASR_LOCAL_BATCH_SIZE,
+        beam_size: int = ASR_LOCAL_BEAM_SIZE,
+        offline: bool = ASR_LOCAL_OFFLINE
+    ):
+        self.model = model
+        self.compute_type = compute_type
+        self.threads = threads
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.beam_size = beam_size
+        self.offline = offline
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="asr")
+        self._model = None
+        self._pipeline = None
+        self._load_lock = asyncio.Lock()
+
+    def config(self) -> dict:
+        return {
+            "engine": self.name,
+            "model": self.model,
+            "compute_type": self.compute_type,
+            "batch_size": self.batch_size,
+            "beam_size": self.beam_size,
+        }
+
+    def _load(self):
+        from faster_whisper import WhisperModel, BatchedInferencePipeline
+
+        started = time.monotonic()
+        self._model = WhisperModel(
+            self.model,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=self.threads,
+            num_workers=self.workers,
+            local_files_only=self.offline
+        )
+        if self.batch_size > 1:
+            self._pipeline = BatchedInferencePipeline(model=self._model)
+        logger.info(
+            f"[ASR] Модель faster-whisper {self.model} ({self.compute_type}) загружена "
+            f"за {time.monotonic() - started:.1f}s"
+        )
+
+    async def _ensure_loaded(self):
+        async with self._load_lock:
+            if self._model is None:
+                await asyncio.get_running_loop().run_in_executor(self._executor, self._load)
+
+    async def warm_up(self):
+        """Загружает модель заранее, чтобы первая встреча не ждала загрузки."""
+        try:
+            await self._ensure_loaded()
+        except Exception as e:
+            logger.error(f"[ASR] Не удалось загрузить модель {self.model}: {e}")
+
+    def _transcribe(self, audio_path: str, language: str):
+        samples, sample_rate = load_waveform(audio_path)
+        audio = np.asarray(samples, dtype=np.float32) / 32768.0
+        duration = len(audio) / sample_rate
+
+        started = time.monotonic()
+        options = {"language": language, "beam_size": self.beam_size, "word_timestamps": True}
+        if self._pipeline is not None:
+            segments, _ = self._pipeline.transcribe(audio, batch_size=self.batch_size, **options)
+        else:
+            segments, _ = self._model.transcribe(audio, **options)
+
+        starts, ends, word_texts, confidence = array("d"), array("d"), [], array("f")
+        texts = []
+        for segment in segments:
+            texts.append(segment.text.strip())
+            for word in segment.words or []:
+                starts.append(word.start)
+                ends.append(word.end)
+                word_texts.append(word.word.strip())
+                confidence.append(word.probability)
+        words = SegmentTable.from_columns(
+            np.round(np.frombuffer(starts, dtype=np.float64), 3),
+            np.round(np.frombuffer(ends, dtype=np.float64), 3),
+            word_texts,
+            confidence=np.frombuffer(confidence, dtype=np.float32)
+        )
+
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"[ASR] Локальное распознавание {duration / 60:.1f} мин за {elapsed:.1f}s "
+            f"(x{duration / max(elapsed, 1e-6):.1f} реального времени)"
+        )
+        return " ".join(t for t in texts if t), words
+
+    async def transcribe(self, audio_path: str, language: str):
+        await self._ensure_loaded()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._transcribe, audio_path, language)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._model = None
+        self._pipeline = None
+
+
+ENGINES = {
+    AssemblyAIEngine.name: AssemblyAIEngine,
+    LocalWhisperEngine.name: LocalWhisperEngine,
+}
+
+_engines = {}
+
+
+def get_asr_engine(name: str) -> TranscriptionEngine:
+    """Общий для воркера экземпляр движка (создаётся при первом обращении)."""
+    engine = _engines.get(name)
+    if engine is None:
+        if name not in ENGINES:
+            raise ValueError(f"Неизвестный ASR_ENGINE: {name}")
+        engine = _engines[name] = ENGINES[name]()
+    return engine
+
+
+def select_asr_engine(audio_path: str) -> TranscriptionEngine:
+    """Движок для записи по ASR_ENGINE; в режиме auto выбор зависит от длительности."""
+    if ASR_ENGINE != "auto":
+        return get_asr_engine(ASR_ENGINE)
+    samples, sample_rate = load_waveform(audio_path)
+    duration = len(samples) / sample_rate
+    return get_asr_engine(LocalWhisperEngine.name if duration <= ASR_LOCAL_MAX_SECONDS else AssemblyAIEngine.name)
+
+
+async def warm_up_asr_engines():
+    """Прогревает локальную модель, если она может понадобиться."""
+    if ASR_ENGINE in (LocalWhisperEngine.name, "auto"):
+        await get_asr_engine(LocalWhisperEngine.name).warm_up()
+
+
+def shutdown_asr_engines():
+    for engine in _engines.values():
+        engine.shutdown()
+    _engines.clear()
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import random
+import time
+import aiofiles
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+
+load_dotenv()
+
+# Адрес API (для локального тестового сервера — например http://127.0.0.1:8765)
+ASSEMBLYAI_BASE_URL = os.getenv("ASSEMBLYAI_BASE_URL", "https://api.assemblyai.com")
+# Опрос статуса транскрипции: начальный и максимальный интервал, секунды
+ASSEMBLYAI_POLL_INTERVAL = float(os.getenv("ASSEMBLYAI_POLL_INTERVAL", "3"))
+ASSEMBLYAI_MAX_POLL_INTERVAL = float(os.getenv("ASSEMBLYAI_MAX_POLL_INTERVAL", "30"))
+# Сколько максимум ждать готовности одной транскрипции, секунды
+ASSEMBLYAI_TIMEOUT = float(os.getenv("ASSEMBLYAI_TIMEOUT", "10800"))
+# Повторы HTTP-запросов при 429/5xx и сетевых ошибках
+ASSEMBLYAI_RETRIES = int(os.getenv("ASSEMBLYAI_RETRIES", "5"))
+
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class AssemblyAIError(Exception):
+    """Ошибка AssemblyAI: транскрипция завершилась со статусом error или запрос не удался."""
+
+
+class AsyncAssemblyAIClient:
+    """
+    Асинхронный клиент AssemblyAI поверх одного httpx.AsyncClient.
+
+    Загрузка файла, постановка задачи и ожидание результата не блокируют event loop,
+    поэтому несколько встреч загружаются и опрашиваются одновременно. Статус опрашивается
+    с растущим интервалом, временные ошибки (429/5xx, сеть) повторяются с задержкой.
+    """
+
+    def __init__(self, api_key: str, base_url: str = ASSEMBLYAI_BASE_URL):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self._client = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"authorization": self.api_key or ""},
+                timeout=httpx.Timeout(60.0, write=600.0),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+            )
+        return self._client
+
+    async def _request(self, method: str, url: str, **kwargs) -> dict:
+        delay = 1.0
+        for attempt in range(1, ASSEMBLYAI_RETRIES + 1):
+            try:
+                response = await self._get_client().request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                reason = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                reason = str(e) or type(e).__name__
+            if attempt == ASSEMBLYAI_RETRIES or "content" in kwargs:
+                # Тело-поток повторно отправить нельзя — повтор делает upload()
+                raise AssemblyAIError(f"{method} {url}: {reason}")
+            logger.warning(f"[AssemblyAI] {method} {url}: {reason}, повтор через {delay:.0f}s")
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay = min(delay * 2, 60.0)
+
+    async def upload(self, path: str) -> str:
+        """Загружает файл потоком, не читая его целиком в память. Возвращает upload_url."""
+        async def chunks():
+            async with aiofiles.open(path, "rb") as f:
+                while True:
+                    chunk = await f.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        for attempt in range(1, ASSEMBLYAI_RETRIES + 1):
+            try:
+                result = await self._request("POST", "/v2/upload", content=chunks())
+                return result["upload_url"]
+            except AssemblyAIError as e:
+                if attempt == ASSEMBLYAI_RETRIES:
+                    raise
+                logger.warning(f"[AssemblyAI] Ошибка загрузки ({e}), повтор {attempt + 1}/{ASSEMBLYAI_RETRIES}")
+                await asyncio.sleep(2 ** attempt)
+
+    async def submit(self, audio_url: str, language: str, webhook_url: str = None) -> str:
+        """Ставит транскрипцию в очередь. Возвращает id транскрипции."""
+        payload = {"audio_url": audio_url, "language_code": language}
+        if webhook_url:
+            payload["webhook_url"] = webhook_url
+        result = await self._request("POST", "/v2/transcript", json=payload)
+        return result["id"]
+
+    async def get(self, transcript_id: str) -> dict:
+        return await self._request("GET", f"/v2/transcript/{transcript_id}")
+
+    async def wait(self, transcript_id: str, timeout: float = ASSEMBLYAI_TIMEOUT) -> dict:
+        """Ждёт завершения транскрипции, опрашивая статус с растущим интервалом."""
+        deadline = time.monotonic() + timeout
+        interval = ASSEMBLYAI_POLL_INTERVAL
+        while True:
+            transcript = await self.get(transcript_id)
+            status = transcript.get("status")
+            if status == "completed":
+                return transcript
+            if status == "error":
+                raise AssemblyAIError(transcript.get("error") or "unknown error")
+            if time.monotonic() + interval > deadline:
+                raise AssemblyAIError(f"Транскрипция {transcript_id} не готова за {timeout:.0f}s")
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, ASSEMBLYAI_MAX_POLL_INTERVAL)
+
+    async def transcribe(self, path: str, language: str):
+        """
+        Полный цикл: загрузка, постановка, ожидание.
+        Возвращает (full_text, words) — слова в SegmentTable (start, end, text, confidence), время в секундах.
+        """
+        upload_bytes = os.path.getsize(path)
+        logger.info(f"[AssemblyAI] Загружаем файл {path} на транскрипцию...")
+        upload_started = time.monotonic()
+        upload_url = await self.upload(path)
+        upload_seconds = time.monotonic() - upload_started
+        logger.info(
+            f"[AssemblyAI] Загружено {upload_bytes / 1024 / 1024:.1f} МБ ({os.path.splitext(path)[1]}) "
+            f"за {upload_seconds:.1f}s ({upload_bytes / 1024 / 1024 / max(upload_seconds, 1e-6):.2f} МБ/с)"
+        )
+
+        transcript_id = await self.submit(upload_url, language)
+        logger.info(f"[AssemblyAI] Транскрипция {transcript_id} поставлена в очередь")
+        transcript = await self.wait(transcript_id)
+
+        items = transcript.get("words") or []
+        words = SegmentTable.from_columns(
+            np.fromiter((w["start"] for w in items), dtype=np.float64, count=len(items)) / 1000.0,
+            np.fromiter((w["end"] for w in items), dtype=np.float64, count=len(items)) / 1000.0,
+            [w["text"] for w in items],
+            confidence=[w.get("confidence") for w in items]
+        )
+        return (transcript.get("text") or "").strip(), words
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_clients = {}
+
+
+def get_assemblyai_client(api_key: str) -> AsyncAssemblyAIClient:
+    """Общий клиент (и пул соединений) для всех задач с данным ключом."""
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = AsyncAssemblyAIClient(api_key)
+    return client
@@ -3,40 +3,96 @@ import subprocess
 import logging
 from pyannote.audio import Pipeline
 from core.logger import logger
+from core.segments import SegmentTable
 import uuid
 import sys
+import struct
+import tempfile
+import wave
+import numpy as np
+import torch
 
-def extract_audio(video_path: str, file_name) -> bool:
-    """Извлекаем аудио из видео с помощью ffmpeg"""
-    if sys.platform.startswith("win"):
-        FFMPEG_BIN = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bin", "ffmpeg.exe"))
-    else:
-        # Для Linux/macOS используем системный ffmpeg
-        FFMPEG_BIN = "/usr/bin/ffmpeg"  # Обычно установлен через apt/yum/brew
+SAMPLE_RATE = 16000
 
+# Формат файла для загрузки в ASR: wav (PCM, ~115 МБ/час), flac (без потерь) или opus (речь, в разы меньше)
+ASR_UPLOAD_FORMAT = os.getenv("ASR_UPLOAD_FORMAT", "flac").lower()
+# Битрейт Opus для речи
+ASR_OPUS_BITRATE = os.getenv("ASR_OPUS_BITRATE", "24k")
 
+# Длина кадра для оценки громкости (поиск пауз, VAD), секунды
+ENERGY_FRAME_SECONDS = 0.02
+
+UPLOAD_FORMATS = {
+    "flac": {"ext": ".flac", "args": ["-c:a", "flac", "-compression_level", "5"]},
+    "opus": {"ext": ".ogg", "args": ["-c:a", "libopus", "-b:a", ASR_OPUS_BITRATE, "-application", "voip"]},
+}
+
+
+# путь к ffmpeg.exe в проекте
+if sys.platform.startswith("win"):
+    FFMPEG_BIN = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bin", "ffmpeg.exe"))
+else:
+    # Для Linux/macOS используем системный ffmpeg
+    FFMPEG_BIN = "/usr/bin/ffmpeg"  # Обычно установлен через apt/yum/brew
+
+
+def _audio_path(file_name, temp_dir: str = None) -> str:
     file_name = os.path.splitext(file_name)[0]
 
-    # Папка для временных файлов внутри проекта
-    temp_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "temp"))
+    # Папка для временных файлов (по умолчанию temp/ внутри проекта)
+    if temp_dir is None:
+        temp_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "temp"))
     os.makedirs(temp_dir, exist_ok=True)  # создаём папку, если её нет
 
     # Уникальное имя временного аудиофайла
-    temp_filename = f"audio_{file_name}.wav"
-    audio_path = os.path.join(temp_dir, temp_filename)
+    return os.path.join(temp_dir, f"audio_{file_name}.wav")
+
+
+def upload_audio_path(audio_path: str, upload_format: str = None) -> str:
+    """
+    Путь к сжатой копии аудио для загрузки в ASR, которую extract_audio пишет рядом с WAV.
+    Для формата wav загружается сам WAV.
+    """
+    upload_format = upload_format or ASR_UPLOAD_FORMAT
+    if upload_format not in UPLOAD_FORMATS:
+        return audio_path
+    return os.path.splitext(audio_path)[0] + UPLOAD_FORMATS[upload_format]["ext"]
+
+
+def _extract_command(source: str, audio_path: str) -> list:
+    """
+    Команда единственного прохода ffmpeg: аудио сразу в том виде,
+    который нужен и диаризации, и ASR:
+    - PCM16, моно, 16kHz
+    - Нормализует громкость
+    - Подавляет шум (basic noise reduction)
+    Если задан сжатый формат загрузки (ASR_UPLOAD_FORMAT), тот же декодированный и очищенный
+    поток дополнительно кодируется в FLAC/Opus вторым выходом той же команды.
+    """
+    audio_filter = f"aresample={SAMPLE_RATE},volume=1.0,afftdn"  # ресемплинг, нормализация, шумоподавление
+    pcm_args = ["-acodec", "pcm_s16le", "-ar", str(SAMPLE_RATE), "-ac", "1"]
+
+    upload = UPLOAD_FORMATS.get(ASR_UPLOAD_FORMAT)
+    if upload is None:
+        return [FFMPEG_BIN, "-y", "-i", source, "-vn", "-af", audio_filter, *pcm_args, audio_path]
+
+    return [
+        FFMPEG_BIN,
+        "-y",
+        "-i", source,
+        "-filter_complex", f"[0:a]{audio_filter},asplit=2[pcm][upload]",
+        "-map", "[pcm]", *pcm_args, audio_path,
+        "-map", "[upload]", *upload["args"], "-ar", str(SAMPLE_RATE), "-ac", "1",
+        upload_audio_path(audio_path)
+    ]
+
+
+def extract_audio(video_path: str, file_name, temp_dir: str = None) -> bool:
+    """Извлекаем аудио из видео с помощью ffmpeg (единственное декодирование медиафайла)"""
+    audio_path = _audio_path(file_name, temp_dir)
 
     try:
-        command = [
-            FFMPEG_BIN,
-            "-y",
-            "-i", video_path,
-            "-vn",
-            "-acodec", "pcm_s16le",
-            "-ar", "16000",
-            "-ac", "1",
-            audio_path
-        ]
-        subprocess.run(command, check=True)
+        subprocess.run(_extract_command(video_path, audio_path), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         logger.info(f"Аудио успешно извлечено: {audio_path}")
         return audio_path
     except subprocess.CalledProcessError as e:
@@ -44,69 +100,249 @@ def extract_audio(video_path: str, file_name) -> bool:
         return False
 
 
-def diarize_audio(audio_path: str):
+def extract_audio_stream(feed, file_name, temp_dir: str = None) -> bool:
+    """
+    Извлекаем аудио, подавая медиафайл в stdin ffmpeg по мере поступления байтов.
+    feed(sink) — функция, которая пишет данные в sink (file-like) и возвращает True при успехе,
+    например скачивание с Google Drive. Видео на диск не сохраняется.
+    """
+    audio_path = _audio_path(file_name, temp_dir)
+
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            _extract_command("pipe:0", audio_path),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr
+        )
+        fed = False
+        try:
+            fed = feed(process.stdin)
+        except BrokenPipeError:
+            # ffmpeg завершился раньше — причина будет в его stderr
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = process.wait()
+
+        if fed and returncode == 0:
+            logger.info(f"Аудио успешно извлечено из потока: {audio_path}")
+            return audio_path
+
+        stderr.seek(0)
+        tail = stderr.read()[-500:].decode("utf-8", errors="replace")
+        logger.error(f"[Audio] Ошибка извлечения аудио из потока (код {returncode}): {tail}")
+
+    for path in {audio_path, upload_audio_path(audio_path)}:
+        if os.path.exists(path):
+            os.remove(path)
+    return False
+
+
+def load_waveform(audio_path: str):
     """
-    Диаризация аудио с использованием pyannote.audio 3.x и TorchCodec.
-    Возвращает список сегментов [{'start', 'end', 'speaker'}, ...].
-    Временный файл подготовленного аудио удаляется после работы.
+    Отображает PCM16 WAV в память без чтения файла целиком.
+    Возвращает (samples: np.memmap[int16], sample_rate).
     """
+    with open(audio_path, "rb") as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"Не WAV файл: {audio_path}")
+
+        sample_rate = None
+        channels = bits = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"В WAV нет блока data: {audio_path}")
+            chunk_id = chunk[:4]
+            chunk_size = struct.unpack("<I", chunk[4:])[0]
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                _, channels, sample_rate = struct.unpack("<HHI", fmt[:8])
+                bits = struct.unpack("<H", fmt[14:16])[0]
+                f.seek(chunk_size % 2, 1)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                # Блоки выравниваются по чётной границе
+                f.seek(chunk_size + chunk_size % 2, 1)
 
-    # Подготовка аудио через ffmpeg
-    prepared_path = os.path.join(os.path.dirname(audio_path), "_prepared_audio.wav")
+    if channels != 1 or bits != 16:
+        raise ValueError(f"Ожидается моно PCM16, получено: каналов {channels}, бит {bits}")
 
-    if sys.platform.startswith("win"):
-        FFMPEG_BIN = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bin", "ffmpeg.exe"))
-    else:
-        FFMPEG_BIN = "/usr/bin/ffmpeg"
+    # ffmpeg при записи в pipe не знает размер заранее и пишет 0/0xFFFFFFFF — берём размер из файла
+    file_data_size = os.path.getsize(audio_path) - offset
+    data_size = file_data_size if chunk_size in (0, 0xFFFFFFFF) else min(chunk_size, file_data_size)
+    samples = np.memmap(audio_path, dtype="<i2", mode="r", offset=offset, shape=(data_size // 2,))
+    return samples, sample_rate
+
+
+def frame_energy(samples, sample_rate: int, frame_seconds: float = ENERGY_FRAME_SECONDS, block_frames: int = 50000):
+    """
+    Средняя энергия (RMS) по кадрам frame_seconds.
+    memmap читается блоками, поэтому многочасовая запись не загружается в память целиком.
+    """
+    frame = max(1, int(sample_rate * frame_seconds))
+    count = len(samples) // frame
+    energy = np.empty(count, dtype=np.float32)
+    for first in range(0, count, block_frames):
+        last = min(count, first + block_frames)
+        block = np.asarray(samples[first * frame:last * frame], dtype=np.float32).reshape(-1, frame)
+        energy[first:last] = np.sqrt(np.mean(block * block, axis=1))
+    return energy
 
+
+def write_audio_slice(samples, sample_rate: int, start: float, end: float, output_path: str, upload_format: str = None):
+    """
+    Вырезает [start, end) секунд из уже загруженного (memmap) PCM16 без повторного декодирования исходника.
+    Для flac/opus срез подаётся в stdin ffmpeg и сразу кодируется, для wav пишется как есть.
+    Возвращает путь к записанному файлу или False.
+    """
+    first = max(0, int(start * sample_rate))
+    last = min(len(samples), int(end * sample_rate))
+    pcm = np.ascontiguousarray(samples[first:last], dtype="<i2").tobytes()
+
+    upload = UPLOAD_FORMATS.get(upload_format)
+    if upload is None:
+        output_path = os.path.splitext(output_path)[0] + ".wav"
+        with wave.open(output_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(pcm)
+        return output_path
+
+    output_path = os.path.splitext(output_path)[0] + upload["ext"]
     command = [
-        FFMPEG_BIN,
-        "-y",
-        "-i", audio_path,
-        "-af", "aresample=16000,volume=1.0,afftdn",
-        "-ac", "1",
-        "-c:a", "pcm_s16le",
-        prepared_path
+        FFMPEG_BIN, "-y",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *upload["args"], output_path
     ]
     try:
-        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        logger.info(f"[Diarization] Аудио успешно подготовлено: {prepared_path}")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"[Diarization] Ошибка при подготовке аудио: {e}")
-        return []
+        subprocess.run(command, input=pcm, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return output_path
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.error(f"[Audio] Ошибка кодирования фрагмента {output_path}: {e}")
+        return False
 
-    try:
-        # Отключаем предупреждения о симлинках Hugging Face
-        os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
-
-        # Загружаем пайплайн диаризации без фиктивного тега версии
-        # Можно указать конкретный commit hash, если нужна стабильная версия
-        pipeline = Pipeline.from_pretrained(
-            "pyannote/speaker-diarization",
-            use_auth_token=os.getenv("HF_TOKEN")
+
+def write_speech_audio(samples, sample_rate: int, regions: list, output_path: str, upload_format: str = None):
+    """
+    Склеивает участки речи [(start, end), ...] (секунды) в новый WAV.
+    Участки копируются из memmap по одному; если задан сжатый формат загрузки, те же байты
+    параллельно подаются в stdin ffmpeg, и сжатая копия получается за тот же проход.
+    Возвращает путь к WAV или False.
+    """
+    upload = UPLOAD_FORMATS.get(upload_format or ASR_UPLOAD_FORMAT)
+    encoder = None
+    if upload is not None:
+        encoder = subprocess.Popen(
+            [
+                FFMPEG_BIN, "-y",
+                "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+                *upload["args"], upload_audio_path(output_path, upload_format)
+            ],
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
         )
 
-        # Диаризация
-        diarization = pipeline(prepared_path)
+    feeding = encoder is not None
+    try:
+        with wave.open(output_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            for start, end in regions:
+                first = max(0, int(start * sample_rate))
+                last = min(len(samples), int(end * sample_rate))
+                pcm = np.ascontiguousarray(samples[first:last], dtype="<i2").tobytes()
+                f.writeframes(pcm)
+                if feeding:
+                    try:
+                        encoder.stdin.write(pcm)
+                    except BrokenPipeError:
+                        # Кодировщик завершился раньше времени — WAV дописываем без него
+                        feeding = False
+    except (OSError, ValueError) as e:
+        logger.error(f"[Audio] Ошибка записи участков речи в {output_path}: {e}")
+        if encoder is not None:
+            encoder.kill()
+        return False
+    finally:
+        if encoder is not None:
+            try:
+                encoder.stdin.close()
+            except BrokenPipeError:
+                pass
 
-        segments = [
-            {"start": float(turn.start), "end": float(turn.end), "speaker": str(speaker)}
-            for turn, _, speaker in diarization.itertracks(yield_label=True)
-        ]
+    if encoder is not None and (encoder.wait() != 0 or not feeding):
+        # Без сжатой копии ASR загрузит сам WAV
+        logger.warning(f"[Audio] Не удалось закодировать сжатую копию {output_path}, будет загружен WAV")
+        upload_copy = upload_audio_path(output_path, upload_format)
+        if os.path.exists(upload_copy):
+            os.remove(upload_copy)
+    return output_path
 
-        num_speakers = len(set(seg['speaker'] for seg in segments))
-        logger.info(f"[Diarization] Аудио разбито на {num_speakers} спикеров")
+
+def load_diarization_pipeline(model: str = "pyannote/speaker-diarization", offline: bool = False):
+    """
+    Загружает пайплайн диаризации pyannote.
+    model — имя модели на Hugging Face или путь к локальному config.yaml.
+    offline=True — только локальные файлы/кэш, без обращений к Hugging Face.
+    """
+    # Отключаем предупреждения о симлинках Hugging Face
+    os.environ["HF_HUB_DISABLE_SYMLINKS_WARNING"] = "1"
+    if offline:
+        # huggingface_hub читает HF_HUB_OFFLINE один раз при импорте (он уже импортирован вместе с pyannote),
+        # поэтому переключаем флаг в его константах; переменная окружения — для дочерних процессов
+        import huggingface_hub.constants
+        huggingface_hub.constants.HF_HUB_OFFLINE = True
+        os.environ["HF_HUB_OFFLINE"] = "1"
+
+    # Загружаем пайплайн диаризации без фиктивного тега версии
+    # Можно указать конкретный commit hash, если нужна стабильная версия.
+    # Токен нужен и офлайн: закрытая модель из кэша загружается с теми же параметрами
+    return Pipeline.from_pretrained(
+        model,
+        use_auth_token=os.getenv("HF_TOKEN")
+    )
+
+
+def diarize_audio(audio_path: str, pipeline=None):
+    """
+    Диаризация аудио с использованием pyannote.audio 3.x.
+    audio_path — уже подготовленный extract_audio WAV (16kHz моно, с шумоподавлением);
+    он отображается в память и передаётся в pyannote как waveform без повторного декодирования.
+    Возвращает SegmentTable сегментов (start, end, speaker).
+    pipeline — уже загруженный пайплайн; если не передан, загружается заново.
+    """
+
+    try:
+        if pipeline is None:
+            pipeline = load_diarization_pipeline()
+
+        samples, sample_rate = load_waveform(audio_path)
+        waveform = samples.astype(np.float32)
+        waveform *= 1.0 / 32768.0
+        del samples
+
+        # Диаризация
+        diarization = pipeline({"waveform": torch.from_numpy(waveform).unsqueeze(0), "sample_rate": sample_rate})
+        tracks = list(diarization.itertracks(yield_label=True))
+        segments = SegmentTable.from_columns(
+            [float(turn.start) for turn, _, _ in tracks],
+            [float(turn.end) for turn, _, _ in tracks],
+            [""] * len(tracks),
+            [str(speaker) for _, _, speaker in tracks]
+        )
+
+        logger.info(f"[Diarization] Аудио разбито на {len(segments.speakers)} спикеров")
 
         return segments
 
     except Exception as e:
         logger.error(f"[Diarization] Ошибка разметки спикеров: {e}")
-        return []
+        return SegmentTable.empty()
 
-    finally:
-        # Удаляем временный файл
-        if os.path.exists(prepared_path):
-            try:
-                os.remove(prepared_path)
-            except Exception as e:
-                logger.warning(f"[Diarization] Не удалось удалить временный файл {prepared_path}: {e}")
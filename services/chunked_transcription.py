@@ -0,0 +1,182 @@
+import asyncio
+import os
+import re
+import shutil
+import time
+import numpy as np
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+from services.audio_service import load_waveform, frame_energy, write_audio_slice, ASR_UPLOAD_FORMAT, ENERGY_FRAME_SECONDS
+
+load_dotenv()
+
+# Резать длинные записи на фрагменты и транскрибировать их параллельно
+ASR_CHUNKING = os.getenv("ASR_CHUNKING", "0").lower() in ("1", "true", "yes")
+# Целевая длина фрагмента, секунды
+ASR_CHUNK_SECONDS = float(os.getenv("ASR_CHUNK_SECONDS", "600"))
+# Насколько далеко от целевой точки искать паузу для разреза, секунды
+ASR_CHUNK_SEARCH_SECONDS = float(os.getenv("ASR_CHUNK_SEARCH_SECONDS", "30"))
+# Перекрытие соседних фрагментов, секунды (слово на границе попадает целиком хотя бы в один фрагмент)
+ASR_CHUNK_OVERLAP_SECONDS = float(os.getenv("ASR_CHUNK_OVERLAP_SECONDS", "2"))
+# Сколько фрагментов одной записи транскрибируется одновременно
+ASR_CHUNK_CONCURRENCY = int(os.getenv("ASR_CHUNK_CONCURRENCY", "4"))
+
+def chunking_config() -> dict:
+    """Параметры нарезки, влияющие на результат (входят в ключ кэша транскрипции)."""
+    if not ASR_CHUNKING:
+        return {"chunking": None}
+    return {"chunking": {
+        "seconds": ASR_CHUNK_SECONDS,
+        "search": ASR_CHUNK_SEARCH_SECONDS,
+        "overlap": ASR_CHUNK_OVERLAP_SECONDS,
+    }}
+
+
+def find_cut_points(energy, frame_seconds: float, duration: float,
+                    chunk_seconds: float = ASR_CHUNK_SECONDS, search_seconds: float = ASR_CHUNK_SEARCH_SECONDS) -> list:
+    """
+    Точки разреза (секунды): около каждой целевой границы берётся самый тихий участок в окне ±search_seconds.
+    Энергия сглаживается по ~0.3 с, чтобы разрез попадал в паузу, а не в короткий провал внутри слова.
+    """
+    if duration <= chunk_seconds * 1.5 or len(energy) == 0:
+        return []
+
+    window = max(1, int(0.3 / frame_seconds))
+    smooth = np.convolve(energy, np.ones(window, dtype=np.float32) / window, mode="same")
+
+    cuts = []
+    previous = 0.0
+    target = chunk_seconds
+    while duration - target > chunk_seconds * 0.5:
+        low = max(previous + chunk_seconds * 0.5, target - search_seconds)
+        high = min(duration - chunk_seconds * 0.5, target + search_seconds)
+        first, last = int(low / frame_seconds), int(high / frame_seconds)
+        if last <= first:
+            cut = target
+        else:
+            cut = (first + int(np.argmin(smooth[first:last]))) * frame_seconds + frame_seconds / 2
+        cuts.append(round(cut, 3))
+        previous = cut
+        target = cut + chunk_seconds
+    return cuts
+
+
+def plan_chunks(duration: float, cuts: list, overlap: float = ASR_CHUNK_OVERLAP_SECONDS) -> list:
+    """
+    Фрагменты [{"start", "end", "own_start", "own_end"}]: start/end — что отправляется в ASR (с перекрытием),
+    own_start/own_end — участок между разрезами, за слова которого отвечает этот фрагмент.
+    """
+    bounds = [0.0, *cuts, duration]
+    chunks = []
+    for own_start, own_end in zip(bounds, bounds[1:]):
+        chunks.append({
+            "start": max(0.0, own_start - overlap),
+            "end": min(duration, own_end + overlap),
+            "own_start": own_start,
+            "own_end": own_end,
+        })
+    return chunks
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"[^\w]+", "", (text or "").lower())
+
+
+def stitch_words(chunks: list, chunk_words: list) -> SegmentTable:
+    """
+    Склеивает слова фрагментов (SegmentTable) в общую шкалу времени.
+
+    Времена сдвигаются на начало фрагмента; из каждого фрагмента берутся только слова,
+    середина которых лежит в его собственном участке, поэтому слова из зоны перекрытия не дублируются.
+    Если ASR по-разному разметил одно и то же слово у разреза, повтор с тем же текстом
+    и пересекающимся временем отбрасывается.
+    """
+    parts = []
+    for chunk, words in zip(chunks, chunk_words):
+        words = SegmentTable.coerce(words)
+        starts = words.starts + chunk["start"]
+        ends = words.ends + chunk["start"]
+        middles = (starts + ends) / 2
+        keep = middles >= chunk["own_start"]
+        if chunk is not chunks[-1]:
+            keep &= middles < chunk["own_end"]
+        parts.append(words.with_times(np.round(starts, 3), np.round(ends, 3)).take(keep))
+    words = SegmentTable.concat(parts)
+
+    # Повторы возможны только на стыках фрагментов — проверяем лишь пересекающиеся соседние слова
+    overlapping = np.flatnonzero(words.starts[1:] < words.ends[:-1]) + 1
+    if not len(overlapping):
+        return words
+    keep = np.ones(len(words), dtype=bool)
+    for index in overlapping.tolist():
+        previous = index - 1
+        while not keep[previous]:
+            previous -= 1
+        if words.starts[index] < words.ends[previous] and _normalize(words.text_at(index)) == _normalize(words.text_at(previous)):
+            keep[index] = False
+    return words.take(keep)
+
+
+async def transcribe_chunked(audio_path: str, transcribe_file, upload_format: str = None,
+                             chunk_seconds: float = None, concurrency: int = None):
+    """
+    Транскрибирует длинную запись параллельными фрагментами.
+
+    transcribe_file(path) — корутина, возвращающая (text, words) для одного файла (времена относительно его начала).
+    Фрагменты вырезаются из memmap без повторного декодирования и удаляются после загрузки.
+    Возвращает (full_text, words) или None, если запись слишком короткая для нарезки.
+    """
+    upload_format = upload_format or ASR_UPLOAD_FORMAT
+    chunk_seconds = chunk_seconds or ASR_CHUNK_SECONDS
+    concurrency = concurrency or ASR_CHUNK_CONCURRENCY
+    samples, sample_rate = load_waveform(audio_path)
+    duration = len(samples) / sample_rate
+
+    energy = await asyncio.to_thread(frame_energy, samples, sample_rate)
+    cuts = find_cut_points(energy, ENERGY_FRAME_SECONDS, duration, chunk_seconds)
+    if not cuts:
+        return None
+
+    chunks = plan_chunks(duration, cuts)
+    chunk_dir = os.path.join(os.path.dirname(audio_path), "chunks_" + os.path.splitext(os.path.basename(audio_path))[0])
+    os.makedirs(chunk_dir, exist_ok=True)
+    logger.info(
+        f"[ASR] {os.path.basename(audio_path)}: {duration / 60:.1f} мин, {len(chunks)} фрагментов, "
+        f"разрезы {[round(c) for c in cuts]}"
+    )
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    started = time.monotonic()
+
+    async def run(index, chunk):
+        async with semaphore:
+            path = await asyncio.to_thread(
+                write_audio_slice, samples, sample_rate, chunk["start"], chunk["end"],
+                os.path.join(chunk_dir, f"chunk_{index:03d}"), upload_format
+            )
+            if not path:
+                raise RuntimeError(f"Не удалось подготовить фрагмент {index}")
+            try:
+                text, words = await transcribe_file(path)
+            finally:
+                os.remove(path)
+            if not words and chunk["end"] - chunk["start"] > ASR_CHUNK_OVERLAP_SECONDS * 4:
+                logger.warning(f"[ASR] Фрагмент {index} ({chunk['start']:.0f}-{chunk['end']:.0f}s) без слов")
+            logger.info(
+                f"[ASR] Фрагмент {index + 1}/{len(chunks)} готов: {len(words)} слов, "
+                f"{time.monotonic() - started:.1f}s с начала"
+            )
+            return words
+
+    try:
+        # Дожидаемся всех фрагментов, даже если один упал, — иначе остальные писали бы в удалённую папку
+        chunk_words = await asyncio.gather(*(run(i, chunk) for i, chunk in enumerate(chunks)), return_exceptions=True)
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    for result in chunk_words:
+        if isinstance(result, BaseException):
+            raise result
+
+    words = stitch_words(chunks, chunk_words)
+    return words.text_range(0, len(words)), words
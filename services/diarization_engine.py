@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+
+load_dotenv()
+
+# Количество долгоживущих процессов с загруженным пайплайном
+DIARIZATION_WORKERS = int(os.getenv("DIARIZATION_WORKERS", "1"))
+# Потоков torch на один процесс (0 — оставить значение torch по умолчанию)
+DIARIZATION_THREADS = int(os.getenv("DIARIZATION_THREADS", "0"))
+# Имя модели на Hugging Face или путь к локальному config.yaml
+DIARIZATION_MODEL = os.getenv("DIARIZATION_MODEL", "pyannote/speaker-diarization")
+# Загружать модель только из локальных файлов/кэша
+DIARIZATION_OFFLINE = os.getenv("DIARIZATION_OFFLINE", "0").lower() in ("1", "true", "yes")
+
+# Пайплайн, загруженный в текущем процессе пула
+_pipeline = None
+
+
+def _init_worker(model: str, threads: int, offline: bool):
+    """Инициализатор процесса пула: настраивает потоки torch и один раз загружает пайплайн."""
+    global _pipeline
+    import torch
+    from services.audio_service import load_diarization_pipeline
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass
+
+    _pipeline = load_diarization_pipeline(model, offline=offline)
+    logger.info(f"[Diarization] Пайплайн {model} загружен в процесс {os.getpid()}")
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _diarize_in_worker(audio_path: str):
+    from services.audio_service import diarize_audio, load_waveform
+    from services.windowed_diarization import diarize_windowed, use_windowed
+
+    samples, sample_rate = load_waveform(audio_path)
+    if not use_windowed(len(samples) / sample_rate):
+        return diarize_audio(audio_path, pipeline=_pipeline)
+
+    # Многочасовые записи — окнами, чтобы память не росла с длительностью
+    try:
+        return diarize_windowed(audio_path, _pipeline)
+    except Exception as e:
+        logger.error(f"[Diarization] Ошибка оконной диаризации: {e}")
+        return SegmentTable.empty()
+
+
+class DiarizationEngine:
+    """
+    Пул процессов с прогретым пайплайном pyannote.
+
+    Пайплайн загружается один раз при старте каждого процесса и переиспользуется
+    для всех задач, которые в него попадают. Если процесс упал (например, по памяти),
+    пул пересоздаётся при следующем обращении. Процессы запускаются через spawn —
+    всё нужное загружает _init_worker.
+    """
+
+    def __init__(
+        self,
+        workers: int = DIARIZATION_WORKERS,
+        threads: int = DIARIZATION_THREADS,
+        model: str = DIARIZATION_MODEL,
+        offline: bool = DIARIZATION_OFFLINE
+    ):
+        self.workers = max(1, workers)
+        self.threads = threads
+        self.model = model
+        self.offline = offline
+        self._executor = None
+
+    def config(self) -> dict:
+        """Параметры, от которых зависит результат (входят в ключ кэша диаризации)."""
+        from services.windowed_diarization import windowed_config
+        return {"model": self.model, **windowed_config()}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, а не fork: пул пересоздаётся посреди работы, когда в процессе уже живут потоки
+            # (пул asyncio, faster-whisper) и загружен torch — fork мог унести их захваченные блокировки
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model, self.threads, self.offline)
+            )
+        return self._executor
+
+    def _reset(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warm_up(self):
+        """Запускает процессы пула заранее, чтобы первая встреча не ждала загрузки модели."""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            pids = await asyncio.gather(*[
+                loop.run_in_executor(executor, _ping) for _ in range(self.workers)
+            ])
+            logger.info(f"[Diarization] Пул прогрет, процессы: {sorted(set(pids))}")
+        except BrokenProcessPool as e:
+            logger.error(f"[Diarization] Не удалось запустить пул диаризации: {e}")
+            self._reset()
+
+    async def diarize(self, audio_path: str) -> SegmentTable:
+        """Диаризация в одном из процессов пула. Возвращает SegmentTable сегментов (start, end, speaker)."""
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), _diarize_in_worker, audio_path)
+        except BrokenProcessPool as e:
+            logger.error(f"[Diarization] Процесс пула аварийно завершился: {e}")
+            self._reset()
+            raise
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+_engine = None
+
+
+def get_diarization_engine() -> DiarizationEngine:
+    """Общий для воркера пул диаризации (создаётся при первом обращении)."""
+    global _engine
+    if _engine is None:
+        _engine = DiarizationEngine()
+    return _engine
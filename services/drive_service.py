@@ -1,11 +1,9 @@
-import logging
 from io import BytesIO
 from core.logger import logger
 from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload, MediaIoBaseUpload
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from core.utils import get_env_file_path, safe_execute
+from core.utils import get_env_file_path
 import os
 from dotenv import load_dotenv
 import tempfile
@@ -16,11 +14,10 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 import pickle
 from typing import List, Dict
 import base64
-import requests
+from services.google_clients import get_drive_client, get_http_session
 
 load_dotenv()
 
-SERVICE_ACCOUNT_JSON = get_env_file_path("SERVICE_ACCOUNT_FILE")
 # Права доступа
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
@@ -30,52 +27,63 @@ CORE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "core")
 TOKEN_FILE = os.path.join(CORE_DIR, "token.pickle")
 logger.info(TOKEN_FILE)
 
+# Размер куска при скачивании файлов с Drive, МБ
+DRIVE_CHUNK_SIZE = int(float(os.getenv("DRIVE_CHUNK_SIZE_MB", "16")) * 1024 * 1024)
+
 
 def get_drive_service():
-    """Создаём клиент Google Drive API"""
+    """Клиент Google Drive API (общие учётные данные, свой клиент на поток)"""
     try:
-        creds = service_account.Credentials.from_service_account_file(
-            SERVICE_ACCOUNT_JSON,
-        scopes=["https://www.googleapis.com/auth/drive"]
-        )
-        service = build("drive", "v3", credentials=creds)
-        return service
+        return get_drive_client()
     except Exception as e:
         logger.error(f"[Drive] Ошибка создания сервиса: {e}")
         return None
 
 
-def list_files_in_folder(service, folder_id: str):
-    """Получить список файлов в папке Google Drive, используя существующий сервис"""
+FILE_FIELDS = "id, name, mimeType, size, modifiedTime, parents, trashed"
+# Сколько файлов запрашивать за одну страницу (максимум Drive API — 1000)
+DRIVE_PAGE_SIZE = int(os.getenv("DRIVE_PAGE_SIZE", "1000"))
+
+
+def list_files_in_folder(service, folder_id: str, modified_after: str = None, raise_errors: bool = False):
+    """
+    Получить список файлов в папке Google Drive, используя существующий сервис.
+    Проходит все страницы ответа (nextPageToken).
+    modified_after — RFC 3339 время; если задано, возвращаются только файлы, изменённые позже.
+    raise_errors — пробрасывать ошибки вместо пустого списка (когда пустую папку нужно отличать от сбоя).
+    """
     try:
         if not service:
-            logging.error("[Drive] Сервис не инициализирован")
-            return []
+            raise RuntimeError("Сервис не инициализирован")
         query = f"'{folder_id}' in parents and trashed = false"
-        results = service.files().list(q=query, fields="files(id, name, mimeType)").execute()
-        return results.get("files", [])
+        if modified_after:
+            query += f" and modifiedTime > '{modified_after}'"
+
+        files = []
+        page_token = None
+        while True:
+            results = service.files().list(
+                q=query,
+                pageSize=DRIVE_PAGE_SIZE,
+                pageToken=page_token,
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True
+            ).execute()
+            files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return files
     except Exception as e:
         logger.error(f"[Drive] Ошибка при получении файлов: {e}")
+        if raise_errors:
+            raise
         return []
 
 
-def find_matching_transcription(service, transcription_folder_id: str, base_filename: str):
-    """
-    Ищет файл в папке транскрипций, у которого совпадает имя без расширения.
-    """
-    files = safe_execute(list_files_in_folder, service, transcription_folder_id)
-    if not files:
-        return None
+def is_transcription_file(f: dict) -> bool:
+    return f.get("mimeType", "") == "text/vtt" or f.get("name", "").lower().endswith(".vtt")
 
-    for f in files:
-        mime = f.get("mimeType", "")
-        name = f.get("name", "").lower()
-        name_without_ext = os.path.splitext(f["name"])[0]
-        if mime != "text/vtt" and not name.endswith(".vtt"):
-            continue
-        if name_without_ext == base_filename:
-            return f
-    return None
 
 def get_file_link(file_id: str) -> str:
     """
@@ -121,19 +129,34 @@ def get_drive_service_oauth2():
     return service
 
 
-def download_file_to_path(file_id: str, destination_path: str):
+def download_file_to_path(file_id: str, destination_path: str, chunk_size: int = DRIVE_CHUNK_SIZE):
     """Скачивает файл с Google Drive по ID в указанный путь"""
     try:
         # Создаём директорию, если её нет
         os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+        with open(destination_path, "wb") as f:
+            return stream_file_to(file_id, f, chunk_size)
+    except Exception as e:
+        logger.error(f"[Drive] Ошибка скачивания файла {file_id}: {e}")
+        return False
+
+
+def stream_file_to(file_id: str, sink, chunk_size: int = DRIVE_CHUNK_SIZE):
+    """
+    Скачивает файл с Google Drive кусками по chunk_size байт и пишет их в sink
+    (любой объект с write — файл, stdin процесса ffmpeg и т.п.) сразу по мере получения.
+    """
+    try:
         service = get_drive_service()
         request = service.files().get_media(fileId=file_id)
-        with open(destination_path, "wb") as f:
-            downloader = MediaIoBaseDownload(f, request)
-            done = False
-            while not done:
-                status, done = downloader.next_chunk()
+        downloader = MediaIoBaseDownload(sink, request, chunksize=chunk_size)
+        done = False
+        while not done:
+            status, done = downloader.next_chunk()
         return True
+    except BrokenPipeError:
+        # Получатель (ffmpeg) закрыл поток — ошибку обрабатывает вызывающий код
+        raise
     except Exception as e:
         logger.error(f"[Drive] Ошибка скачивания файла {file_id}: {e}")
         return False
@@ -197,11 +220,12 @@ def download_file_to_path(file_id: str, destination_path: str):
 # Настройки для Apps Script
 APPS_SCRIPT_URL = os.getenv("APPS_SCRIPT_URL")
 SECRET_KEY = os.getenv("SECRET_KEY")
+APPS_SCRIPT_TIMEOUT = int(os.getenv("APPS_SCRIPT_TIMEOUT", "300"))
 def save_transcription_to_drive(speaker_text, folder_id, base_filename=None):
     """
     Сохраняет транскрипцию со спикерами в DOCX и загружает в Google Drive через Apps Script.
     Параметры:
-        speaker_text: список секций {'start', 'end', 'speaker', 'text'}
+        speaker_text: SegmentTable или список секций {'start', 'end', 'speaker', 'text'}
         folder_id: ID папки для записи (обычно ключ папки, который использует Apps Script)
         base_filename: имя файла без расширения
     """
@@ -241,7 +265,7 @@ def save_transcription_to_drive(speaker_text, folder_id, base_filename=None):
             "content_b64": file_b64
         }
 
-        response = requests.post(APPS_SCRIPT_URL, json=payload)
+        response = get_http_session().post(APPS_SCRIPT_URL, json=payload, timeout=APPS_SCRIPT_TIMEOUT)
         result = response.json()
 
         if not result.get("success"):
@@ -0,0 +1,144 @@
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+from core.logger import logger
+from core.utils import get_state_dir
+from services.drive_service import DRIVE_PAGE_SIZE, FILE_FIELDS, get_drive_service, list_files_in_folder
+
+load_dotenv()
+
+# "changes" — лента изменений Drive (changes.list), "list" — постраничный список с modifiedTime > last_seen
+DRIVE_WATCH_MODE = os.getenv("DRIVE_WATCH_MODE", "changes")
+# Запас по времени для списка по modifiedTime (задержка индексации Drive, расхождение часов), секунды
+DRIVE_LIST_OVERLAP_SECONDS = int(os.getenv("DRIVE_LIST_OVERLAP_SECONDS", "120"))
+
+
+def _rfc3339(dt: datetime) -> str:
+    dt = dt.astimezone(timezone.utc)
+    # Формат как у Drive (миллисекунды), чтобы строки можно было сравнивать напрямую
+    return f"{dt:%Y-%m-%dT%H:%M:%S}.{dt.microsecond // 1000:03d}Z"
+
+
+def _parse_rfc3339(value: str) -> datetime:
+    return datetime.strptime(value.replace("Z", "+0000"), "%Y-%m-%dT%H:%M:%S.%f%z")
+
+
+class DriveChangeWatcher:
+    """
+    Инкрементальное отслеживание новых файлов в папках Google Drive.
+
+    Основной режим — changes.list с page token, который сохраняется на диск,
+    поэтому после перезапуска воркер продолжает с того же места.
+    Если лента изменений недоступна, используется постраничный список файлов папок
+    с фильтром modifiedTime > last_seen.
+
+    poll() возвращает {folder_id: [file, ...]} — файлы, появившиеся или изменённые
+    с прошлого вызова. Первый вызов только фиксирует начальную точку (как снапшот папки).
+    """
+
+    def __init__(self, folder_ids, name: str = "drive", mode: str = DRIVE_WATCH_MODE, service_factory=get_drive_service):
+        self.folder_ids = list(folder_ids)
+        self.mode = mode
+        self.service_factory = service_factory
+        self.state_path = os.path.join(get_state_dir(), f"{name}_watch.json")
+        self.state = self._load_state()
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"[DriveWatch] Не удалось прочитать {self.state_path}: {e}")
+            return {}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def poll(self) -> dict:
+        """Новые/изменённые файлы по папкам с прошлого вызова (блокирующий вызов)."""
+        service = self.service_factory()
+        if not service:
+            logger.error("[DriveWatch] Сервис не инициализирован")
+            return {}
+
+        if self.mode == "changes":
+            try:
+                return self._poll_changes(service)
+            except Exception as e:
+                logger.warning(f"[DriveWatch] Лента изменений недоступна, переходим на список файлов: {e}")
+                self.state.pop("page_token", None)
+                self.mode = "list"
+        return self._poll_list(service)
+
+    def _poll_changes(self, service) -> dict:
+        page_token = self.state.get("page_token")
+        if not page_token:
+            response = service.changes().getStartPageToken(supportsAllDrives=True).execute()
+            self.state["page_token"] = response["startPageToken"]
+            # Точка отсчёта и для резервного режима со списком файлов
+            now = _rfc3339(datetime.now(timezone.utc))
+            self.state["last_seen"] = {folder_id: now for folder_id in self.folder_ids}
+            self._save_state()
+            logger.info("[DriveWatch] Начальная точка ленты изменений сохранена")
+            return {}
+
+        found = {folder_id: [] for folder_id in self.folder_ids}
+        watched = set(self.folder_ids)
+        while page_token:
+            response = service.changes().list(
+                pageToken=page_token,
+                pageSize=DRIVE_PAGE_SIZE,
+                spaces="drive",
+                includeRemoved=False,
+                supportsAllDrives=True,
+                includeItemsFromAllDrives=True,
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))"
+            ).execute()
+
+            for change in response.get("changes", []):
+                f = change.get("file")
+                if change.get("removed") or not f or f.get("trashed"):
+                    continue
+                for parent in f.get("parents", []):
+                    if parent in watched:
+                        found[parent].append(f)
+
+            if "newStartPageToken" in response:
+                self.state["page_token"] = response["newStartPageToken"]
+                page_token = None
+            else:
+                page_token = response.get("nextPageToken")
+
+        # Токен сохраняется только после того, как все страницы прочитаны:
+        # при падении посередине изменения будут прочитаны повторно, а не потеряны
+        now = _rfc3339(datetime.now(timezone.utc))
+        self.state["last_seen"] = {folder_id: now for folder_id in self.folder_ids}
+        self._save_state()
+        return found
+
+    def _poll_list(self, service) -> dict:
+        last_seen = self.state.setdefault("last_seen", {})
+        found = {}
+        for folder_id in self.folder_ids:
+            since = last_seen.get(folder_id)
+            if since is None:
+                # Первый запуск: запоминаем текущее время, существующие файлы не трогаем
+                last_seen[folder_id] = _rfc3339(datetime.now(timezone.utc))
+                found[folder_id] = []
+                continue
+
+            query_since = _rfc3339(_parse_rfc3339(since) - timedelta(seconds=DRIVE_LIST_OVERLAP_SECONDS))
+            files = list_files_in_folder(service, folder_id, modified_after=query_since)
+            found[folder_id] = files
+
+            newest = max((f["modifiedTime"] for f in files if f.get("modifiedTime")), default=since)
+            last_seen[folder_id] = max(newest, since)
+
+        self._save_state()
+        return found
@@ -0,0 +1,73 @@
+import os
+import threading
+import httplib2
+import requests
+from dotenv import load_dotenv
+from google.auth.transport.requests import Request
+from google.oauth2 import service_account
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build
+from requests.adapters import HTTPAdapter
+from core.logger import logger
+from core.utils import get_env_file_path
+
+load_dotenv()
+
+SERVICE_ACCOUNT_JSON = get_env_file_path("SERVICE_ACCOUNT_FILE")
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive"]
+
+# Таймаут HTTP-запросов к Google API, секунды
+GOOGLE_HTTP_TIMEOUT = int(os.getenv("GOOGLE_HTTP_TIMEOUT", "120"))
+# Размер пула соединений общей requests-сессии (Apps Script и т.п.)
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+_lock = threading.Lock()
+_credentials = None
+_session = None
+# httplib2.Http не потокобезопасен — клиент Drive свой в каждом потоке
+_local = threading.local()
+
+
+def get_credentials():
+    """
+    Учётные данные сервисного аккаунта: JSON читается и токен получается один раз,
+    дальше объект общий для всех потоков (AuthorizedHttp сам обновляет истёкший токен).
+    """
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            creds = service_account.Credentials.from_service_account_file(
+                SERVICE_ACCOUNT_JSON,
+                scopes=DRIVE_SCOPES
+            )
+            creds.refresh(Request())
+            _credentials = creds
+            logger.info("[Google] Учётные данные сервисного аккаунта загружены")
+        return _credentials
+
+
+def get_drive_client():
+    """
+    Клиент Google Drive API для текущего потока.
+    Документ discovery берётся из библиотеки (static_discovery) и не запрашивается по сети,
+    соединение httplib2 переиспользуется между вызовами в этом потоке.
+    """
+    service = getattr(_local, "drive", None)
+    if service is None:
+        http = AuthorizedHttp(get_credentials(), http=httplib2.Http(timeout=GOOGLE_HTTP_TIMEOUT))
+        service = build("drive", "v3", http=http, cache_discovery=False, static_discovery=True)
+        _local.drive = service
+    return service
+
+
+def get_http_session() -> requests.Session:
+    """Общая requests-сессия с пулом keep-alive соединений, безопасная для рабочих потоков."""
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import os
+import random
+import time
+import openai
+from openai import AsyncOpenAI
+from dotenv import load_dotenv
+from core.logger import logger
+from core.result_cache import cache_key, get_result_cache
+from services.token_budget import count_tokens
+
+load_dotenv()
+
+# Лимиты аккаунта OpenAI: запросов и токенов (запрос + max_tokens ответа) в минуту, 0 — без ограничения.
+# Лучше ставить немного ниже лимита аккаунта: запросы в пути расходуют лимит позже, чем ведро здесь
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+# Повторы при 429/5xx и сетевых ошибках
+OPENAI_RETRIES = int(os.getenv("OPENAI_RETRIES", "6"))
+# Таймаут одного запроса, секунды
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "300"))
+# Кэшировать ответы на диске (общий кэш результатов, RESULT_CACHE_DIR)
+OPENAI_CACHE = os.getenv("OPENAI_CACHE", "1").lower() in ("1", "true", "yes")
+
+
+class TokenBucket:
+    """
+    Ведро токенов с равномерным пополнением: не больше per_minute единиц в минуту
+    с возможностью всплеска до per_minute. acquire() ждёт, пока накопится нужное количество.
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount: float = 1.0):
+        if self.capacity <= 0:
+            return
+        # Запрос больше минутного лимита всё равно должен пройти — ждём полное ведро
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+_request_bucket = TokenBucket(OPENAI_RPM)
+_token_bucket = TokenBucket(OPENAI_TPM)
+
+
+def _retry_delay(error, delay: float) -> float:
+    """Задержка перед повтором: retry-after из ответа, иначе экспоненциальная с разбросом."""
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            return float(response.headers.get("retry-after"))
+        except (TypeError, ValueError):
+            pass
+    return delay + random.uniform(0, delay / 2)
+
+
+class OpenAIChatClient:
+    """
+    Общий клиент Chat Completions поверх одного AsyncOpenAI (одного пула соединений).
+
+    Все встречи воркера делят лимиты RPM/TPM, поэтому одновременное завершение нескольких встреч
+    не упирается в 429. Временные ошибки (429, 5xx, сеть, таймаут) повторяются с задержкой;
+    ответы кэшируются на диске по хэшу запроса и параметрам модели — повторное суммирование
+    той же расшифровки ничего не стоит.
+    """
+
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+        self._client = None
+
+    def _get_client(self) -> AsyncOpenAI:
+        if self._client is None:
+            # Повторы делаем сами, чтобы каждый из них проходил через ограничитель
+            self._client = AsyncOpenAI(api_key=self.api_key, max_retries=0, timeout=OPENAI_TIMEOUT)
+        return self._client
+
+    async def complete(self, prompt: str, model: str, max_tokens: int, temperature: float) -> str:
+        """Ответ модели на один запрос пользователя."""
+        cache = get_result_cache()
+        key = cache_key(
+            "openai_chat", hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            model=model, max_tokens=max_tokens, temperature=temperature
+        )
+        if OPENAI_CACHE:
+            found, content = await asyncio.to_thread(cache.get, key)
+            if found:
+                logger.info(f"[OpenAI] Ответ взят из кэша ({model})")
+                return content
+
+        tokens = count_tokens(prompt, model) + max_tokens
+        delay = 1.0
+        for attempt in range(1, OPENAI_RETRIES + 1):
+            await _request_bucket.acquire(1)
+            await _token_bucket.acquire(tokens)
+            try:
+                response = await self._get_client().chat.completions.create(
+                    model=model,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                )
+                break
+            except openai.RateLimitError as e:
+                if getattr(e, "code", None) == "insufficient_quota":
+                    raise
+                error = e
+            except openai.APIStatusError as e:
+                if e.status_code < 500:
+                    raise
+                error = e
+            except (openai.APIConnectionError, openai.APITimeoutError) as e:
+                error = e
+            if attempt == OPENAI_RETRIES:
+                raise error
+            wait = _retry_delay(error, delay)
+            logger.warning(f"[OpenAI] {type(error).__name__}: {error}, повтор {attempt + 1}/{OPENAI_RETRIES} через {wait:.1f}s")
+            await asyncio.sleep(wait)
+            delay = min(delay * 2, 60.0)
+
+        content = response.choices[0].message.content
+        if OPENAI_CACHE and content:
+            await asyncio.to_thread(cache.put, key, content)
+        return content
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_clients = {}
+
+
+def get_openai_client(api_key: str = None) -> OpenAIChatClient:
+    """Общий клиент (и пул соединений) для всех задач с данным ключом."""
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = OpenAIChatClient(api_key)
+    return client
@@ -1,56 +1,56 @@
+import asyncio
 import os
 
+from dotenv import load_dotenv
 from core.logger import logger
-from openai import AsyncOpenAI
-
-
-
-
-def build_meeting_summary_prompt(transcription_segments, meeting_title=None, max_chars=12000):
+from services.openai_client import get_openai_client
+from services.token_budget import SUMMARY_MODEL, count_tokens, dialogue_turns, pack_turns
+
+load_dotenv()
+
+# Бюджеты в токенах (адрес API для локального имитатора — OPENAI_BASE_URL, его читает AsyncOpenAI)
+# Расшифровка до этого размера суммируется одним запросом
+SUMMARY_SINGLE_PASS_TOKENS = int(os.getenv("SUMMARY_SINGLE_PASS_TOKENS", "12000"))
+# Размер части расшифровки для промежуточного подсумка
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+# Ограничение ответа на одну часть
+SUMMARY_CHUNK_ANSWER_TOKENS = int(os.getenv("SUMMARY_CHUNK_ANSWER_TOKENS", "700"))
+# Сколько промежуточных подсумков помещается в один запрос объединения
+SUMMARY_REDUCE_INPUT_TOKENS = max(
+    int(os.getenv("SUMMARY_REDUCE_INPUT_TOKENS", "12000")), 2 * SUMMARY_CHUNK_ANSWER_TOKENS + 500
+)
+# Ограничение итогового ответа
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "4096"))
+SUMMARY_TEMPERATURE = float(os.getenv("SUMMARY_TEMPERATURE", "0.7"))
+# Одновременных запросов к OpenAI при суммировании частей
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+SUMMARY_FORMAT = (
+    "Опиши:\n"
+    "1️⃣ Основні теми, які обговорювалися.\n"
+    "2️⃣ Які висновки зробили учасники.\n"
+    "3️⃣ Чи були прийняті якісь рішення або домовленості.\n"
+    "4️⃣ Якщо були завдання або наступні кроки — переліч їх.\n\n"
+)
+
+
+def _title_line(meeting_title) -> str:
+    return f"Назва зустрічі: {meeting_title}\n\n" if meeting_title else ""
+
+
+def build_meeting_summary_prompt(transcription_segments, meeting_title=None):
     """
-    Формирует текст запроса (prompt_text) для OpenAI на основе расшифровки встречи.
+    Формирует текст запроса (prompt_text) для OpenAI на основе всей расшифровки встречи.
 
     Аргументы:
-        transcription_segments: List[Dict] — расшифровка с реальными именами спикеров.
+        transcription_segments: SegmentTable или List[Dict] — расшифровка с реальными именами спикеров.
         meeting_title: str | None — необязательное название встречи.
-        max_chars: int — ограничение длины текста для защиты от переполнения токенов.
 
     Возвращает:
         str — готовый prompt_text на украинском языке.
     """
     try:
-        # Собираем читаемую транскрипцию
-        dialogue_lines = []
-        for seg in transcription_segments:
-            start = seg.get("start", "")
-            speaker = seg.get("speaker", "Невідомий спікер")
-            text = seg.get("text", "").strip()
-            if text:
-                dialogue_lines.append(f"[{speaker}]: {text}")
-
-        # Если слишком длинная транскрипция — обрежем по символам
-        full_text = "\n".join(dialogue_lines)
-        if len(full_text) > max_chars:
-            full_text = full_text[:max_chars] + "\n..."
-
-        # Собираем заголовок (если есть)
-        title_line = f"Назва зустрічі: {meeting_title}\n\n" if meeting_title else ""
-
-        # Финальный промпт
-        prompt = (
-            f"{title_line}"
-            "На основі наведеної нижче розшифровки зустрічі, зроби короткий підсумок українською мовою.\n"
-            "Опиши:\n"
-            "1️⃣ Основні теми, які обговорювалися.\n"
-            "2️⃣ Які висновки зробили учасники.\n"
-            "3️⃣ Чи були прийняті якісь рішення або домовленості.\n"
-            "4️⃣ Якщо були завдання або наступні кроки — переліч їх.\n\n"
-            "Розшифровка:\n"
-            f"{full_text}\n\n"
-            "Формат відповіді: короткий структурований підсумок з підзаголовками."
-        )
-
-        return prompt
+        return build_dialogue_summary_prompt("\n".join(dialogue_turns(transcription_segments)), meeting_title)
 
     except Exception as e:
        logger.error(f"[build_meeting_summary_prompt] Помилка при створенні промпта: {e}")
@@ -58,21 +58,122 @@ def build_meeting_summary_prompt(transcription_segments, meeting_title=None, max
        return None
 
 
+def build_dialogue_summary_prompt(dialogue: str, meeting_title=None) -> str:
+    """Итоговый запрос по готовому тексту реплик."""
+    return (
+        f"{_title_line(meeting_title)}"
+        "На основі наведеної нижче розшифровки зустрічі, зроби короткий підсумок українською мовою.\n"
+        f"{SUMMARY_FORMAT}"
+        "Розшифровка:\n"
+        f"{dialogue}\n\n"
+        "Формат відповіді: короткий структурований підсумок з підзаголовками."
+    )
+
+
+def build_chunk_summary_prompt(dialogue: str, part: int, parts: int, meeting_title=None) -> str:
+    """Запрос на промежуточный подсумок одной части расшифровки (этап map)."""
+    return (
+        f"{_title_line(meeting_title)}"
+        f"Нижче — частина {part} з {parts} розшифровки зустрічі.\n"
+        "Стисло українською мовою випиши з неї теми, висновки, рішення та завдання (із відповідальними, якщо названі). "
+        "Не вигадуй того, чого немає в тексті, і не пиши вступів.\n\n"
+        "Частина розшифровки:\n"
+        f"{dialogue}"
+    )
+
+
+def build_merge_prompt(summaries: list, meeting_title=None) -> str:
+    """Запрос на объединение промежуточных подсумков в один промежуточный (если все сразу не помещаются)."""
+    joined = "\n\n".join(summaries)
+    return (
+        f"{_title_line(meeting_title)}"
+        "Нижче — підсумки послідовних частин однієї зустрічі. Об'єднай їх в один стислий підсумок українською мовою, "
+        "зберігши всі теми, висновки, рішення та завдання і прибравши повтори.\n\n"
+        f"{joined}"
+    )
+
+
+def build_reduce_prompt(summaries: list, meeting_title=None) -> str:
+    """Итоговый запрос по промежуточным подсумкам (этап reduce)."""
+    joined = "\n\n".join(f"Частина {i}:\n{summary}" for i, summary in enumerate(summaries, 1))
+    return (
+        f"{_title_line(meeting_title)}"
+        "Нижче — підсумки послідовних частин розшифровки однієї зустрічі. "
+        "На їх основі зроби короткий підсумок усієї зустрічі українською мовою.\n"
+        f"{SUMMARY_FORMAT}"
+        "Підсумки частин:\n"
+        f"{joined}\n\n"
+        "Формат відповіді: короткий структурований підсумок з підзаголовками."
+    )
+
+
+def _group_by_budget(summaries: list, max_tokens: int) -> list:
+    groups, current, current_tokens = [], [], 0
+    for summary in summaries:
+        tokens = count_tokens(summary) + 2
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(summary)
+        current_tokens += tokens
+    return groups + [current] if current else groups
+
+
+async def summarize_meeting(transcription_segments, meeting_title, complete) -> str:
+    """
+    Map-reduce суммирование расшифровки любой длины.
+
+    complete(prompt, max_tokens) — корутина, возвращающая ответ модели.
+    Короткая расшифровка (до SUMMARY_SINGLE_PASS_TOKENS) суммируется одним запросом. Длинная делится
+    по репликам на части до SUMMARY_CHUNK_TOKENS, части суммируются параллельно (не более
+    SUMMARY_CONCURRENCY запросов одновременно), затем подсумки объединяются — при необходимости
+    в несколько уровней, чтобы каждый запрос укладывался в SUMMARY_REDUCE_INPUT_TOKENS.
+    """
+    turns = dialogue_turns(transcription_segments)
+    dialogue = "\n".join(turns)
+    total_tokens = count_tokens(dialogue)
+    if total_tokens <= SUMMARY_SINGLE_PASS_TOKENS:
+        logger.info(f"[Summary] {meeting_title}: {total_tokens} токенов, один запрос")
+        return await complete(build_dialogue_summary_prompt(dialogue, meeting_title), SUMMARY_MAX_TOKENS)
+
+    chunks = pack_turns(turns, SUMMARY_CHUNK_TOKENS)
+    logger.info(f"[Summary] {meeting_title}: {total_tokens} токенов, {len(chunks)} частей по ≤{SUMMARY_CHUNK_TOKENS}")
+    semaphore = asyncio.Semaphore(max(1, SUMMARY_CONCURRENCY))
+
+    async def limited(prompt):
+        async with semaphore:
+            return await complete(prompt, SUMMARY_CHUNK_ANSWER_TOKENS)
+
+    summaries = await asyncio.gather(*(
+        limited(build_chunk_summary_prompt(chunk, i, len(chunks), meeting_title)) for i, chunk in enumerate(chunks, 1)
+    ))
+
+    # Подсумки, которые не помещаются в один запрос, объединяются группами, пока не поместятся
+    level = 1
+    while sum(count_tokens(s) + 2 for s in summaries) > SUMMARY_REDUCE_INPUT_TOKENS and len(summaries) > 1:
+        groups = _group_by_budget(summaries, SUMMARY_REDUCE_INPUT_TOKENS)
+        if len(groups) == len(summaries):
+            # Ответы длиннее ожидаемого — объединять нечего, отдаём в итоговый запрос как есть
+            break
+        logger.info(f"[Summary] {meeting_title}: уровень {level}, {len(summaries)} подсумков -> {len(groups)}")
+        summaries = await asyncio.gather(*(
+            limited(build_merge_prompt(group, meeting_title)) if len(group) > 1 else asyncio.sleep(0, group[0])
+            for group in groups
+        ))
+        level += 1
+
+    return await complete(build_reduce_prompt(summaries, meeting_title), SUMMARY_MAX_TOKENS)
+
+
 async  def openai_request(transcription_segments, base_filename):
-    prompt_text= build_meeting_summary_prompt(transcription_segments, base_filename)
+    client = get_openai_client()
+
+    async def complete(prompt_text, max_tokens):
+        return await client.complete(prompt_text, SUMMARY_MODEL, max_tokens, SUMMARY_TEMPERATURE)
 
-    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4-0125-preview",
-            messages=[{"role": "user", "content": prompt_text}],
-            temperature=0.7,
-            max_tokens=4096
-        )
+        return await summarize_meeting(transcription_segments, base_filename, complete)
     except Exception as e:
        logger.error(f"[openai_request] Ошибка при запросе OpenAi: {e}")
        logger.info(f"[openai_request] Ошибка при запросе OpenAi: {e}")
        return None
-    summary = response.choices[0].message.content
-
-    return summary
\ No newline at end of file
@@ -0,0 +1,81 @@
+import bisect
+import heapq
+import numpy as np
+from core.segments import SegmentTable
+
+
+def word_speaker_ids(diarization: SegmentTable, words: SegmentTable) -> np.ndarray:
+    """
+    Индекс спикера (в diarization.speakers) для каждого слова за один проход по отсортированным сегментам и словам.
+
+    Слово относится к сегменту с наибольшим пересечением по времени, поэтому слово на стыке реплик
+    достаётся тому, кто произнёс большую его часть (при равенстве — раньше начавшемуся сегменту).
+    Слово в паузе между сегментами получает спикера сегмента с ближайшим началом.
+    Активные сегменты хранятся в куче по концу: каждый сегмент добавляется и удаляется один раз,
+    итого O((слов + сегментов) · log сегментов) вместо O(слов × сегментов).
+    """
+    result = np.full(len(words), -1, dtype=np.int32)
+    if not len(diarization) or not len(words):
+        return result
+
+    segment_order = np.lexsort((diarization.ends, diarization.starts))
+    starts = diarization.starts[segment_order].tolist()
+    ends = diarization.ends[segment_order].tolist()
+    segment_speakers = diarization.speaker_ids[segment_order].tolist()
+    word_starts = words.starts.tolist()
+    word_ends = words.ends.tolist()
+
+    active = []  # (end, index) сегментов, начавшихся до конца текущего слова
+    next_segment = 0
+    for i in np.argsort(words.starts, kind="stable").tolist():
+        word_start, word_end = word_starts[i], word_ends[i]
+        while next_segment < len(starts) and starts[next_segment] < word_end:
+            heapq.heappush(active, (ends[next_segment], next_segment))
+            next_segment += 1
+        # Слова идут по возрастанию начала — закончившиеся сегменты больше не понадобятся
+        while active and active[0][0] <= word_start:
+            heapq.heappop(active)
+
+        best, best_overlap = None, 0.0
+        for end, index in active:
+            overlap = min(end, word_end) - max(starts[index], word_start)
+            if overlap > best_overlap or (overlap == best_overlap and best is not None and index < best):
+                best, best_overlap = index, overlap
+
+        if best is None:
+            # Слово нулевой длины или в паузе: ближайшее начало сегмента
+            position = bisect.bisect_left(starts, word_start)
+            candidates = [j for j in (position - 1, position) if 0 <= j < len(starts)]
+            best = min(candidates, key=lambda j: abs(starts[j] - word_start))
+        result[i] = segment_speakers[best]
+    return result
+
+
+def word_speakers(diarization_segments, words) -> list:
+    """Имя спикера для каждого слова (принимает таблицы или списки словарей)."""
+    diarization = SegmentTable.coerce(diarization_segments)
+    ids = word_speaker_ids(diarization, SegmentTable.coerce(words))
+    names = diarization.speakers + [None]
+    return [names[i] for i in ids.tolist()]
+
+
+def assign_speakers_to_text(diarization_segments, transcription_segments) -> SegmentTable:
+    """
+    Группирует слова в фразы по спикерам.
+
+    Границы фраз — места смены спикера в массиве индексов; текст фразы — один срез
+    общего буфера слов, без склейки по словам.
+    """
+    diarization = SegmentTable.coerce(diarization_segments)
+    words = SegmentTable.coerce(transcription_segments)
+    if not len(words):
+        return SegmentTable.empty()
+
+    ids = word_speaker_ids(diarization, words)
+    bounds = np.flatnonzero(np.diff(ids)) + 1
+    firsts = np.concatenate(([0], bounds))
+    lasts = np.concatenate((bounds, [len(words)]))
+
+    texts = [words.text_range(first, last) for first, last in zip(firsts.tolist(), lasts.tolist())]
+    phrases = SegmentTable.from_columns(words.starts[firsts], words.ends[lasts - 1], texts)
+    return phrases.with_speakers(diarization.speakers, ids[firsts])
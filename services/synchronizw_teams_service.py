@@ -1,6 +1,15 @@
+import heapq
+import html
+import io
+import os
 import re
-from typing import List, Dict, Tuple
+import sys
+from array import array
+from typing import List, Dict, Tuple, Iterable, Iterator
+import numpy as np
+from scipy.optimize import linear_sum_assignment
 from core.logger import logger
+from core.segments import SegmentTable
 
 def time_to_seconds(t: str) -> float:
     """Convert 'HH:MM:SS.mmm' (or 'MM:SS.mmm') to seconds (float)."""
@@ -20,72 +29,227 @@ def time_to_seconds(t: str) -> float:
         return 0.0
 
 
-def parse_vtt_text(vtt_text: str) -> List[Dict]:
+_TIMING_RE = re.compile(r"^\s*(\S+)\s+-->\s+(\S+)")
+# Открывающий <v Name> (в том числе с классами <v.loud Name>) или закрывающий </v>
+_VOICE_RE = re.compile(r"<v(?:\.[^\s>]*)?\s+([^>]*)>|</v\s*>")
+_TAG_RE = re.compile(r"<[^>]*>")
+_SPACES_RE = re.compile(r"\s+")
+
+UNKNOWN_SPEAKER = "Unknown"
+
+
+def _clean_cue_text(text: str) -> str:
+    """Убирает прочие теги (<b>, <i>, <c.x>, таймкоды внутри реплики) и HTML-сущности."""
+    if "<" in text:
+        text = _TAG_RE.sub("", text)
+    if "&" in text:
+        text = html.unescape(text)
+    if "  " in text or "\t" in text:
+        text = _SPACES_RE.sub(" ", text)
+    return text.strip()
+
+
+def _cue_time(value: str) -> float:
+    """Быстрый разбор 'HH:MM:SS.mmm'; остальные форматы — через time_to_seconds."""
+    parts = value.split(":")
+    if len(parts) == 3:
+        try:
+            return int(parts[0]) * 3600 + int(parts[1]) * 60 + float(parts[2])
+        except ValueError:
+            pass
+    return time_to_seconds(value)
+
+
+def _cue_voices(payload: str, names: Dict) -> List[Tuple[str, str]]:
     """
-    Parse VTT text and return list of segments:
-    [{ "start": float_seconds, "end": float_seconds, "speaker": str, "text": str }, ...]
+    Разбирает текст реплики на [(speaker, text)].
+    Голосов в одной реплике может быть несколько, теги <v> могут быть вложены или не закрыты;
+    текст вне голоса относится к последнему открытому голосу (или Unknown).
+    Имена интернируются: одинаковые имена — один и тот же объект строки.
     """
-    try:
-        if not vtt_text or not isinstance(vtt_text, str):
-            logger.error("[parse_vtt_text] empty or invalid vtt_text")
+    if "<v" not in payload:
+        text = _clean_cue_text(payload)
+        return [(UNKNOWN_SPEAKER, text)] if text else []
+
+    # Обычная реплика Teams: ровно один <v Name>текст</v> без других тегов
+    if payload.startswith("<v ") and payload.endswith("</v>") and payload.count("<") == 2:
+        close = payload.find(">")
+        name = payload[3:close].strip() or UNKNOWN_SPEAKER
+        speaker = names.get(name)
+        if speaker is None:
+            speaker = names[name] = sys.intern(name)
+        text = _clean_cue_text(payload[close + 1:-4])
+        return [(speaker, text)] if text else []
+
+    voices = []
+    stack = []
+    last_speaker = UNKNOWN_SPEAKER
+    position = 0
+
+    def flush(text):
+        text = _clean_cue_text(text)
+        if not text:
+            return
+        speaker = stack[-1] if stack else last_speaker
+        if voices and voices[-1][0] == speaker:
+            voices[-1] = (speaker, f"{voices[-1][1]} {text}")
+        else:
+            voices.append((speaker, text))
+
+    for match in _VOICE_RE.finditer(payload):
+        flush(payload[position:match.start()])
+        if match.group(1) is not None:
+            name = match.group(1).strip() or UNKNOWN_SPEAKER
+            speaker = names.get(name)
+            if speaker is None:
+                speaker = names[name] = sys.intern(name)
+            stack.append(speaker)
+            last_speaker = speaker
+        elif stack:
+            stack.pop()
+        position = match.end()
+    flush(payload[position:])
+    return voices
+
+
+def iter_vtt_cues(lines: Iterable[str]) -> Iterator[Dict]:
+    """
+    Потоковый разбор VTT: принимает любой итератор строк (открытый файл, генератор)
+    и лениво выдаёт реплики { "start", "end", "speaker", "text" } по мере чтения.
+
+    Реплика — блок до пустой строки: необязательный идентификатор, строка времени
+    (настройки позиционирования после времени игнорируются) и одна или несколько строк текста.
+    Многострочные реплики склеиваются, поэтому <v Name> на первой строке и </v> на последней
+    не теряются. Заголовок WEBVTT, NOTE и STYLE пропускаются (в них нет строки времени).
+    """
+    names = {}
+    start = end = None
+    payload = []
+
+    def finish():
+        if start is None or not payload:
             return []
+        return [
+            {"start": start, "end": end, "speaker": speaker, "text": text}
+            for speaker, text in _cue_voices(" ".join(payload), names)
+        ]
 
-        segments = []
-        lines = vtt_text.splitlines()
-        curr_start = curr_end = None
-
-        # simple stateful parse: find time lines then next <v ...> line(s)
-        for i, raw in enumerate(lines):
-            line = raw.strip()
-            if "-->" in line:
-                # parse times
-                try:
-                    start_s, end_s = line.split("-->")
-                    curr_start = time_to_seconds(start_s.strip())
-                    curr_end = time_to_seconds(end_s.strip())
-                except Exception as e:
-                    logger.warning(f"[parse_vtt_text] bad time line '{line}': {e}")
-                    curr_start = curr_end = None
-            elif line.startswith("<v "):
-                # <v Name>text</v>  (sometimes text may be on next line(s) but many Teams VTTs have single-line)
-                try:
-                    # extract speaker
-                    m = re.match(r"<v\s+([^>]+)>(.*)</v>?$", line, re.DOTALL)
-                    if m:
-                        speaker = m.group(1).strip()
-                        text = m.group(2).strip()
-                    else:
-                        # fallback: split at first '>' char
-                        after = line[3:]
-                        sp, rest = after.split(">", 1)
-                        speaker = sp.strip()
-                        text = rest.replace("</v>", "").strip()
-                    if curr_start is not None and curr_end is not None:
-                        segments.append({
-                            "start": float(curr_start),
-                            "end": float(curr_end),
-                            "speaker": speaker,
-                            "text": text
-                        })
-                        # reset times to avoid accidental reuse
-                        curr_start = curr_end = None
-                except Exception as e:
-                    logger.warning(f"[parse_vtt_text] can't parse speaker line '{line}': {e}")
-                    continue
-            else:
-                # sometimes Teams puts text on next line after time; try to capture that
-                # if previous time exists and next line is a speaker line without <v ...> (rare), skip
+    for raw in lines:
+        line = raw.strip()
+        if not line:
+            yield from finish()
+            start = end = None
+            payload = []
+            continue
+
+        if start is None:
+            if "-->" not in line:
+                continue  # идентификатор реплики, заголовок, NOTE
+            match = _TIMING_RE.match(line)
+            if match is None:
+                logger.warning(f"[parse_vtt] bad time line '{line}'")
                 continue
+            start = _cue_time(match.group(1))
+            end = _cue_time(match.group(2))
+        elif "-->" in line and _TIMING_RE.match(line):
+            # Пустую строку между репликами потеряли — начинаем новую
+            yield from finish()
+            match = _TIMING_RE.match(line)
+            start = _cue_time(match.group(1))
+            end = _cue_time(match.group(2))
+            payload = []
+        else:
+            payload.append(line)
+
+    yield from finish()
+
 
+def iter_vtt_file(source) -> Iterator[Dict]:
+    """
+    Реплики из VTT-файла без чтения его целиком в память.
+    source — путь, текстовый или бинарный файловый объект (например, поток скачивания).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "r", encoding="utf-8-sig") as f:
+            yield from iter_vtt_cues(f)
+    elif isinstance(source, io.TextIOBase):
+        yield from iter_vtt_cues(source)
+    else:
+        yield from iter_vtt_cues(io.TextIOWrapper(source, encoding="utf-8-sig"))
+
+
+def parse_vtt_file(source) -> List[Dict]:
+    """Список реплик VTT-файла (см. iter_vtt_file)."""
+    try:
+        segments = list(iter_vtt_file(source))
         if not segments:
             logger.warning("[parse_vtt_text] no segments found in VTT")
         return segments
-
     except Exception as e:
         logger.error(f"[parse_vtt_text] critical error: {e}")
         return []
 
 
+def parse_vtt_text(vtt_text: str) -> List[Dict]:
+    """
+    Parse VTT text and return list of segments:
+    [{ "start": float_seconds, "end": float_seconds, "speaker": str, "text": str }, ...]
+    """
+    if not vtt_text or not isinstance(vtt_text, str):
+        logger.error("[parse_vtt_text] empty or invalid vtt_text")
+        return []
+    return parse_vtt_file(io.StringIO(vtt_text))
+
+
+class CueArrays:
+    """
+    Реплики VTT в колоночном виде для этапа сопоставления спикеров:
+    starts/ends — float64, speaker_ids — int32 индексы в names, отсортированы по началу.
+    Тексты не хранятся — для сопоставления нужны только времена и имена;
+    реплики без спикера (UNKNOWN_SPEAKER) пропускаются.
+    """
+
+    __slots__ = ("starts", "ends", "speaker_ids", "names")
+
+    def __init__(self, starts, ends, speaker_ids, names):
+        order = np.argsort(starts, kind="stable")
+        self.starts = np.asarray(starts, dtype=np.float64)[order]
+        self.ends = np.asarray(ends, dtype=np.float64)[order]
+        self.speaker_ids = np.asarray(speaker_ids, dtype=np.int32)[order]
+        self.names = names
+
+    @classmethod
+    def from_cues(cls, cues: Iterable[Dict]) -> "CueArrays":
+        """Из списка или потока реплик (например iter_vtt_file): один проход, без промежуточных словарей."""
+        starts = array("d")
+        ends = array("d")
+        speaker_ids = array("i")
+        name_index = {}
+        for cue in cues:
+            try:
+                start, end = float(cue["start"]), float(cue["end"])
+            except Exception:
+                continue
+            name = cue.get("speaker") or UNKNOWN_SPEAKER
+            if name == UNKNOWN_SPEAKER:
+                # Реплика без <v> не говорит, кто это, — такое «имя» нельзя присваивать спикеру диаризации
+                continue
+            speaker_id = name_index.get(name)
+            if speaker_id is None:
+                speaker_id = name_index[name] = len(name_index)
+            starts.append(start)
+            ends.append(end)
+            speaker_ids.append(speaker_id)
+        return cls(
+            np.frombuffer(starts, dtype=np.float64),
+            np.frombuffer(ends, dtype=np.float64),
+            np.frombuffer(speaker_ids, dtype=np.int32),
+            list(name_index)
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
 
 def _to_float(x):
     """Удобная конвертация на случай np.float64 и т.п."""
@@ -100,16 +264,68 @@ def _overlap(a_start: float, a_end: float, b_start: float, b_end: float) -> floa
     e = min(a_end, b_end)
     return max(0.0, e - s)
 
-def map_whisper_speakers_by_iter(
-    whisper_segments: List[Dict],
-    vtt_segments: List[Dict],
-    tolerance: float = 0.7,
+def speaker_overlap_matrix(
+    whisper: SegmentTable,
+    cues: CueArrays,
     min_overlap_for_match: float = 0.02
-) -> Tuple[List[Dict], Dict]:
+) -> np.ndarray:
+    """
+    Матрица [спикер whisper (индекс в whisper.speakers) × имя из VTT] с суммарной длительностью
+    пересечения их реплик.
+
+    Один проход по отсортированным сегментам: реплики VTT, начавшиеся до конца текущего сегмента,
+    лежат в куче по времени окончания и удаляются, как только закончились.
+    Учитываются пересечения не короче min_overlap_for_match; сегменты без спикера пропускаются.
     """
-    Итеративно проходим по каждому уникальному SPEAKER_* из whisper_segments,
-    ищем первое подходящее совпадение в vtt_segments (по времени + tolerance),
-    и при нахождении — заменяем имя во всех whisper_segments.
+    matrix = np.zeros((len(whisper.speakers), len(cues.names)), dtype=np.float64)
+    cue_starts = cues.starts.tolist()
+    cue_ends = cues.ends.tolist()
+    cue_speakers = cues.speaker_ids.tolist()
+    order = np.argsort(whisper.starts, kind="stable")
+    segments = zip(
+        whisper.starts[order].tolist(), whisper.ends[order].tolist(), whisper.speaker_ids[order].tolist()
+    )
+
+    rows, cols, values = [], [], []
+    active = []  # (end, номер реплики)
+    next_cue = 0
+    for w_start, w_end, row in segments:
+        while next_cue < len(cue_starts) and cue_starts[next_cue] < w_end:
+            heapq.heappush(active, (cue_ends[next_cue], next_cue))
+            next_cue += 1
+        while active and active[0][0] <= w_start:
+            heapq.heappop(active)
+        if row < 0:
+            continue
+        for cue_end, index in active:
+            overlap = _overlap(w_start, w_end, cue_starts[index], cue_end)
+            if overlap >= min_overlap_for_match:
+                rows.append(row)
+                cols.append(cue_speakers[index])
+                values.append(overlap)
+
+    np.add.at(matrix, (np.array(rows, dtype=int), np.array(cols, dtype=int)), np.array(values))
+    return matrix
+
+
+def map_whisper_speakers_by_iter(
+    whisper_segments,
+    vtt_segments,
+    min_overlap_for_match: float = 0.02,
+    exclusive: bool = True
+) -> Tuple[object, Dict]:
+    """
+    Сопоставляет каждому SPEAKER_* из whisper_segments имя из vtt_segments по суммарному
+    пересечению их реплик во времени и заменяет имена во всех whisper_segments.
+
+    Матрица пересечений строится одним проходом (speaker_overlap_matrix), затем имена
+    распределяются венгерским алгоритмом с максимальным суммарным пересечением:
+    два спикера диаризации не могут получить одно и то же имя (exclusive=False — каждому
+    спикеру просто имя с наибольшим пересечением, как раньше).
+
+    whisper_segments — SegmentTable (имена заменяются только в списке speakers, возвращается
+    новая таблица с общими массивами) или список словарей (имена заменяются на месте).
+    vtt_segments — список реплик (parse_vtt_text/parse_vtt_file) или CueArrays.
 
     Возвращает (new_whisper_segments, stats)
     stats = {
@@ -119,93 +335,66 @@ def map_whisper_speakers_by_iter(
         "unmatched_speakers": [...],
     }
     Параметры:
-      - tolerance: сколько секунд "подтолкнуть" vtt-интервал при проверке пересечения.
       - min_overlap_for_match: минимальная длительность пересечения, чтобы считать совпадением (в сек).
     """
     try:
-        if not isinstance(whisper_segments, list):
-            logger.error("[sync_iter] whisper_segments must be list")
+        if isinstance(whisper_segments, SegmentTable):
+            table = whisper_segments
+        elif isinstance(whisper_segments, list):
+            table = SegmentTable.from_dicts(whisper_segments)
+        else:
+            logger.error("[sync_iter] whisper_segments must be SegmentTable or list")
             return whisper_segments, {}
 
-        if not isinstance(vtt_segments, list) or not vtt_segments:
+        cues = vtt_segments if isinstance(vtt_segments, CueArrays) else None
+        if cues is None and isinstance(vtt_segments, list):
+            cues = CueArrays.from_cues(vtt_segments)
+        if cues is None or not len(cues):
             logger.warning("[sync_iter] vtt_segments empty — ничего не будет заменено")
             return whisper_segments, {"mapping": {}, "matched": 0, "total_speakers": 0, "unmatched_speakers": []}
 
-        # Список уникальных SPEAKER_* в порядке первого появления
-        speaker_order = []
-        speaker_names = []
-        for seg in whisper_segments:
-            sp = seg.get("speaker")
-            if sp not in speaker_order:
-                speaker_order.append(sp)
-
-        mapping = {}
-        matched_count = 0
+        # Спикеры, которые реально встречаются, в порядке первого появления
+        ids = table.speaker_ids
+        present, first = np.unique(ids[ids >= 0], return_index=True)
+        present = present[np.argsort(first)].tolist()
+        names = cues.names
 
-        # Преобразуем vtt_segments в нормализованный список (float times)
-        vtt = []
-        for vs in vtt_segments:
-            try:
-                vtt.append({
-                    "start": float(vs["start"]),
-                    "end": float(vs["end"]),
-                    "speaker": vs.get("speaker") or "Unknown",
-                })
-            except Exception:
-                continue
+        matrix = speaker_overlap_matrix(table, cues, min_overlap_for_match)[present]
 
-        # Для каждого SPEAKER_* последовательно ищем подходящее имя
-        for sp in speaker_order:
-            # Собираем все сегменты, принадлежащие этому SPEAKER
-            sp_segments = [s for s in whisper_segments if s.get("speaker") == sp]
-            if not sp_segments:
-                continue
-
-            # Для каждого сегмента ищем пересекающиеся VTT отрезки — аккумулируем кандидатов
-            candidate_scores = {}  # name -> total_overlap (or count)
-            for s in sp_segments:
-                w_start = _to_float(s.get("start", 0.0))
-                w_end = _to_float(s.get("end", 0.0))
-                for vs in vtt:
-                    v_start = vs["start"]
-                    v_end = vs["end"]
-                    # проверяем пересечение с расширением vtt интервала на tolerance
-                    if (v_end + tolerance) < w_start or (v_start - tolerance) > w_end:
-                        continue
-                    overlap = _overlap(w_start, w_end, v_start, v_end)
-                    if overlap >= min_overlap_for_match:
-                        name = vs["speaker"]
-                        candidate_scores.setdefault(name, 0.0)
-                        candidate_scores[name] += overlap  # суммируем длительность пересечения
-
-            # Если есть кандидаты — выберем тот с максимальным суммарным overlap
-            if candidate_scores:
-                best_name = max(candidate_scores.items(), key=lambda x: x[1])[0]
-                mapping[sp] = best_name
-                matched_count += 1
-                speaker_names.append(best_name)
-
-                # Заменяем имя во всех сегментах whisper_segments
-                for seg in whisper_segments:
-                    if seg.get("speaker") == sp:
-                        seg["speaker"] = best_name
+        mapping = {table.speakers[sp]: None for sp in present}
+        if matrix.size:
+            if exclusive:
+                rows, cols = linear_sum_assignment(matrix, maximize=True)
             else:
-                # не нашли для этого SPEAKER подходящего VTT имени
-                mapping[sp] = None
+                rows = np.arange(matrix.shape[0])
+                cols = matrix.argmax(axis=1)
+            for row, col in zip(rows, cols):
+                if matrix[row, col] > 0:
+                    mapping[table.speakers[present[row]]] = names[col]
+
+        # Переименование: таблице — новый список имён, словарям — одним проходом на месте
+        if isinstance(whisper_segments, SegmentTable):
+            result = table.with_speakers([mapping.get(name) or name for name in table.speakers])
+        else:
+            result = whisper_segments
+            for seg in whisper_segments:
+                name = mapping.get(seg.get("speaker"))
+                if name:
+                    seg["speaker"] = name
 
         # Соберём статистику
-        total_speakers = len(speaker_order)
+        total_speakers = len(mapping)
         unmatched = [k for k, v in mapping.items() if v is None]
         stats = {
             "mapping": mapping,
             "matched": sum(1 for v in mapping.values() if v),
             "total_speakers": total_speakers,
-            "speaker_names": speaker_names,
+            "speaker_names": [v for v in mapping.values() if v],
             "unmatched_speakers": unmatched
         }
 
         logger.info(f"[sync_iter] mapped {stats['matched']}/{total_speakers} speakers")
-        return whisper_segments, stats
+        return result, stats
 
     except Exception as e:
         logger.error(f"[sync_iter] unexpected error: {e}")
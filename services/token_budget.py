@@ -0,0 +1,100 @@
+import os
+from functools import lru_cache
+from dotenv import load_dotenv
+from core.logger import logger
+
+load_dotenv()
+
+# Модель, по словарю которой считаются токены
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4-0125-preview")
+# Оценка, если словарь tiktoken недоступен (нет сети для загрузки): символов на токен, с запасом для кириллицы
+FALLBACK_CHARS_PER_TOKEN = 2.0
+
+UNKNOWN_SPEAKER = "Невідомий спікер"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    """Словарь tiktoken для модели; None — считать токены приблизительно по длине текста."""
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"[Summary] Словарь tiktoken недоступен ({e}), токены оцениваются по длине текста")
+        return None
+
+
+def count_tokens(text: str, model: str = SUMMARY_MODEL) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return int(len(text) / FALLBACK_CHARS_PER_TOKEN) + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def split_text(text: str, max_tokens: int, model: str = SUMMARY_MODEL) -> list:
+    """Режет текст на куски не длиннее max_tokens (по границам слов, если удаётся)."""
+    encoding = _encoding(model)
+    if encoding is None:
+        limit = max(1, int(max_tokens * FALLBACK_CHARS_PER_TOKEN))
+        pieces = []
+        while len(text) > limit:
+            cut = text.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            pieces.append(text[:cut].strip())
+            text = text[cut:].strip()
+        return pieces + [text] if text else pieces
+
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[i:i + max_tokens]).strip() for i in range(0, len(tokens), max_tokens)]
+
+
+def dialogue_turns(segments) -> list:
+    """
+    Реплики расшифровки: подряд идущие сегменты одного спикера склеиваются в одну строку «[спикер]: текст».
+    segments — SegmentTable или список словарей {start, end, speaker, text}.
+    """
+    turns = []
+    current_speaker, texts = None, []
+    for seg in segments:
+        text = (seg.get("text") or "").strip()
+        if not text:
+            continue
+        speaker = seg.get("speaker", UNKNOWN_SPEAKER)
+        if speaker != current_speaker and texts:
+            turns.append(f"[{current_speaker}]: {' '.join(texts)}")
+            texts = []
+        current_speaker = speaker
+        texts.append(text)
+    if texts:
+        turns.append(f"[{current_speaker}]: {' '.join(texts)}")
+    return turns
+
+
+def pack_turns(turns: list, max_tokens: int, model: str = SUMMARY_MODEL) -> list:
+    """
+    Раскладывает реплики по частям не длиннее max_tokens, не разрывая реплики.
+    Реплика длиннее бюджета режется на несколько, каждая со своим «[спикер]:».
+    Возвращает список частей — строк с репликами через перевод строки.
+    """
+    chunks = []
+    current, current_tokens = [], 0
+    for turn in turns:
+        tokens = count_tokens(turn, model) + 1
+        pieces = [(turn, tokens)]
+        if tokens > max_tokens:
+            speaker, _, text = turn.partition(": ")
+            prefix = f"{speaker}: "
+            budget = max(1, max_tokens - count_tokens(prefix, model) - 1)
+            pieces = [(prefix + piece, count_tokens(prefix + piece, model) + 1) for piece in split_text(text, budget, model)]
+        for piece, piece_tokens in pieces:
+            if current and current_tokens + piece_tokens > max_tokens:
+                chunks.append("\n".join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
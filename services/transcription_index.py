@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from core.logger import logger
+from core.utils import safe_execute
+from services.drive_service import get_drive_service, is_transcription_file, list_files_in_folder
+from services.drive_watcher import DriveChangeWatcher
+
+load_dotenv()
+
+# Пауза между попытками полного списка папки, если Drive недоступен, секунды
+TRANSCRIPTION_LIST_RETRY_DELAY = int(os.getenv("TRANSCRIPTION_LIST_RETRY_DELAY", "30"))
+# Как часто перечитывать папку целиком в дополнение к ленте изменений, секунды (0 — никогда)
+TRANSCRIPTION_RESYNC_INTERVAL = int(os.getenv("TRANSCRIPTION_RESYNC_INTERVAL", "1800"))
+
+
+class TranscriptionIndex:
+    """
+    Общий индекс VTT-файлов папки транскрипций Teams: имя без расширения → файл Drive.
+
+    Один фоновый цикл обновляет индекс раз в interval секунд через ленту изменений Drive
+    и будит ожидающие встречи через future, когда появляется их файл. Число запросов к API
+    не зависит от того, сколько встреч ждут транскрипцию. Раз в TRANSCRIPTION_RESYNC_INTERVAL секунд
+    папка перечитывается целиком — на случай изменений, потерянных лентой.
+    """
+
+    def __init__(self, folder_id: str, interval: float):
+        self.folder_id = folder_id
+        self.interval = interval
+        self.files = {}
+        self._waiters = {}
+        self._watcher = DriveChangeWatcher([folder_id], name="transcriptions")
+        self._task = None
+        self._synced_at = 0.0
+
+    def _add(self, files):
+        for f in files:
+            if not is_transcription_file(f):
+                continue
+            base_name = os.path.splitext(f["name"])[0]
+            self.files[base_name] = f
+            for future in self._waiters.pop(base_name, []):
+                if not future.done():
+                    future.set_result(f)
+
+    async def _full_sync(self) -> bool:
+        """Полный список папки. False — Drive не ответил (пустая папка — не ошибка)."""
+        try:
+            files = await asyncio.to_thread(
+                list_files_in_folder, get_drive_service(), self.folder_id, raise_errors=True
+            )
+        except Exception as e:
+            logger.warning(f"[TranscriptionIndex] Не удалось получить список транскрипций: {e}")
+            return False
+        self._add(files)
+        self._synced_at = time.monotonic()
+        return True
+
+    async def start(self):
+        """Полный проход по папке, дальше — изменения в фоне и периодическая полная сверка."""
+        if self._task is not None:
+            return
+        # Фиксируем точку ленты изменений до полного списка, чтобы не пропустить файлы между ними.
+        # После перезапуска лента продолжает сохранённую точку — её изменения тоже идут в индекс
+        while (changes := await asyncio.to_thread(safe_execute, self._watcher.poll)) is None:
+            await asyncio.sleep(TRANSCRIPTION_LIST_RETRY_DELAY)
+        self._add(changes.get(self.folder_id, []))
+        # Пустой индекс после сбоя Drive означал бы, что уже лежащие транскрипции никто не дождётся
+        while not await self._full_sync():
+            logger.info(f"[TranscriptionIndex] Повтор через {TRANSCRIPTION_LIST_RETRY_DELAY}s")
+            await asyncio.sleep(TRANSCRIPTION_LIST_RETRY_DELAY)
+        logger.info(f"[TranscriptionIndex] В индексе {len(self.files)} транскрипций")
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            changes = await asyncio.to_thread(safe_execute, self._watcher.poll) or {}
+            self._add(changes.get(self.folder_id, []))
+            if TRANSCRIPTION_RESYNC_INTERVAL and time.monotonic() - self._synced_at >= TRANSCRIPTION_RESYNC_INTERVAL:
+                # При неудаче время не сдвигается — повтор на следующем круге
+                await self._full_sync()
+
+    async def wait_for(self, base_filename: str):
+        """Возвращает VTT-файл для встречи, дожидаясь его появления в папке."""
+        f = self.files.get(base_filename)
+        if f is not None:
+            return f
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(base_filename, []).append(future)
+        try:
+            return await future
+        finally:
+            waiters = self._waiters.get(base_filename)
+            if waiters and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del self._waiters[base_filename]
+
+    def waiting(self) -> list:
+        return sorted(self._waiters)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,190 @@
+import bisect
+import os
+import numpy as np
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+from services.audio_service import load_waveform, frame_energy, ENERGY_FRAME_SECONDS
+
+load_dotenv()
+
+# Вырезать длинные паузы перед диаризацией и ASR
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1").lower() in ("1", "true", "yes")
+# Насколько громкость речи должна превышать уровень фонового шума, дБ
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# Тишина короче этого остаётся внутри участка речи (паузы между фразами не режутся), секунды
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "3"))
+# Запас вокруг каждого участка речи, секунды
+VAD_PAD_SECONDS = float(os.getenv("VAD_PAD_SECONDS", "0.5"))
+# Всплески короче этого (щелчки, уведомления) не считаются речью, секунды
+VAD_MIN_SPEECH_SECONDS = float(os.getenv("VAD_MIN_SPEECH_SECONDS", "0.3"))
+# Если речи больше этой доли записи, аудио не пересобирается — выигрыш не окупит лишнюю запись
+VAD_MAX_SPEECH_RATIO = float(os.getenv("VAD_MAX_SPEECH_RATIO", "0.95"))
+
+
+def vad_config() -> dict:
+    """Параметры VAD, влияющие на результат диаризации и ASR (входят в ключи кэша)."""
+    if not VAD_ENABLED:
+        return {"vad": None}
+    return {"vad": {
+        "margin_db": VAD_MARGIN_DB,
+        "min_silence": VAD_MIN_SILENCE_SECONDS,
+        "pad": VAD_PAD_SECONDS,
+        "min_speech": VAD_MIN_SPEECH_SECONDS,
+        "max_ratio": VAD_MAX_SPEECH_RATIO,
+    }}
+
+
+def _runs(mask) -> list:
+    """Пары (первый, последний + 1) индексов для непрерывных участков True."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def detect_speech(samples, sample_rate: int, frame_seconds: float = ENERGY_FRAME_SECONDS) -> list:
+    """
+    Энергетический VAD: участки речи [(start, end), ...] в секундах.
+
+    Порог адаптивный — на VAD_MARGIN_DB выше уровня фона (10-й перцентиль громкости кадров),
+    поэтому не зависит от общей громкости записи. Короткие паузы склеиваются, короткие всплески
+    отбрасываются, вокруг речи оставляется запас VAD_PAD_SECONDS.
+    """
+    duration = len(samples) / sample_rate
+    energy = frame_energy(samples, sample_rate, frame_seconds)
+    if len(energy) == 0:
+        return []
+
+    level = 20 * np.log10(energy + 1e-3)
+    noise_floor = np.percentile(level, 10)
+    speech = level > noise_floor + VAD_MARGIN_DB
+
+    regions = []
+    for first, last in _runs(speech):
+        start, end = float(first * frame_seconds), float(last * frame_seconds)
+        if regions and start - regions[-1][1] < VAD_MIN_SILENCE_SECONDS:
+            regions[-1][1] = end
+        else:
+            regions.append([start, end])
+
+    result = []
+    for start, end in regions:
+        if end - start < VAD_MIN_SPEECH_SECONDS:
+            continue
+        start = max(0.0, start - VAD_PAD_SECONDS)
+        end = min(duration, end + VAD_PAD_SECONDS)
+        if result and start <= result[-1][1]:
+            result[-1][1] = end
+        else:
+            result.append([start, end])
+    return [(round(start, 3), round(end, 3)) for start, end in result]
+
+
+def build_timeline(regions: list) -> list:
+    """
+    Таблица пересчёта времени: [[original_start, original_end, trimmed_start], ...].
+    Участок речи original_start..original_end в склеенном аудио начинается с trimmed_start.
+    """
+    table = []
+    position = 0.0
+    for start, end in regions:
+        table.append([start, end, round(position, 3)])
+        position += end - start
+    return table
+
+
+def _restore_table(items: SegmentTable, table: list, split: bool) -> SegmentTable:
+    """restore_timeline для SegmentTable: сдвиги считаются сразу для всех строк."""
+    original_starts, original_ends, trimmed_starts = (np.asarray(column, dtype=np.float64) for column in zip(*table))
+    trimmed_ends = trimmed_starts + original_ends - original_starts
+    starts, ends = items.starts, items.ends
+    index = np.maximum(np.searchsorted(trimmed_starts, starts, side="right") - 1, 0)
+
+    if not split:
+        shift = original_starts[index] - trimmed_starts[index]
+        return items.with_times(
+            np.round(starts + shift, 3),
+            np.round(np.minimum(ends + shift, original_ends[index]), 3)
+        )
+
+    # Каждая строка превращается в куски по всем участкам, которые она пересекает
+    last = np.maximum(np.searchsorted(trimmed_starts, ends, side="left"), index + 1)
+    rows = np.repeat(np.arange(len(items)), last - index)
+    pieces = np.arange(len(rows)) - np.repeat(np.cumsum(last - index) - (last - index), last - index) + index[rows]
+    piece_starts = np.maximum(starts[rows], trimmed_starts[pieces])
+    piece_ends = np.minimum(ends[rows], trimmed_ends[pieces])
+    keep = piece_ends > piece_starts
+    rows, pieces = rows[keep], pieces[keep]
+    shift = original_starts[pieces] - trimmed_starts[pieces]
+    return items.take(rows).with_times(
+        np.round(piece_starts[keep] + shift, 3),
+        np.round(piece_ends[keep] + shift, 3)
+    )
+
+
+def restore_timeline(items, table: list, split: bool = False):
+    """
+    Переводит start/end элементов (SegmentTable или [{start, end, ...}]) из склеенного аудио в исходную шкалу.
+
+    split=True (сегменты диаризации): сегмент, пересекающий стык участков, делится на части,
+    чтобы не захватывать вырезанную тишину. split=False (слова): слово остаётся целым
+    и относится к участку, в котором начинается.
+    """
+    if not table:
+        return items
+    if isinstance(items, SegmentTable):
+        return _restore_table(items, table, split)
+    trimmed_starts = [row[2] for row in table]
+    trimmed_ends = [row[2] + row[1] - row[0] for row in table]
+
+    restored = []
+    for item in items:
+        start, end = item["start"], item["end"]
+        index = max(0, bisect.bisect_right(trimmed_starts, start) - 1)
+        if not split:
+            original_start, original_end, trimmed_start = table[index]
+            restored.append({
+                **item,
+                "start": round(original_start + start - trimmed_start, 3),
+                "end": round(min(original_start + end - trimmed_start, original_end), 3),
+            })
+            continue
+
+        while index < len(table) and trimmed_starts[index] < end:
+            original_start, original_end, trimmed_start = table[index]
+            piece_start = max(start, trimmed_start)
+            piece_end = min(end, trimmed_ends[index])
+            if piece_end > piece_start:
+                restored.append({
+                    **item,
+                    "start": round(original_start + piece_start - trimmed_start, 3),
+                    "end": round(original_start + piece_end - trimmed_start, 3),
+                })
+            index += 1
+    return restored
+
+
+def analyze_speech(audio_path: str) -> dict:
+    """
+    Этап VAD: участки речи и таблица пересчёта времени.
+    trim=False — VAD отключён или речи почти вся запись, обработка идёт по исходному аудио.
+    """
+    if not VAD_ENABLED:
+        return {"trim": False, "timeline": []}
+
+    samples, sample_rate = load_waveform(audio_path)
+    duration = len(samples) / sample_rate
+    regions = detect_speech(samples, sample_rate)
+    speech = sum(end - start for start, end in regions)
+    trim = bool(regions) and bool(speech < duration * VAD_MAX_SPEECH_RATIO)
+
+    logger.info(
+        f"[VAD] {os.path.basename(audio_path)}: речь {speech / 60:.1f} из {duration / 60:.1f} мин "
+        f"({len(regions)} участков){'' if trim else ', аудио не сокращается'}"
+    )
+    return {
+        "duration": round(duration, 3),
+        "speech": round(speech, 3),
+        "trim": trim,
+        "timeline": build_timeline(regions) if trim else [],
+    }
@@ -1,22 +1,27 @@
+import asyncio
 import os
-import whisper
 from core.logger import logger
 from core.utils import safe_execute
-from services.audio_service import extract_audio, diarize_audio
-from services.drive_service import download_file_to_path, save_transcription_to_drive
-import time
+from core.pipeline import PipelineGraph
+from core.scratch import JobScratch
+from core.segments import SegmentTable
+from core.result_cache import cache_key, file_sha256, get_result_cache
+from services.audio_service import extract_audio, extract_audio_stream, load_waveform, upload_audio_path, write_speech_audio
+from services.asr_engine import TranscriptionEngine, select_asr_engine
+from services.diarization_engine import get_diarization_engine
+from services.vad import analyze_speech, restore_timeline, vad_config
+from services.speaker_assignment import assign_speakers_to_text
+from services.drive_service import download_file_to_path, save_transcription_to_drive, get_file_link, stream_file_to
 from typing import List, Dict
 import shutil
 import subprocess
 from services.airtable_service import AirtableClient
 from services.openai_promt_generation_service import openai_request
-from services.synchronizw_teams_service import map_whisper_speakers_by_iter, parse_vtt_text
+from services.synchronizw_teams_service import map_whisper_speakers_by_iter, parse_vtt_file
 from langcodes import Language
 import re
 from datetime import datetime
 import sys
-import assemblyai as aai
-import glob
 
 # --- Инициализация объекта Airtable ---
 airtable = AirtableClient(
@@ -32,28 +37,12 @@ else:
     # Для Linux/macOS используем системный ffmpeg
     FFMPEG_BIN = "/usr/bin/ffmpeg"  # Обычно установлен через apt/yum/brew
 
+# Подавать видео с Drive прямо в ffmpeg, не сохраняя MP4 на диск
+DRIVE_STREAM_TO_FFMPEG = os.getenv("DRIVE_STREAM_TO_FFMPEG", "0").lower() in ("1", "true", "yes")
+# Сколько ждать VTT из Teams, часов (0 — без ограничения); по истечении попытка обработки считается неудачной
+TEAMS_VTT_TIMEOUT_HOURS = float(os.getenv("TEAMS_VTT_TIMEOUT_HOURS", "24"))
 
 
-def prepare_audio_for_transcription(input_path: str, output_path: str):
-    """
-    Подготавливает аудио для транскрипции:
-    - Конвертирует в PCM16
-    - Моно
-    - 16kHz
-    - Нормализует громкость
-    - Подавляет шум (basic noise reduction)
-    """
-    command = [
-        FFMPEG_BIN,
-        "-y",
-        "-i", input_path,
-        "-af", "aresample=16000,volume=1.0,afftdn",  # ресемплинг, нормализация, шумоподавление
-        "-ac", "1",  # моно
-        "-c:a", "pcm_s16le",
-        output_path
-    ]
-    subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
 def get_audio_duration(input_path: str) -> float:
     """
     Получаем длительность аудио в секундах через ffmpeg
@@ -72,134 +61,28 @@ def get_audio_duration(input_path: str) -> float:
             return int(h) * 3600 + int(m) * 60 + float(s)
     return 0.0
 
-def export_audio_segment_ffmpeg(input_path: str, start: float, end: float, output_path: str):
-    """
-    Нарезка сегмента аудио через ffmpeg.
-    start, end в секундах
-    """
-    command = [
-        FFMPEG_BIN,
-        "-y",
-        "-i", input_path,
-        "-ss", str(start),
-        "-to", str(end),
-        "-acodec", "pcm_s16le",
-        "-ar", "16000",
-        "-ac", "1",
-        output_path
-    ]
-    subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
 
-
-def transcribe_audio(
+async def transcribe_audio(
         audio_path: str,
-        api_key: str,
-        language: str = "uk"
+        language: str = "uk",
+        engine: TranscriptionEngine = None
 ):
     """
-    Транскрипция аудио через AssemblyAI.
+    Транскрипция аудио выбранным движком (ASR_ENGINE): AssemblyAI или локальный faster-whisper.
     Возвращает:
       - full_text: весь текст
-      - all_segments: список слов с таймкодами {start, end, text, confidence}
+      - all_segments: SegmentTable слов с таймкодами (start, end, text, confidence)
     """
     audio_path = os.path.abspath(audio_path)
-    waited = 0
-    wait_timeout = 120
-    check_interval = 5
-
-    while not os.path.exists(audio_path):
-        if waited >= wait_timeout:
-            logger.error(f"[AssemblyAI] Файл не появился за {wait_timeout} секунд: {audio_path}")
-            return "", []
-        time.sleep(check_interval)
-        waited += check_interval
-
     try:
-        logger.info("[AssemblyAI] Подготовка аудио для транскрипции...")
-        prepared_path = os.path.join(os.path.dirname(audio_path), "_prepared_audio.wav")
-        prepare_audio_for_transcription(audio_path, prepared_path)
-
-        aai.settings.api_key = api_key
-        transcriber = aai.Transcriber()
-
-        logger.info(f"[AssemblyAI] Загружаем файл {prepared_path} на транскрипцию...")
-        transcript = transcriber.transcribe(
-            prepared_path,
-            config=aai.TranscriptionConfig(language_code=language)
-        )
-
-        if transcript.status == aai.TranscriptStatus.error:
-            logger.error(f"[AssemblyAI] Ошибка транскрипции: {transcript.error}")
-            return "", []
-
-        full_text = transcript.text.strip()
-        all_segments = []
-
-        # transcript.words — список слов с таймкодами
-        for w in transcript.words:
-            start_s = w.start / 1000.0
-            end_s = w.end / 1000.0
-            all_segments.append({
-                "start": start_s,
-                "end": end_s,
-                "text": w.text,
-                "confidence": getattr(w, "confidence", None)
-            })
-
-        logger.info(f"[AssemblyAI] Транскрипция завершена. Слов: {len(all_segments)}, символов: {len(full_text)}")
-
-        os.remove(prepared_path)
+        engine = engine or select_asr_engine(audio_path)
+        full_text, all_segments = await engine.transcribe(audio_path, language)
+        logger.info(f"[ASR:{engine.name}] Транскрипция завершена. Слов: {len(all_segments)}, символов: {len(full_text)}")
         return full_text, all_segments
 
     except Exception as e:
-        logger.error(f"[AssemblyAI] Ошибка транскрипции: {e}")
-        return "", []
-
-
-def assign_speakers_to_text(
-    diarization_segments: list,
-    transcription_segments: list
-) -> list:
-    """
-    Группирует слова в фразы по спикерам.
-    """
-    assigned_phrases = []
-    current_speaker = None
-    current_phrase = {"start": None, "end": None, "speaker": None, "text": ""}
-
-    for word in transcription_segments:
-        # находим спикера для слова
-        speaker = None
-        for d in diarization_segments:
-            if word['start'] >= d['start'] and word['end'] <= d['end']:
-                speaker = d['speaker']
-                break
-        if speaker is None and diarization_segments:
-            closest = min(diarization_segments, key=lambda d: abs(d['start'] - word['start']))
-            speaker = closest['speaker']
-
-        # если спикер сменился, сохраняем предыдущую фразу
-        if speaker != current_speaker:
-            if current_speaker is not None:
-                assigned_phrases.append(current_phrase)
-            # начинаем новую фразу
-            current_phrase = {
-                "start": word['start'],
-                "end": word['end'],
-                "speaker": speaker,
-                "text": word['text']
-            }
-            current_speaker = speaker
-        else:
-            # продолжаем текущую фразу
-            current_phrase['end'] = word['end']
-            current_phrase['text'] += " " + word['text']
-
-    # добавляем последнюю фразу
-    if current_phrase['text']:
-        assigned_phrases.append(current_phrase)
-
-    return assigned_phrases
+        logger.error(f"[ASR] Ошибка транскрипции: {e}")
+        return "", SegmentTable.empty()
 
 
 def get_langoage(name):
@@ -237,134 +120,241 @@ def extract_meeting_date(filename: str) -> str:
     return dt.date().isoformat()
 
 
-def clear_temp_folder(substring: str):
+async def process_file(file, service, DATA_DIR, base_filename, record_id, wait_vtt, stage_context=None, checkpoint=None):
     """
-    Удаляет все файлы из папки 'temp' в корне проекта, в названии которых есть переданная подстрока.
+    Обработка встречи в виде графа этапов.
 
-    Параметры:
-        substring (str): Подстрока для поиска в имени файла.
+    Медиа-этапы (скачивание, извлечение аудио, диаризация, ASR) стартуют сразу после появления MP4.
+    VTT из Teams ожидается параллельно (wait_vtt — корутинная функция, возвращающая файл транскрипции)
+    и присоединяется только на этапе сопоставления спикеров.
+    checkpoint — хранилище результатов этапов (см. PipelineGraph): завершённые этапы не повторяются.
+    Возвращает True, если все этапы выполнены успешно.
     """
-    project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
-    temp_folder = os.path.join(project_root, "temp")
-
-    if not os.path.exists(temp_folder):
-        logger.warning(f"Папка {temp_folder} не существует")
-        return
-
-    # Находим все файлы (не папки) в temp
-    files = [f for f in glob.glob(os.path.join(temp_folder, "*")) if os.path.isfile(f)]
-
-    # Фильтруем только те файлы, в имени которых есть substring
-    matched_files = [f for f in files if substring in os.path.basename(f)]
-
-    if not matched_files:
-        logger.info(f"В папке {temp_folder} нет файлов с подстрокой '{substring}'")
-        return
-
-    for f in matched_files:
-        try:
-            os.remove(f)
-            logger.info(f"Удалён файл: {f}")
-        except Exception as e:
-            logger.error(f"Не удалось удалить файл {f}: {e}")
-
-async def process_file(file, service,DATA_DIR,base_filename,record_id,transcription_file):
-    try:
-        # Абсолютный путь к рабочей директории
-        DATA_DIR = os.path.abspath(DATA_DIR)
-        video_name = file['name']
-        video_path = os.path.join(DATA_DIR, video_name)
-
-        teams_name = transcription_file['name']
-        teams_path = os.path.join(DATA_DIR, teams_name)
-
-        # Скачиваем видео
+    video_name = file['name']
+    # Своя временная папка для задачи — параллельные встречи не трогают файлы друг друга.
+    # При потоковом извлечении MP4 на диск не попадает, а размер аудио заранее неизвестен —
+    # его (и MP4 при откате на скачивание) проверяет check_quota после записи
+    expected_bytes = 0 if DRIVE_STREAM_TO_FFMPEG else int(file.get('size') or 0)
+    scratch = JobScratch(base_filename, root=DATA_DIR, expected_bytes=expected_bytes)
+    video_path = scratch.file(video_name)
+    scratch.add_media(video_path)
+
+    async def download_video():
         logger.info(f"[Worker] Скачиваем {video_name}...")
-        if not safe_execute(download_file_to_path, file['id'], video_path):
-            logger.error(f"[Worker] Ошибка скачивания {video_name}")
-            return
-
-        logger.info(f"[Worker] Скачиваем {teams_path }...")
-        if not safe_execute(download_file_to_path, transcription_file['id'], teams_path ):
-            logger.error(f"[Worker] Ошибка скачивания {teams_path }")
-            return
-
-
-        # Извлекаем аудио в память (или временный файл, но без сохранения на диск)
-        # Для простоты используем временный файл, удалим после обработки
-
-        audio_temp_path =  extract_audio(video_path, video_name)
-
-
-        # Диаризация
-        segments = diarize_audio(audio_temp_path)
-
-        #Получение языка
+        if not await asyncio.to_thread(safe_execute, download_file_to_path, file['id'], video_path):
+            raise RuntimeError(f"Ошибка скачивания {video_name}")
+        scratch.check_quota()
+        return video_path
+
+    async def extract(video_path):
+        audio_temp_path = await asyncio.to_thread(extract_audio, video_path, video_name, scratch.path)
+        if not audio_temp_path:
+            raise RuntimeError(f"Не удалось извлечь аудио из {video_name}")
+        scratch.add_media(audio_temp_path, upload_audio_path(audio_temp_path))
+        scratch.check_quota()
+        return audio_temp_path
+
+    async def stream_extract():
+        # Скачивание и декодирование идут одновременно: куски с Drive сразу уходят в stdin ffmpeg
+        logger.info(f"[Worker] Потоковое извлечение аудио из {video_name}...")
+        audio_temp_path = await asyncio.to_thread(
+            extract_audio_stream,
+            lambda sink: stream_file_to(file['id'], sink),
+            video_name,
+            scratch.path
+        )
+        if not audio_temp_path:
+            # MP4 без faststart (moov в конце файла) нельзя декодировать из pipe — качаем целиком
+            logger.warning(f"[Worker] Потоковое извлечение не удалось, скачиваем {video_name} на диск")
+            return await extract(await download_video())
+        scratch.add_media(audio_temp_path, upload_audio_path(audio_temp_path))
+        scratch.check_quota()
+        return audio_temp_path
+
+    async def update_airtable(fields):
+        # update_record возвращает None при любой ошибке — этап не должен считаться выполненным
+        if await airtable.update_record(record_id, fields) is None:
+            raise RuntimeError(f"Не удалось обновить запись Airtable {record_id}: {', '.join(fields)}")
+
+    async def audio_hash(audio_temp_path):
+        return await asyncio.to_thread(file_sha256, audio_temp_path)
+
+    async def cached(kind, content_hash, config, compute):
+        # Повторная загрузка той же записи или повторный запуск после исправлений не платит за ASR/диаризацию
+        cache = get_result_cache()
+        key = cache_key(kind, content_hash, **config)
+        found, result = await asyncio.to_thread(cache.get, key)
+        if found:
+            logger.info(f"[Worker] {video_name}: результат {kind} взят из кэша")
+            return result
+        result = await compute()
+        await asyncio.to_thread(cache.put, key, result)
+        return result
+
+    async def vad(audio_temp_path):
+        return await asyncio.to_thread(analyze_speech, audio_temp_path)
+
+    async def speech_audio(audio_temp_path, speech):
+        # Диаризация и ASR получают только речь: ожидание участников, демонстрация экрана без звука
+        # и тишина после встречи не тратят CPU и оплачиваемые минуты
+        if not speech["trim"]:
+            return audio_temp_path
+        samples, sample_rate = await asyncio.to_thread(load_waveform, audio_temp_path)
+        regions = [(start, end) for start, end, _ in speech["timeline"]]
+        speech_path = await asyncio.to_thread(
+            write_speech_audio, samples, sample_rate, regions, scratch.file(f"speech_{base_filename}.wav")
+        )
+        if not speech_path:
+            raise RuntimeError(f"Не удалось собрать участки речи {video_name}")
+        scratch.add_media(speech_path, upload_audio_path(speech_path))
+        scratch.check_quota()
+        return speech_path
+
+    async def diarize(speech_path, speech, content_hash):
+        # Диаризация — CPU-нагрузка, выполняется в пуле процессов с уже загруженным пайплайном
+        async def compute():
+            segments = await get_diarization_engine().diarize(speech_path)
+            if not segments:
+                raise RuntimeError("Диаризация не вернула сегментов")
+            return restore_timeline(segments, speech["timeline"], split=True)
+
+        engine = get_diarization_engine()
+        return await cached("diarization", content_hash, {**engine.config(), **vad_config()}, compute)
+
+    async def transcribe(speech_path, speech, content_hash):
+        # ASR идёт параллельно с диаризацией: удалённо (AssemblyAI) или в пуле потоков локальной модели
         lang = get_langoage(base_filename)
-
-        # Транскрипция
-        asembl_api_key = os.getenv("ASSEMBLY_AI_KEY")
-        full_text, transcription_segments = transcribe_audio(audio_temp_path, asembl_api_key , lang)
-
-        speaker_text = assign_speakers_to_text(segments,transcription_segments)
-
-        file_link = save_transcription_to_drive(
+        engine = await asyncio.to_thread(select_asr_engine, speech_path)
+
+        async def compute():
+            full_text, transcription_segments = await transcribe_audio(speech_path, lang, engine)
+            if not transcription_segments:
+                raise RuntimeError("Транскрипция не вернула слов")
+            return restore_timeline(transcription_segments, speech["timeline"])
+
+        return await cached("transcription", content_hash, {
+            "language": lang, **engine.config(), **vad_config()
+        }, compute)
+
+    async def release_media(segments, transcription_segments):
+        # Диаризация и ASR сохранены — видео и аудио больше не нужны, и ожидание VTT из Teams
+        # не держит их на диске до конца задачи
+        await asyncio.to_thread(scratch.release_media)
+
+    async def assign(segments, transcription_segments):
+        # Результаты из старых чекпоинтов и кэша (списки словарей) приводятся к SegmentTable внутри
+        return assign_speakers_to_text(segments, transcription_segments)
+
+    async def save_whisper_doc(speaker_text):
+        file_link = await asyncio.to_thread(
+            save_transcription_to_drive,
             speaker_text,
             folder_id=os.getenv("WHISPER_AI_TRANSCRIPTION"),
             base_filename=base_filename
         )
+        await update_airtable({'Link to whisper ai transcription': file_link.get("webViewLink")})
 
-
-        await airtable.update_record(record_id, {'Link to whisper ai transcription': file_link.get("webViewLink")})
-
-        with open(teams_path, "r", encoding="utf-8") as f:
-            vtt_text = f.read()
-
-        vtt_segments = parse_vtt_text(vtt_text)
-
-        teams_trans_doc_link = save_transcription_to_drive(
+    async def wait_teams_vtt():
+        try:
+            transcription_file = await asyncio.wait_for(wait_vtt(), TEAMS_VTT_TIMEOUT_HOURS * 3600 or None)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Транскрипция Teams не появилась за {TEAMS_VTT_TIMEOUT_HOURS:g} ч")
+        await update_airtable({'Link to teams transcription': get_file_link(transcription_file['id'])})
+        return transcription_file
+
+    async def download_vtt(transcription_file):
+        teams_path = scratch.file(transcription_file['name'])
+        logger.info(f"[Worker] Скачиваем {teams_path}...")
+        if not await asyncio.to_thread(safe_execute, download_file_to_path, transcription_file['id'], teams_path):
+            raise RuntimeError(f"Ошибка скачивания {teams_path}")
+        return teams_path
+
+    async def parse_vtt(teams_path):
+        # Файл читается построчно, многострочные реплики Teams не теряются
+        return await asyncio.to_thread(parse_vtt_file, teams_path)
+
+    async def save_teams_doc(vtt_segments):
+        teams_trans_doc_link = await asyncio.to_thread(
+            save_transcription_to_drive,
             vtt_segments,
-            folder_id = os.getenv("TEAMS_TRANS_DOC"),
+            folder_id=os.getenv("TEAMS_TRANS_DOC"),
             base_filename=base_filename
         )
         logger.info(teams_trans_doc_link)
-        await airtable.update_record(record_id, {'Link to teams transcription doc': teams_trans_doc_link.get("webViewLink")})
-
-        whisper_segments = speaker_text
-        new_segments, stats = map_whisper_speakers_by_iter(whisper_segments, vtt_segments, tolerance=0.7)
+        await update_airtable({'Link to teams transcription doc': teams_trans_doc_link.get("webViewLink")})
 
+    async def map_speakers(speaker_text, vtt_segments):
+        # Таблица не меняется на месте: переименованная копия делит с ней массивы,
+        # поэтому документ whisper, который выгружается параллельно, остаётся с SPEAKER_*
+        return map_whisper_speakers_by_iter(SegmentTable.coerce(speaker_text), vtt_segments)
 
-        synchro_link = save_transcription_to_drive(
+    async def save_synchro_doc(mapped):
+        new_segments, stats = mapped
+        synchro_link = await asyncio.to_thread(
+            save_transcription_to_drive,
             new_segments,
             folder_id=os.getenv("SYNCRO_TRANSCRIPTION"),
             base_filename=base_filename
         )
         logger.info(synchro_link)
-        await airtable.update_record(record_id, {'Link to synchronized transcription': synchro_link.get("webViewLink")})
+        await update_airtable({'Link to synchronized transcription': synchro_link.get("webViewLink")})
 
+    async def summary(mapped):
+        new_segments, stats = mapped
         openai_answer = await openai_request(new_segments, base_filename)
+        if not openai_answer:
+            # Этап не сохраняется как выполненный — повторная попытка продолжит с суммирования
+            raise RuntimeError("OpenAI не вернул подсумок встречи")
+        return openai_answer
+
+    async def save_summary(openai_answer, mapped):
+        # Подсумок уже в чекпоинте: если запись в Airtable упадёт, повтор не обращается к OpenAI
+        if openai_answer is None:
+            # Чекпоинт прежней версии этапа summary: подсумок тогда записывался в Airtable сразу
+            return
+        new_segments, stats = mapped
+        await update_airtable({'Summury': openai_answer, 'Speakers': stats.get("speaker_names")})
 
-        speakers = stats.get("speaker_names")
-
-        meeting_date = extract_meeting_date(base_filename)
-
-        await airtable.update_record(record_id, {'Summury':  openai_answer})
-
-        await airtable.update_record(record_id, {'Speakers': speakers})
-
-        await airtable.update_record(record_id, {'Meeting Date': meeting_date})
-
-        # Удаляем временный аудио файл
+    async def meeting_date():
         try:
-            os.remove(audio_temp_path)
-            os.remove( video_path)
-            os.remove(teams_path)
-        except Exception as e:
-            logger.error(f"[Worker] Ошибка удаления временых файлов: {e}")
+            date = extract_meeting_date(base_filename)
+        except ValueError as e:
+            # Повтор ничего не изменит — встреча обрабатывается без даты
+            logger.warning(f"[Worker] {e}, поле Meeting Date не заполняется")
+            return
+        await update_airtable({'Meeting Date': date})
+
+    graph = PipelineGraph(video_name, stage_context, checkpoint)
+    if DRIVE_STREAM_TO_FFMPEG:
+        graph.add("extract_audio", stream_extract, heavy=True, persist=False)
+    else:
+        # Локальные файлы не сохраняются: после перезапуска их нет, этапы повторятся только при необходимости
+        graph.add("download_video", download_video, heavy=True, persist=False)
+        graph.add("extract_audio", extract, ["download_video"], heavy=True, persist=False)
+    graph.add("audio_hash", audio_hash, ["extract_audio"])
+    graph.add("vad", vad, ["extract_audio"])
+    graph.add("speech_audio", speech_audio, ["extract_audio", "vad"], persist=False)
+    graph.add("diarize", diarize, ["speech_audio", "vad", "audio_hash"], heavy=True)
+    graph.add("transcribe", transcribe, ["speech_audio", "vad", "audio_hash"], heavy=True)
+    graph.add("release_media", release_media, ["diarize", "transcribe"])
+    graph.add("assign_speakers", assign, ["diarize", "transcribe"])
+    graph.add("save_whisper_doc", save_whisper_doc, ["assign_speakers"])
+    graph.add("wait_vtt", wait_teams_vtt)
+    graph.add("download_vtt", download_vtt, ["wait_vtt"], persist=False)
+    graph.add("parse_vtt", parse_vtt, ["download_vtt"])
+    graph.add("save_teams_doc", save_teams_doc, ["parse_vtt"])
+    graph.add("map_speakers", map_speakers, ["assign_speakers", "parse_vtt"])
+    graph.add("save_synchro_doc", save_synchro_doc, ["map_speakers"])
+    graph.add("summary", summary, ["map_speakers"])
+    graph.add("save_summary", save_summary, ["summary", "map_speakers"])
+    graph.add("meeting_date", meeting_date)
 
-        # TODO: сохраняем segments и transcript_text в Google Drive и Airtable
+    try:
+        await graph.run()
         logger.info(f"[Worker] Обработка {video_name} завершена")
-        clear_temp_folder(base_filename)
+        return True
     except Exception as e:
         logger.error(f"[Worker] Ошибка при обработке {file['name']}: {e}")
-        clear_temp_folder(base_filename)
+        return False
+    finally:
+        scratch.cleanup()
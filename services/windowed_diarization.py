@@ -0,0 +1,206 @@
+import os
+import time
+import numpy as np
+import torch
+from dotenv import load_dotenv
+from core.logger import logger
+from core.segments import SegmentTable
+from services.audio_service import load_waveform, frame_energy, ENERGY_FRAME_SECONDS
+from services.chunked_transcription import find_cut_points
+
+load_dotenv()
+
+# Длина окна диаризации, секунды
+DIARIZATION_WINDOW_SECONDS = float(os.getenv("DIARIZATION_WINDOW_SECONDS", "1800"))
+# Записи длиннее этого (секунды) диаризуются окнами; 0 — всегда целиком
+DIARIZATION_WINDOWED_MIN_SECONDS = float(os.getenv("DIARIZATION_WINDOWED_MIN_SECONDS", "7200"))
+# Порог косинусного расстояния при объединении спикеров разных окон
+DIARIZATION_CLUSTER_THRESHOLD = float(os.getenv("DIARIZATION_CLUSTER_THRESHOLD", "0.7"))
+# Сколько секунд речи спикера в окне использовать для его эмбеддинга
+DIARIZATION_EMBED_MAX_SECONDS = float(os.getenv("DIARIZATION_EMBED_MAX_SECONDS", "30"))
+
+MIN_EMBED_SEGMENT_SECONDS = 0.5
+MAX_EMBED_SEGMENT_SECONDS = 10.0
+
+
+def windowed_config() -> dict:
+    """Параметры оконной диаризации, влияющие на результат (входят в ключ кэша)."""
+    if DIARIZATION_WINDOWED_MIN_SECONDS <= 0:
+        return {"windowed": None}
+    return {"windowed": {
+        "window": DIARIZATION_WINDOW_SECONDS,
+        "min_duration": DIARIZATION_WINDOWED_MIN_SECONDS,
+        "threshold": DIARIZATION_CLUSTER_THRESHOLD,
+        "embed_seconds": DIARIZATION_EMBED_MAX_SECONDS,
+    }}
+
+
+def use_windowed(duration: float) -> bool:
+    return 0 < DIARIZATION_WINDOWED_MIN_SECONDS < duration
+
+
+def _embedding_model(pipeline):
+    """Модель эмбеддингов спикеров из уже загруженного пайплайна (без повторной загрузки весов)."""
+    model = getattr(pipeline, "_embedding", None)
+    if model is None:
+        from pyannote.audio.pipelines.speaker_verification import PretrainedSpeakerEmbedding
+        model = PretrainedSpeakerEmbedding(pipeline.embedding, use_auth_token=os.getenv("HF_TOKEN"))
+    return model
+
+
+def _speaker_embedding(model, waveform, sample_rate: int, turns: list):
+    """
+    Эмбеддинг спикера в окне: среднее (с весом по длительности) эмбеддингов его самых длинных реплик.
+    turns — [(start, end)] в секундах относительно начала окна. Возвращает нормированный вектор или None.
+    """
+    vectors = []
+    weights = []
+    budget = DIARIZATION_EMBED_MAX_SECONDS
+    for start, end in sorted(turns, key=lambda t: t[0] - t[1]):
+        if budget <= 0 or end - start < MIN_EMBED_SEGMENT_SECONDS:
+            break
+        end = min(end, start + MAX_EMBED_SEGMENT_SECONDS, start + budget)
+        piece = waveform[int(start * sample_rate):int(end * sample_rate)]
+        with torch.inference_mode():
+            vector = np.asarray(model(torch.from_numpy(piece)[None, None]))[0]
+        if np.all(np.isfinite(vector)):
+            vectors.append(vector)
+            weights.append(end - start)
+        budget -= end - start
+
+    if not vectors:
+        return None
+    vector = np.average(np.stack(vectors), axis=0, weights=weights)
+    return vector / (np.linalg.norm(vector) + 1e-9)
+
+
+def cluster_speakers(embeddings: np.ndarray, windows: np.ndarray, threshold: float = DIARIZATION_CLUSTER_THRESHOLD) -> np.ndarray:
+    """
+    Глобальная агломеративная кластеризация эмбеддингов (window, local speaker) со средней связью.
+    Спикеры одного окна не объединяются: pyannote уже решил, что это разные люди, поэтому слияние
+    кластеров, в которых есть спикеры одного окна, запрещено на каждом шаге (а не штрафом в матрице,
+    который усредняется по мере роста кластеров). Возвращает номер глобального спикера для каждой строки.
+    """
+    count = len(embeddings)
+    if count == 1:
+        return np.zeros(1, dtype=int)
+
+    # Суммы попарных расстояний между кластерами: средняя связь = сумма / (размер a · размер b)
+    sums = np.clip(1.0 - embeddings @ embeddings.T, 0.0, 2.0)
+    sizes = np.ones(count)
+    _, window_index = np.unique(windows, return_inverse=True)
+    members = np.zeros((count, window_index.max() + 1), dtype=bool)
+    members[np.arange(count), window_index] = True
+    alive = np.ones(count, dtype=bool)
+    labels = np.arange(count)
+
+    while True:
+        average = sums / np.outer(sizes, sizes)
+        forbidden = (members.astype(np.int32) @ members.T.astype(np.int32)) > 0
+        forbidden |= ~alive[:, None] | ~alive[None, :]
+        average[forbidden] = np.inf
+        a, b = np.unravel_index(np.argmin(average), average.shape)
+        if not average[a, b] <= threshold:
+            break
+        # b вливается в a
+        sums[a] += sums[b]
+        sums[:, a] += sums[:, b]
+        sizes[a] += sizes[b]
+        members[a] |= members[b]
+        alive[b] = False
+        labels[labels == b] = a
+
+    _, clusters = np.unique(labels, return_inverse=True)
+    return clusters
+
+
+def _merge_adjacent(segments: list, gap: float = 0.5) -> list:
+    """Склеивает соседние сегменты одного спикера, разрезанные границей окна."""
+    merged = []
+    for seg in sorted(segments, key=lambda s: (s["start"], s["end"])):
+        if merged and merged[-1]["speaker"] == seg["speaker"] and seg["start"] - merged[-1]["end"] <= gap:
+            merged[-1]["end"] = max(merged[-1]["end"], seg["end"])
+        else:
+            merged.append(dict(seg))
+    return merged
+
+
+def diarize_windowed(audio_path: str, pipeline, window_seconds: float = DIARIZATION_WINDOW_SECONDS) -> SegmentTable:
+    """
+    Оконная диаризация длинной записи с ограниченной памятью.
+
+    Запись режется по паузам на окна ~window_seconds; каждое окно читается из memmap и диаризуется
+    отдельно, так что в памяти одновременно только одно окно. Для каждого локального спикера окна
+    считается эмбеддинг, в конце эмбеддинги всех окон кластеризуются, и локальные метки
+    заменяются глобальными SPEAKER_XX. Возвращает SegmentTable сегментов (start, end, speaker).
+    """
+    samples, sample_rate = load_waveform(audio_path)
+    duration = len(samples) / sample_rate
+    cuts = find_cut_points(frame_energy(samples, sample_rate), ENERGY_FRAME_SECONDS, duration, window_seconds)
+    bounds = [0.0, *cuts, duration]
+    windows = list(zip(bounds, bounds[1:]))
+    model = _embedding_model(pipeline)
+
+    local_segments = []
+    speaker_keys = []
+    embeddings = []
+    started = time.monotonic()
+    for index, (window_start, window_end) in enumerate(windows):
+        window_started = time.monotonic()
+        first, last = int(window_start * sample_rate), int(window_end * sample_rate)
+        waveform = np.asarray(samples[first:last], dtype=np.float32) / 32768.0
+
+        diarization = pipeline({"waveform": torch.from_numpy(waveform)[None], "sample_rate": sample_rate})
+        turns = {}
+        for turn, _, speaker in diarization.itertracks(yield_label=True):
+            turns.setdefault(speaker, []).append((float(turn.start), float(turn.end)))
+            local_segments.append({
+                "start": window_start + float(turn.start),
+                "end": window_start + float(turn.end),
+                "key": (index, speaker),
+            })
+
+        for speaker, speaker_turns in turns.items():
+            vector = _speaker_embedding(model, waveform, sample_rate, speaker_turns)
+            if vector is not None:
+                speaker_keys.append((index, speaker))
+                embeddings.append(vector)
+        del waveform, diarization
+
+        elapsed = time.monotonic() - started
+        eta = elapsed / (index + 1) * (len(windows) - index - 1)
+        logger.info(
+            f"[Diarization] Окно {index + 1}/{len(windows)} ({window_start / 60:.0f}-{window_end / 60:.0f} мин): "
+            f"{len(turns)} спикеров за {time.monotonic() - window_started:.0f}s, осталось ~{eta / 60:.1f} мин"
+        )
+
+    if not local_segments:
+        return SegmentTable.empty()
+
+    labels = {}
+    if embeddings:
+        clusters = cluster_speakers(np.stack(embeddings), np.array([key[0] for key in speaker_keys]))
+        labels = {key: f"SPEAKER_{cluster:02d}" for key, cluster in zip(speaker_keys, clusters)}
+
+    # Спикер со слишком короткой речью для эмбеддинга получает метку ближайшего по времени сегмента
+    segments = []
+    unlabeled = []
+    for seg in local_segments:
+        speaker = labels.get(seg["key"])
+        item = {"start": round(seg["start"], 3), "end": round(seg["end"], 3), "speaker": speaker}
+        (segments if speaker else unlabeled).append(item)
+    if segments:
+        starts = np.array([seg["start"] for seg in segments])
+        for item in unlabeled:
+            nearest = int(np.argmin(np.abs(starts - item["start"])))
+            item["speaker"] = segments[nearest]["speaker"]
+            segments.append(item)
+    else:
+        segments = [{**item, "speaker": "SPEAKER_00"} for item in unlabeled]
+
+    segments = SegmentTable.from_dicts(_merge_adjacent(segments))
+    logger.info(
+        f"[Diarization] Оконная диаризация: {len(windows)} окон, "
+        f"{len(segments.speakers)} спикеров, {(time.monotonic() - started) / 60:.1f} мин"
+    )
+    return segments
@@ -0,0 +1,46 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+# Корень проекта — для пакетов core/services, scripts/ — для локальных имитаторов API
+sys.path[:0] = [ROOT, os.path.join(ROOT, "scripts")]
+# Состояние и кэш результатов — во временной папке, а не в state/ проекта
+os.environ.setdefault("STATE_DIR", tempfile.mkdtemp(prefix="tests_state_"))
+os.environ.setdefault("RESULT_CACHE_DIR", tempfile.mkdtemp(prefix="tests_cache_"))
+
+from core.logger import file_handler, logger  # noqa: E402
+
+# Ошибки, которые тесты вызывают намеренно, не пишутся в logs/errors.log
+logger.removeHandler(file_handler)
+
+_real_sleep = asyncio.sleep
+
+
+class FakeClock:
+    """Часы для тестов: asyncio.sleep не ждёт, а сдвигает monotonic() и запоминает задержку."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    async def sleep(self, delay, result=None):
+        if delay > 0:
+            self.sleeps.append(delay)
+            self.now += delay
+        # Отдаём управление циклу, как настоящий sleep
+        await _real_sleep(0)
+        return result
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
@@ -0,0 +1,136 @@
+import asyncio
+import struct
+
+import httpx
+import pytest
+
+import services.assemblyai_client as assemblyai
+from services.assemblyai_client import AssemblyAIError, AsyncAssemblyAIClient
+from fake_asr_server import FAKE, start_server
+
+
+def write_wav(path, seconds: float, sample_rate: int = 16000):
+    """PCM16 моно WAV из тишины нужной длительности."""
+    data_size = int(seconds * sample_rate) * 2
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, 1, 1,
+        sample_rate, sample_rate * 2, 2, 16, b"data", data_size
+    )
+    with open(path, "wb") as f:
+        f.write(header + b"\0" * data_size)
+    return path
+
+
+def run_with_server(scenario, **server_options):
+    """Запускает имитатор AssemblyAI и выполняет scenario(client, fake)."""
+    async def main():
+        runner, base_url = await start_server(latency=0, **server_options)
+        client = AsyncAssemblyAIClient("test", base_url=base_url)
+        try:
+            return await scenario(client, runner.app[FAKE])
+        finally:
+            await client.aclose()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def audio(tmp_path):
+    return write_wav(str(tmp_path / "speech.wav"), seconds=10)
+
+
+def test_transcribe_uploads_file_in_chunks(audio, monkeypatch, fake_clock):
+    monkeypatch.setattr(assemblyai, "UPLOAD_CHUNK_SIZE", 4096)
+
+    async def scenario(client, fake):
+        text, words = await client.transcribe(audio, "uk")
+        return text, words, fake
+
+    text, words, fake = run_with_server(scenario)
+    # Файл ушёл потоком (chunked) и целиком
+    assert fake.upload_bodies == [(10 * 16000 * 2 + 44, True)]
+    assert len(words) == 20
+    assert words[0].text == "слово0" and words[0].end == pytest.approx(0.4)
+    assert words[-1].start == pytest.approx(9.5)
+    assert text.startswith("слово0 слово1")
+
+
+def test_upload_is_retried_after_server_errors(audio, fake_clock):
+    async def scenario(client, fake):
+        return await client.upload(audio), fake
+
+    upload_url, fake = run_with_server(scenario, upload_failures=2)
+    assert "/files/" in upload_url
+    assert len(fake.upload_bodies) == 3
+    # Тело-поток не повторяется внутри _request: повторы делает upload() с растущей паузой
+    assert fake_clock.sleeps == [2, 4]
+
+
+def test_upload_gives_up_after_retries(audio, monkeypatch, fake_clock):
+    monkeypatch.setattr(assemblyai, "ASSEMBLYAI_RETRIES", 3)
+
+    async def scenario(client, fake):
+        with pytest.raises(AssemblyAIError, match="HTTP 503"):
+            await client.upload(audio)
+        return fake
+
+    fake = run_with_server(scenario, upload_failures=10)
+    assert len(fake.upload_bodies) == 3
+
+
+def test_rate_limited_status_request_is_retried(audio, fake_clock):
+    async def scenario(client, fake):
+        transcript_id = await client.submit(await client.upload(audio), "uk")
+        return await client.get(transcript_id), fake
+
+    # Каждый третий запрос к имитатору — 429: upload, submit, затем первый запрос статуса
+    transcript, fake = run_with_server(scenario, fail_rate=1 / 3)
+    assert transcript["status"] == "completed"
+    assert fake.rejected == 1
+    assert len(fake_clock.sleeps) == 1 and 1.0 <= fake_clock.sleeps[0] <= 1.5
+
+
+def test_client_error_is_not_retried(fake_clock):
+    async def scenario(client, fake):
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get("unknown")
+        return fake
+
+    fake = run_with_server(scenario)
+    assert fake.requests == 1
+    assert fake_clock.sleeps == []
+
+
+def test_wait_polls_with_growing_interval(audio, monkeypatch, fake_clock):
+    monkeypatch.setattr(assemblyai, "ASSEMBLYAI_POLL_INTERVAL", 1.0)
+    monkeypatch.setattr(assemblyai, "ASSEMBLYAI_MAX_POLL_INTERVAL", 2.0)
+
+    async def scenario(client, fake):
+        transcript_id = await client.submit(await client.upload(audio), "uk")
+        return await client.wait(transcript_id, timeout=60)
+
+    transcript = run_with_server(scenario, polls=4)
+    assert transcript["status"] == "completed"
+    assert fake_clock.sleeps == [1.0, 1.5, 2.0, 2.0]
+
+
+def test_wait_raises_on_error_status(audio, fake_clock):
+    async def scenario(client, fake):
+        transcript_id = await client.submit(await client.upload(audio), "uk")
+        await client.wait(transcript_id, timeout=60)
+
+    with pytest.raises(AssemblyAIError, match="Audio duration is too short"):
+        run_with_server(scenario, polls=1, error="Audio duration is too short")
+
+
+def test_wait_gives_up_after_timeout(audio, monkeypatch, fake_clock):
+    monkeypatch.setattr(assemblyai, "ASSEMBLYAI_POLL_INTERVAL", 1.0)
+
+    async def scenario(client, fake):
+        transcript_id = await client.submit(await client.upload(audio), "uk")
+        await client.wait(transcript_id, timeout=0.5)
+
+    with pytest.raises(AssemblyAIError, match="не готова"):
+        run_with_server(scenario, polls=10)
@@ -0,0 +1,175 @@
+import asyncio
+import types
+
+import openai
+import pytest
+
+import services.openai_client as openai_client
+from core.result_cache import ResultCache
+from services.openai_client import OpenAIChatClient, TokenBucket
+from services.token_budget import count_tokens
+from fake_openai_server import FAKE, start_server
+
+MODEL = "gpt-4o-mini"
+
+
+@pytest.fixture
+def clock(fake_clock, monkeypatch):
+    """Фальшивые часы и для asyncio.sleep, и для time.monotonic() ведра токенов."""
+    monkeypatch.setattr(openai_client, "time", types.SimpleNamespace(monotonic=fake_clock.monotonic))
+    return fake_clock
+
+
+@pytest.fixture
+def client_env(clock, monkeypatch, tmp_path):
+    """Без лимитов, с пустым кэшем во временной папке."""
+    monkeypatch.setattr(openai_client, "_request_bucket", TokenBucket(0))
+    monkeypatch.setattr(openai_client, "_token_bucket", TokenBucket(0))
+    cache = ResultCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(openai_client, "get_result_cache", lambda: cache)
+    return clock
+
+
+def run_with_server(monkeypatch, scenario, **server_options):
+    """Запускает имитатор OpenAI и выполняет scenario(client, fake) новым клиентом."""
+    async def main():
+        runner, base_url = await start_server(latency=0, **server_options)
+        monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+        client = OpenAIChatClient("test")
+        try:
+            return await scenario(client, runner.app[FAKE])
+        finally:
+            await client.aclose()
+            await runner.cleanup()
+
+    return asyncio.run(main())
+
+
+def test_bucket_allows_burst_then_throttles(clock):
+    bucket = TokenBucket(60)
+
+    async def scenario():
+        for _ in range(60):
+            await bucket.acquire()
+        burst_sleeps = list(clock.sleeps)
+        await bucket.acquire()
+        return burst_sleeps
+
+    assert asyncio.run(scenario()) == []
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_bucket_refills_with_time(clock):
+    bucket = TokenBucket(600)
+
+    async def scenario():
+        await bucket.acquire(600)
+        clock.now += 30
+        await bucket.acquire(300)
+        assert clock.sleeps == []
+        await bucket.acquire(60)
+
+    asyncio.run(scenario())
+    assert clock.sleeps == [pytest.approx(6.0)]
+
+
+def test_bucket_request_larger_than_limit_waits_for_full_bucket(clock):
+    bucket = TokenBucket(1000)
+
+    async def scenario():
+        await bucket.acquire(400)
+        await bucket.acquire(5000)
+
+    asyncio.run(scenario())
+    assert clock.now == pytest.approx(24.0)
+
+
+def test_bucket_spreads_concurrent_requests(clock):
+    bucket = TokenBucket(60)
+
+    async def scenario():
+        await asyncio.gather(*(bucket.acquire() for _ in range(120)))
+
+    asyncio.run(scenario())
+    # Всплеск в 60 запросов сразу, остальные 60 — по одному в секунду
+    assert clock.now == pytest.approx(60.0)
+
+
+def test_zero_limit_disables_bucket(clock):
+    asyncio.run(TokenBucket(0).acquire(10 ** 9))
+    assert clock.sleeps == []
+
+
+def test_server_error_is_retried(client_env, monkeypatch):
+    async def scenario(client, fake):
+        return await client.complete("Привіт", MODEL, 100, 0.7), fake
+
+    # Имитатор отвечает 503 на каждый второй запрос, начиная с первого
+    content, fake = run_with_server(monkeypatch, scenario, server_error_rate=0.5)
+    assert content.startswith("Підсумок")
+    assert (fake.requests, fake.rejected) == (2, 1)
+    assert len(client_env.sleeps) == 1 and 1.0 <= client_env.sleeps[0] <= 1.5
+
+
+def test_rate_limit_honours_retry_after_and_gives_up(client_env, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_RETRIES", 3)
+
+    async def scenario(client, fake):
+        with pytest.raises(openai.RateLimitError):
+            await client.complete("Привіт", MODEL, 100, 0.7)
+        return fake
+
+    fake = run_with_server(monkeypatch, scenario, fail_rate=1.0)
+    assert fake.requests == 3
+    assert client_env.sleeps == [pytest.approx(0.2), pytest.approx(0.2)]
+
+
+def test_client_error_is_not_retried(client_env, monkeypatch):
+    async def scenario(client, fake):
+        with pytest.raises(openai.BadRequestError):
+            await client.complete("слово " * 200, MODEL, 100, 0.7)
+        return fake
+
+    fake = run_with_server(monkeypatch, scenario, context_tokens=50)
+    assert fake.requests == 1
+    assert client_env.sleeps == []
+
+
+def test_answers_are_cached_by_prompt_and_parameters(client_env, monkeypatch):
+    async def scenario(client, fake):
+        first = await client.complete("Привіт", MODEL, 100, 0.7)
+        again = await client.complete("Привіт", MODEL, 100, 0.7)
+        assert again == first and fake.requests == 1
+        await client.complete("Привіт", MODEL, 200, 0.7)
+        await client.complete("Бувай", MODEL, 100, 0.7)
+        return fake
+
+    assert run_with_server(monkeypatch, scenario).requests == 3
+
+
+def test_cache_can_be_disabled(client_env, monkeypatch):
+    monkeypatch.setattr(openai_client, "OPENAI_CACHE", False)
+
+    async def scenario(client, fake):
+        await client.complete("Привіт", MODEL, 100, 0.7)
+        await client.complete("Привіт", MODEL, 100, 0.7)
+        return fake
+
+    assert run_with_server(monkeypatch, scenario).requests == 2
+
+
+def test_token_bucket_throttles_requests(client_env, monkeypatch):
+    prompt = "Привіт " * 50
+    tokens = count_tokens(prompt, MODEL) + 100
+    # Минутный лимит вмещает ровно два таких запроса
+    monkeypatch.setattr(openai_client, "_token_bucket", TokenBucket(2 * tokens))
+
+    async def scenario(client, fake):
+        for i in range(3):
+            await client.complete(f"{prompt}{i}", MODEL, 100, 0.7)
+        return fake
+
+    fake = run_with_server(monkeypatch, scenario)
+    assert (fake.requests, fake.rejected) == (3, 0)
+    # Третий запрос ждёт, пока ведро наберёт токены на него
+    assert client_env.now == pytest.approx(30.0, rel=0.05)